@@ -0,0 +1,280 @@
+# apps/backend/app/compression.py
+from __future__ import annotations
+
+import gzip
+import mimetypes
+import os
+import threading
+import zlib
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+from typing import List, Optional, Set
+
+import anyio
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.responses import Response
+from starlette.staticfiles import StaticFiles
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:  # brotli (opzionale): senza, si negozia solo gzip
+    import brotli
+except ImportError:
+    brotli = None
+
+# ─────────────────────────────────────────────────────────
+# Compressione delle risposte (gzip / br negoziati con Accept-Encoding)
+#   - sotto MIN_SIZE byte non si comprime
+#   - niente compressione per tipi già compressi (PDF, immagini, ZIP),
+#     per SSE / X-Accel-Buffering: no, per risposte parziali (Range)
+#     e per chi ha già impostato Content-Encoding (es. response_cache)
+#   - i corpi grandi vengono compressi in un thread, non nel loop
+#   - i file statici possono avere accanto la versione .br/.gz, creata
+#     in background alla prima richiesta compressa che non la trova
+# ─────────────────────────────────────────────────────────
+
+MIN_SIZE = int(os.environ.get("COMPRESS_MIN_BYTES", "1024"))
+OFFLOAD_SIZE = 64 * 1024          # oltre questa soglia si comprime fuori dal loop
+GZIP_LEVEL = 6
+BR_QUALITY = 4                    # buon compromesso CPU/ratio per risposte dinamiche
+PRECOMPRESS_GZIP_LEVEL = 6        # sidecar .gz/.br: livelli moderati, si creano spesso
+PRECOMPRESS_BR_QUALITY = 6        # (i blob cambiano a ogni autosave)
+
+_SKIP_TYPES = {
+    "application/pdf", "application/zip", "application/gzip", "application/x-gzip",
+    "application/x-bzip2", "application/x-7z-compressed", "application/octet-stream",
+    "application/vnd.openxmlformats-officedocument.wordprocessingml.document",
+    "application/epub+zip", "font/woff", "font/woff2", "text/event-stream",
+}
+_SKIP_PREFIXES = ("image/", "video/", "audio/")
+_SIDECARS = {"br": ".br", "gzip": ".gz"}
+
+
+def accepted_encodings(accept_encoding: str) -> List[str]:
+    """Codifiche supportate accettate dal client, in ordine di preferenza (br prima di gzip)."""
+    accepted = set()
+    for part in (accept_encoding or "").split(","):
+        token, _, params = part.strip().partition(";")
+        if params.replace(" ", "").lower() in ("q=0", "q=0.0", "q=0.00", "q=0.000"):
+            continue
+        accepted.add(token.strip().lower())
+    out = []
+    if brotli is not None and "br" in accepted:
+        out.append("br")
+    if "gzip" in accepted:
+        out.append("gzip")
+    return out
+
+
+def compress(data: bytes, encoding: str) -> bytes:
+    if encoding == "br":
+        return brotli.compress(data, quality=BR_QUALITY)
+    return gzip.compress(data, compresslevel=GZIP_LEVEL, mtime=0)
+
+
+def _skip(status: int, headers: Headers) -> bool:
+    if status < 200 or status in (204, 206, 304):
+        return True
+    if "content-encoding" in headers or "content-range" in headers:
+        return True
+    if headers.get("x-accel-buffering", "").lower() == "no":
+        return True
+    if "no-transform" in headers.get("cache-control", "").lower():
+        return True
+    ctype = headers.get("content-type", "").split(";")[0].strip().lower()
+    return ctype in _SKIP_TYPES or ctype.startswith(_SKIP_PREFIXES)
+
+
+def _mark_encoded(headers: MutableHeaders, encoding: str) -> None:
+    headers["Content-Encoding"] = encoding
+    headers.add_vary_header("Accept-Encoding")
+    etag = headers.get("etag")
+    if etag and not etag.startswith("W/"):
+        # il corpo compresso non è byte-identico: l'ETag forte diventa debole
+        headers["ETag"] = "W/" + etag
+
+
+class _StreamCompressor:
+    def __init__(self, encoding: str):
+        if encoding == "br":
+            self._c = brotli.Compressor(quality=BR_QUALITY)
+            self._finish = self._c.finish
+            self._process = self._c.process
+        else:
+            self._c = zlib.compressobj(GZIP_LEVEL, zlib.DEFLATED, 31)   # 31 = formato gzip
+            self._finish = self._c.flush
+            self._process = self._c.compress
+
+    def process(self, data: bytes) -> bytes:
+        return self._process(data) if data else b""
+
+    def finish(self) -> bytes:
+        return self._finish()
+
+
+class CompressionMiddleware:
+    """Middleware ASGI: gzip/br con soglia minima, anche per risposte in streaming."""
+
+    def __init__(self, app: ASGIApp, minimum_size: int = MIN_SIZE, offload_size: int = OFFLOAD_SIZE):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.offload_size = offload_size
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        encodings = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        if not encodings:
+            await self.app(scope, receive, send)
+            return
+        await _Responder(self, encodings[0])(scope, receive, send)
+
+    async def run(self, fn, data: bytes) -> bytes:
+        if len(data) >= self.offload_size:
+            return await anyio.to_thread.run_sync(fn, data)
+        return fn(data)
+
+
+class _Responder:
+    def __init__(self, mw: CompressionMiddleware, encoding: str):
+        self.mw = mw
+        self.encoding = encoding
+        self.start: Optional[Message] = None
+        self.mode: Optional[str] = None       # None (da decidere) | "pass" | "stream"
+        self.stream: Optional[_StreamCompressor] = None
+        self.send: Optional[Send] = None
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        self.send = send
+        await self.mw.app(scope, receive, self.on_send)
+
+    async def on_send(self, message: Message) -> None:
+        send = self.send
+        if message["type"] == "http.response.start":
+            self.start = message
+            if _skip(message["status"], Headers(raw=message["headers"])):
+                self.mode = "pass"
+                await send(message)
+            return
+        if message["type"] != "http.response.body" or self.mode == "pass":
+            await send(message)
+            return
+
+        body = message.get("body", b"")
+        more = message.get("more_body", False)
+        if self.mode is None:
+            headers = MutableHeaders(raw=self.start["headers"])
+            if not more:
+                # corpo completo in un solo messaggio
+                if len(body) < self.mw.minimum_size:
+                    self.mode = "pass"
+                    await send(self.start)
+                    await send(message)
+                    return
+                data = await self.mw.run(lambda b: compress(b, self.encoding), body)
+                _mark_encoded(headers, self.encoding)
+                headers["Content-Length"] = str(len(data))
+                await send(self.start)
+                await send({"type": "http.response.body", "body": data})
+                return
+            # streaming: compressione incrementale, lunghezza ignota
+            self.mode = "stream"
+            self.stream = _StreamCompressor(self.encoding)
+            _mark_encoded(headers, self.encoding)
+            del headers["Content-Length"]
+            await send(self.start)
+
+        data = await self.mw.run(self.stream.process, body) if body else b""
+        if not more:
+            data += self.stream.finish()
+        await send({"type": "http.response.body", "body": data, "more_body": more})
+
+
+# ─────────────────────────────────────────────────────────
+# File statici precompressi: <file>.br / <file>.gz accanto all'originale
+#   Nessuna compressione nel percorso di scrittura: la prima richiesta
+#   compressa che non trova il sidecar riceve il file compresso al volo
+#   dal middleware e accoda la creazione dei sidecar in un thread.
+# ─────────────────────────────────────────────────────────
+_PRECOMPRESS_POOL: Optional[ThreadPoolExecutor] = None
+_PRECOMPRESS_PENDING: Set[str] = set()
+_PRECOMPRESS_LOCK = threading.Lock()
+
+
+def precompress_file(path: Path, data: Optional[bytes] = None) -> None:
+    """Scrive le varianti .gz (e .br se disponibile) di un file statico compressibile."""
+    if data is None:
+        data = Path(path).read_bytes()
+    if len(data) < MIN_SIZE:
+        return
+    for encoding in ("gzip", "br"):
+        if encoding == "br" and brotli is None:
+            continue
+        out = Path(str(path) + _SIDECARS[encoding])
+        if encoding == "gzip":
+            packed = gzip.compress(data, compresslevel=PRECOMPRESS_GZIP_LEVEL, mtime=0)
+        else:
+            packed = brotli.compress(data, quality=PRECOMPRESS_BR_QUALITY)
+        tmp = out.with_name(f".{out.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        tmp.write_bytes(packed)
+        os.replace(tmp, out)
+
+
+def _precompress_job(path: str) -> None:
+    try:
+        precompress_file(Path(path))
+    except FileNotFoundError:
+        pass                      # file eliminato nel frattempo (es. GC dei blob)
+    except Exception as e:
+        print(f"⚠️  Precompressione fallita per {path}: {e}")
+    finally:
+        with _PRECOMPRESS_LOCK:
+            _PRECOMPRESS_PENDING.discard(path)
+
+
+def _precompressible(path, size: int) -> bool:
+    media_type, encoding = mimetypes.guess_type(str(path))
+    if size < MIN_SIZE or encoding is not None:      # es. un sidecar .gz richiesto direttamente
+        return False
+    return not _skip(200, Headers({"content-type": media_type or "text/plain"}))
+
+
+def precompress_later(path: Path) -> None:
+    """Accoda la creazione dei sidecar (una volta per file, un thread solo)."""
+    global _PRECOMPRESS_POOL
+    key = str(path)
+    with _PRECOMPRESS_LOCK:
+        if key in _PRECOMPRESS_PENDING:
+            return
+        _PRECOMPRESS_PENDING.add(key)
+        if _PRECOMPRESS_POOL is None:
+            _PRECOMPRESS_POOL = ThreadPoolExecutor(max_workers=1, thread_name_prefix="precompress")
+        pool = _PRECOMPRESS_POOL
+    pool.submit(_precompress_job, key)
+
+
+class PrecompressedStaticFiles(StaticFiles):
+    """StaticFiles che serve <file>.br / <file>.gz se il client li accetta e sono aggiornati."""
+
+    def file_response(self, full_path, stat_result, scope: Scope, status_code: int = 200) -> Response:
+        encodings = accepted_encodings(Headers(scope=scope).get("accept-encoding", ""))
+        for encoding in encodings:
+            sidecar = str(full_path) + _SIDECARS[encoding]
+            try:
+                st = os.stat(sidecar)
+            except OSError:
+                continue
+            if st.st_mtime < stat_result.st_mtime:
+                continue
+            response = super().file_response(sidecar, st, scope, status_code)
+            media_type = mimetypes.guess_type(str(full_path))[0] or "text/plain"
+            if media_type.startswith("text/"):
+                media_type += "; charset=utf-8"
+            response.headers["Content-Type"] = media_type
+            response.headers["Content-Encoding"] = encoding
+            response.headers.add_vary_header("Accept-Encoding")
+            return response
+        if encodings and _precompressible(full_path, stat_result.st_size):
+            # questa risposta la comprime il middleware; dalle prossime, il sidecar
+            precompress_later(full_path)
+        return super().file_response(full_path, stat_result, scope, status_code)
@@ -0,0 +1,232 @@
+# apps/backend/app/export_cache.py
+from __future__ import annotations
+
+import hashlib
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Any, Callable, Dict, Iterator, Optional, Tuple
+
+from . import storage
+
+try:  # lock advisory tra processi (POSIX), come in storage
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ─────────────────────────────────────────────────────────
+# Cache su disco degli export renderizzati (PDF, ZIP KDP)
+#   STORAGE_ROOT/exports/<kk>/<chiave>.<ext>
+# La chiave è lo sha256 di: tipo di export + testi effettivamente
+# renderizzati + parametri (formato, copertina, quarta...). Un libro
+# invariato riscaricato con le stesse opzioni viene servito dal file.
+# Eviction LRU (mtime aggiornato a ogni hit) oltre EXPORT_CACHE_MB:
+# dopo ogni render, sotto flock su exports/.lock, il totale si ricalcola
+# dal disco (i worker condividono la cartella). I file usati negli
+# ultimi EXPORT_CACHE_GRACE_S secondi non si eliminano mai: sono appena
+# stati restituiti a una richiesta o a un job, che sta per aprirli.
+# Nella stessa cartella (e nello stesso limite) anche dati intermedi
+# piccoli condivisi tra i worker del render pool, es. i layout dei
+# capitoli (get_or_build).
+# ─────────────────────────────────────────────────────────
+
+CACHE_DIR = storage.file_path("exports")
+MAX_BYTES = int(float(os.environ.get("EXPORT_CACHE_MB", "512")) * 1024 * 1024)
+GRACE_S = float(os.environ.get("EXPORT_CACHE_GRACE_S", "300"))
+RENDER_VERSION = 1          # da incrementare quando cambia il layout dei PDF
+
+STATS: Dict[str, int] = {"hits": 0, "misses": 0, "evictions": 0}
+
+_LOCK = threading.Lock()
+_KEY_LOCKS: Dict[str, list] = {}   # chiave → [lock, richieste in corso]: solo durante un miss
+_EVICT_LOCK = threading.Lock()
+_EVICT_EVERY_S = 10.0       # get_or_build: scansione al più ogni tanto (scritture piccole e frequenti)
+_LAST_EVICT = 0.0
+
+
+def make_key(kind: str, *parts: Any) -> str:
+    h = hashlib.sha256()
+    h.update(f"{kind}:{RENDER_VERSION}".encode("utf-8"))
+    for p in parts:
+        h.update(b"\x00")
+        h.update(json.dumps(p, ensure_ascii=False, sort_keys=True, default=str).encode("utf-8"))
+    return h.hexdigest()
+
+
+def _path(key: str, ext: str) -> Path:
+    return CACHE_DIR / key[:2] / f"{key}.{ext}"
+
+
+def _scan() -> int:
+    total = 0
+    if CACHE_DIR.exists():
+        for sub in CACHE_DIR.iterdir():
+            if sub.is_dir():
+                for f in sub.iterdir():
+                    if not f.name.startswith("."):
+                        try:
+                            total += f.stat().st_size
+                        except FileNotFoundError:
+                            pass
+    return total
+
+
+@contextmanager
+def _evict_locked() -> Iterator[None]:
+    """Una sola eviction alla volta, anche tra worker."""
+    with _EVICT_LOCK:
+        if fcntl is None:
+            yield
+            return
+        fd = os.open(str(CACHE_DIR / ".lock"), os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            yield
+        finally:
+            os.close(fd)
+
+
+def _evict(keep: Path) -> None:
+    """
+    Ricalcola dal disco i byte occupati ed elimina i file meno usati di recente finché
+    si torna sotto il limite; mai `keep` né i file usati negli ultimi GRACE_S secondi.
+    """
+    with _evict_locked():
+        files = []
+        total = 0
+        recent = time.time() - GRACE_S
+        for sub in CACHE_DIR.iterdir():
+            if sub.is_dir():
+                for f in sub.iterdir():
+                    if f.name.startswith("."):
+                        continue
+                    try:
+                        st = f.stat()
+                    except FileNotFoundError:
+                        continue
+                    total += st.st_size
+                    if f != keep and st.st_mtime < recent:
+                        files.append((st.st_mtime, st.st_size, f))
+        files.sort()
+        for _, size, f in files:
+            if total <= MAX_BYTES:
+                break
+            try:
+                f.unlink()
+                total -= size
+                with _LOCK:
+                    STATS["evictions"] += 1
+            except FileNotFoundError:
+                pass
+
+
+def get_or_render(key: str, ext: str, render: Callable[[Path], None]) -> Tuple[Path, bool]:
+    """
+    Ritorna (path del file, hit). In caso di miss esegue render(tmp_path), che scrive
+    l'artefatto direttamente su disco, una sola volta anche con richieste concorrenti
+    per la stessa chiave (nello stesso worker).
+    """
+    path = _path(key, ext)
+    if _hit(path):
+        return path, True
+    with _LOCK:
+        entry = _KEY_LOCKS.setdefault(key, [threading.Lock(), 0])
+        entry[1] += 1
+    try:
+        with entry[0]:
+            if _hit(path):          # renderizzato da una richiesta concorrente
+                return path, True
+            _render_into(path, render)
+    finally:
+        with _LOCK:
+            entry[1] -= 1
+            if not entry[1]:
+                _KEY_LOCKS.pop(key, None)
+    return path, False
+
+
+def _hit(path: Path) -> bool:
+    try:
+        os.utime(path)              # hit: aggiorna la posizione LRU
+    except FileNotFoundError:
+        return False
+    with _LOCK:
+        STATS["hits"] += 1
+    return True
+
+
+def _render_into(path: Path, render: Callable[[Path], None]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    try:
+        render(tmp)
+        os.replace(tmp, path)
+    except BaseException:
+        tmp.unlink(missing_ok=True)
+        raise
+    with _LOCK:
+        STATS["misses"] += 1
+    # il totale di questo processo non vede i render degli altri worker: si riconta dal disco
+    _evict(path)
+
+
+def get_or_build(key: str, ext: str, build: Callable[[], bytes]) -> bytes:
+    """
+    Contenuto in cache per la chiave, o build() salvato su disco. Per dati piccoli da
+    condividere tra processi (nessun lock per chiave: due build concorrenti sono innocui).
+    """
+    global _LAST_EVICT
+    path = _path(key, ext)
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        pass
+    else:
+        try:
+            os.utime(path)
+        except FileNotFoundError:
+            pass
+        return data
+    data = build()
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_bytes(data)
+    os.replace(tmp, path)
+    now = time.monotonic()
+    if now - _LAST_EVICT >= _EVICT_EVERY_S:
+        _LAST_EVICT = now
+        _evict(path)
+    return data
+
+
+def path_for(key: str, ext: str) -> Path:
+    return _path(key, ext)
+
+
+def lookup(key: str, ext: str) -> Optional[Path]:
+    """Path del file se già in cache (senza renderizzare), altrimenti None."""
+    path = _path(key, ext)
+    try:
+        os.utime(path)
+    except FileNotFoundError:
+        return None
+    return path
+
+
+def discard(key: str, ext: str) -> None:
+    _path(key, ext).unlink(missing_ok=True)
+
+
+def stats() -> Dict[str, Any]:
+    with _LOCK:
+        counters = dict(STATS)
+    total = counters["hits"] + counters["misses"]
+    return {
+        **counters,
+        "hit_ratio": round(counters["hits"] / total, 3) if total else None,
+        "bytes": _scan(),           # dal disco: la cartella è condivisa tra i worker
+        "max_bytes": MAX_BYTES,
+    }
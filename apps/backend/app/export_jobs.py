@@ -0,0 +1,353 @@
+# apps/backend/app/export_jobs.py
+from __future__ import annotations
+
+import json
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from pathlib import Path
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from fastapi import HTTPException
+
+from . import export_cache, render_pool, storage
+
+try:  # lock advisory tra processi (POSIX), come in storage
+    import fcntl
+except ImportError:
+    fcntl = None
+
+# ─────────────────────────────────────────────────────────
+# Coda asincrona degli export (POST /export/jobs)
+#   - il job ritorna subito un id; lo stato (queued → running →
+#     done | error) e l'avanzamento (capitoli renderizzati / totale)
+#     sono su disco, quindi leggibili da qualsiasi worker
+#   - EXPORT_JOB_CONCURRENCY job alla volta per processo, scelti a
+#     turno tra gli utenti (round-robin), max EXPORT_JOBS_PER_USER
+#     job in coda/in corso per utente
+#   - job identici in corso (stessa chiave di export_cache) vengono
+#     unificati; se l'artefatto è già in cache il job è subito "done"
+#   - con il pool saturo il job attende il turno, al massimo
+#     EXPORT_JOB_RETRIES volte; un worker morto fa fallire il job
+#   - ogni processo tiene un flock su owners/<token>.lock per tutta la
+#     vita: i job di un token il cui lock è libero sono di un processo
+#     terminato (niente PID, che vengono riusati) e si segnano interrotti
+#   - dopo EXPORT_JOB_TTL_S i job conclusi e i loro artefatti non più
+#     scaricati vengono eliminati
+# ─────────────────────────────────────────────────────────
+
+JOBS_DIR = storage.file_path("export_jobs")
+OWNERS_DIR = JOBS_DIR / "owners"
+CONCURRENCY = int(os.environ.get("EXPORT_JOB_CONCURRENCY", str(max(render_pool.WORKERS, 1))))
+PER_USER = int(os.environ.get("EXPORT_JOBS_PER_USER", "3"))
+TTL_S = int(os.environ.get("EXPORT_JOB_TTL_S", "3600"))
+MAX_RETRIES = int(os.environ.get("EXPORT_JOB_RETRIES", "60"))     # × RETRY_AFTER_S di attesa
+SWEEP_S = 60
+
+TOKEN = uuid.uuid4().hex                            # identifica questo processo nei job su disco
+
+_COND = threading.Condition()
+_JOBS: Dict[str, Dict[str, Any]] = {}               # job_id → record (solo job di questo processo)
+_SPECS: Dict[str, Dict[str, Any]] = {}              # job_id → funzione/argomenti di rendering
+_INFLIGHT: Dict[str, str] = {}                      # chiave export → job_id in coda/in corso
+_QUEUES: "OrderedDict[str, Deque[str]]" = OrderedDict()   # utente → job in attesa
+_RUNNERS: List[threading.Thread] = []
+_LAST_SWEEP = 0.0
+_OWNER_FD: Optional[int] = None
+
+_PUBLIC = ("id", "kind", "book_id", "status", "done", "total", "error", "created_at", "updated_at")
+
+
+def _job_path(job_id: str) -> Path:
+    return JOBS_DIR / f"{job_id}.json"
+
+
+def _progress_path(job_id: str) -> Path:
+    return JOBS_DIR / f"{job_id}.progress"
+
+
+def _write_json(path: Path, data: Dict[str, Any]) -> None:
+    path.parent.mkdir(parents=True, exist_ok=True)
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+    tmp.write_text(json.dumps(data, ensure_ascii=False), encoding="utf-8")
+    os.replace(tmp, path)
+
+
+def _read_json(path: Path) -> Optional[Dict[str, Any]]:
+    try:
+        return json.loads(path.read_text(encoding="utf-8"))
+    except (OSError, ValueError):
+        return None
+
+
+def _save(job: Dict[str, Any], **changes: Any) -> None:
+    job.update(changes, updated_at=time.time())
+    _write_json(_job_path(job["id"]), job)
+
+
+# ─────────────────────────────────────────────────────────
+# Avanzamento: scritto dal processo di rendering, letto dalle GET
+# ─────────────────────────────────────────────────────────
+def _render_with_progress(progress_path: str, fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Eseguita nel worker del pool: passa a fn un callback che aggiorna il file di avanzamento."""
+    last = [0.0]
+
+    def progress(done: int, total: int) -> None:
+        now = time.monotonic()
+        if done < total and now - last[0] < 0.25:
+            return
+        last[0] = now
+        _write_json(Path(progress_path), {"done": done, "total": total})
+
+    return fn(*args, progress=progress, **kwargs)
+
+
+def view(job: Dict[str, Any]) -> Dict[str, Any]:
+    out = {k: job.get(k) for k in _PUBLIC}
+    if job.get("status") == "running":
+        prog = _read_json(_progress_path(job["id"]))
+        if prog:
+            out["done"], out["total"] = prog.get("done", 0), prog.get("total", job.get("total"))
+    out["download_url"] = f"/api/v1/export/jobs/{job['id']}/download" if job.get("status") == "done" else None
+    return out
+
+
+def get(job_id: str) -> Optional[Dict[str, Any]]:
+    with _COND:
+        job = _JOBS.get(job_id)
+        if job is not None:
+            return dict(job)
+    if not all(c.isalnum() for c in job_id):
+        return None
+    return _read_json(_job_path(job_id))      # job creato da un altro worker
+
+
+# ─────────────────────────────────────────────────────────
+# Sottomissione
+# ─────────────────────────────────────────────────────────
+def submit(owner: str, spec: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    spec: kind, book_id, key, ext, filename, media_type, total, fn, load_args, kwargs
+    (load_args() → argomenti posizionali di fn, chiamata solo quando si renderizza).
+    Ritorna il record del job (nuovo, già in corso con la stessa chiave, o già pronto).
+    """
+    _start()
+    now = time.time()
+    with _COND:
+        existing = _INFLIGHT.get(spec["key"])
+        if existing is not None:
+            return dict(_JOBS[existing])
+        job = {
+            "id": uuid.uuid4().hex[:16],
+            "kind": spec["kind"],
+            "book_id": spec["book_id"],
+            "owner": owner,
+            "key": spec["key"],
+            "ext": spec["ext"],
+            "filename": spec["filename"],
+            "media_type": spec["media_type"],
+            "status": "queued",
+            "done": 0,
+            "total": spec["total"],
+            "error": None,
+            "created_at": now,
+            "updated_at": now,
+            "token": TOKEN,
+        }
+        if export_cache.lookup(spec["key"], spec["ext"]) is not None:
+            _save(job, status="done", done=spec["total"])
+            return dict(job)
+        if len(_QUEUES.get(owner, ())) + _running_for(owner) >= PER_USER:
+            raise HTTPException(
+                status_code=429,
+                detail="Troppi export in coda per questo utente, attendi che finiscano",
+                headers={"Retry-After": str(render_pool.RETRY_AFTER_S)},
+            )
+        _JOBS[job["id"]] = job
+        _SPECS[job["id"]] = spec
+        _INFLIGHT[spec["key"]] = job["id"]
+        _QUEUES.setdefault(owner, deque()).append(job["id"])
+        _save(job)
+        _COND.notify()
+        return dict(job)
+
+
+def _running_for(owner: str) -> int:
+    return sum(1 for j in _JOBS.values() if j["owner"] == owner and j["status"] == "running")
+
+
+def _next_job() -> Optional[str]:
+    """Round-robin tra utenti: un job dal primo utente, che poi va in fondo alla fila."""
+    while _QUEUES:
+        owner, queue = _QUEUES.popitem(last=False)
+        if queue:
+            job_id = queue.popleft()
+            if queue:
+                _QUEUES[owner] = queue
+            return job_id
+    return None
+
+
+# ─────────────────────────────────────────────────────────
+# Esecuzione
+# ─────────────────────────────────────────────────────────
+def _render(job: Dict[str, Any], spec: Dict[str, Any], tmp: Path) -> None:
+    args = spec["load_args"]()
+    for attempt in range(MAX_RETRIES + 1):
+        try:
+            render_pool.run(
+                _render_with_progress, str(_progress_path(job["id"])), spec["fn"], *args,
+                out=str(tmp), **spec["kwargs"]
+            )
+            return
+        except render_pool.Saturated:
+            # pool saturo dagli export sincroni: si attende il turno (render_pool.Interrupted
+            # invece fa fallire il job, lo stesso export potrebbe uccidere di nuovo il worker)
+            if attempt == MAX_RETRIES:
+                raise HTTPException(status_code=503, detail="Troppi export in corso, riprova più tardi")
+            time.sleep(render_pool.RETRY_AFTER_S)
+
+
+def _run(job_id: str) -> None:
+    with _COND:
+        job = _JOBS[job_id]
+        spec = _SPECS.pop(job_id)
+        _save(job, status="running")
+    try:
+        export_cache.get_or_render(spec["key"], spec["ext"], lambda tmp: _render(job, spec, tmp))
+        changes = {"status": "done", "done": job["total"]}
+    except Exception as e:  # l'errore finisce nello stato del job
+        changes = {"status": "error", "error": str(getattr(e, "detail", None) or e)}
+    with _COND:
+        _save(job, **changes)
+        _INFLIGHT.pop(job["key"], None)
+        _JOBS.pop(job_id, None)
+    try:
+        _progress_path(job_id).unlink()
+    except FileNotFoundError:
+        pass
+
+
+def _runner() -> None:
+    global _LAST_SWEEP
+    while True:
+        with _COND:
+            job_id = _next_job()
+            if job_id is None:
+                _COND.wait(timeout=SWEEP_S)
+                job_id = _next_job()
+            sweep = time.time() - _LAST_SWEEP >= SWEEP_S
+            if sweep:
+                _LAST_SWEEP = time.time()
+        if sweep:
+            _recover()
+            _sweep()
+        if job_id is not None:
+            _run(job_id)
+
+
+def _start() -> None:
+    with _COND:
+        if _RUNNERS:
+            return
+        JOBS_DIR.mkdir(parents=True, exist_ok=True)
+        _claim_token()
+        _recover()
+        for i in range(CONCURRENCY):
+            t = threading.Thread(target=_runner, name=f"export-job-{i}", daemon=True)
+            t.start()
+            _RUNNERS.append(t)
+
+
+# ─────────────────────────────────────────────────────────
+# Processi proprietari dei job
+# ─────────────────────────────────────────────────────────
+def _owner_path(token: str) -> Path:
+    return OWNERS_DIR / f"{token}.lock"
+
+
+def _claim_token() -> None:
+    """flock tenuto fino all'uscita del processo: lo rilascia il kernel, anche dopo un crash."""
+    global _OWNER_FD
+    if fcntl is None or _OWNER_FD is not None:
+        return
+    OWNERS_DIR.mkdir(parents=True, exist_ok=True)
+    fd = os.open(str(_owner_path(TOKEN)), os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)
+    _OWNER_FD = fd
+
+
+def _owner_alive(token: str) -> bool:
+    if token == TOKEN:
+        return True
+    if fcntl is None or not token.isalnum():
+        # senza flock (Windows) c'è un solo processo: ogni altro token è di un avvio precedente
+        return False
+    try:
+        fd = os.open(str(_owner_path(token)), os.O_RDWR)
+    except FileNotFoundError:
+        return False
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        return True
+    else:
+        _owner_path(token).unlink(missing_ok=True)    # processo terminato: lock file orfano
+        return False
+    finally:
+        os.close(fd)
+
+
+def _recover() -> None:
+    """Job rimasti in coda/in corso da un processo terminato: segnati come interrotti."""
+    alive: Dict[str, bool] = {}
+    for path in JOBS_DIR.glob("*.json"):
+        job = _read_json(path)
+        if not job or job.get("status") not in ("queued", "running"):
+            continue
+        token = str(job.get("token") or "")      # i job senza token (con "pid") sono di una versione precedente
+        if token not in alive:
+            alive[token] = _owner_alive(token)
+        if not alive[token]:
+            _save(job, status="error", error="Export interrotto da un riavvio, riprova")
+    for path in OWNERS_DIR.glob("*.lock"):     # lock file di processi terminati senza job
+        if path.stem not in alive:
+            _owner_alive(path.stem)
+
+
+# ─────────────────────────────────────────────────────────
+# Pulizia (TTL)
+# ─────────────────────────────────────────────────────────
+def _sweep() -> None:
+    cutoff = time.time() - TTL_S
+    for path in JOBS_DIR.glob("*.json"):
+        job = _read_json(path)
+        if not job or job.get("status") not in ("done", "error") or job.get("updated_at", 0) > cutoff:
+            continue
+        if job.get("status") == "done":
+            artifact = export_cache.path_for(job["key"], job["ext"])
+            try:
+                if artifact.stat().st_mtime < cutoff:     # non più scaricato né riusato
+                    export_cache.discard(job["key"], job["ext"])
+            except FileNotFoundError:
+                pass
+        for p in (path, _progress_path(job["id"])):
+            try:
+                p.unlink()
+            except FileNotFoundError:
+                pass
+
+
+def artifact(job_id: str) -> Tuple[Dict[str, Any], Path]:
+    """Job concluso e path del file; HTTPException se non pronto o scaduto."""
+    job = get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    if job["status"] != "done":
+        raise HTTPException(status_code=409, detail=f"Export non ancora pronto (stato: {job['status']})")
+    path = export_cache.lookup(job["key"], job["ext"])
+    if path is None:
+        raise HTTPException(status_code=410, detail="File dell'export scaduto, avvia un nuovo export")
+    return job, path
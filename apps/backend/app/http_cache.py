@@ -0,0 +1,56 @@
+# apps/backend/app/http_cache.py
+from __future__ import annotations
+
+import hashlib
+from typing import Any, Dict, Optional
+
+from fastapi import Request, Response
+
+# ─────────────────────────────────────────────────────────
+# Risposte condizionali (ETag / If-None-Match)
+#   Gli ETag sono forti e derivati dal contenuto (vedi
+#   BookRepository.etag), quindi coincidono tra i worker.
+#   Con If-None-Match corrispondente si risponde 304 senza
+#   serializzare il corpo.
+# ─────────────────────────────────────────────────────────
+
+CACHE_CONTROL = "private, no-cache"   # il browser può tenere la copia, ma rivalida sempre
+
+
+def make_etag(*parts: Any) -> str:
+    """ETag forte (tra virgolette) a partire da una o più componenti."""
+    h = hashlib.sha1()
+    for p in parts:
+        h.update(str(p).encode("utf-8"))
+        h.update(b"\x00")
+    return f'"{h.hexdigest()}"'
+
+
+def etag_matches(request: Request, etag: str) -> bool:
+    """Confronto debole come da RFC 9110 per If-None-Match (ignora il prefisso W/)."""
+    header = request.headers.get("if-none-match")
+    if not header:
+        return False
+    if header.strip() == "*":
+        return True
+    for tag in header.split(","):
+        tag = tag.strip()
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag:
+            return True
+    return False
+
+
+def cache_headers(etag: str, extra: Optional[Dict[str, str]] = None) -> Dict[str, str]:
+    headers = {"ETag": etag, "Cache-Control": CACHE_CONTROL}
+    if extra:
+        headers.update(extra)
+    return headers
+
+
+def not_modified(request: Request, etag: str) -> Optional[Response]:
+    """Ritorna una 304 pronta se il client ha già questa versione, altrimenti None."""
+    if etag_matches(request, etag):
+        return Response(status_code=304, headers=cache_headers(etag))
+    return None
@@ -0,0 +1,241 @@
+# apps/backend/app/journal.py
+from __future__ import annotations
+
+import json
+import os
+import threading
+import zlib
+from pathlib import Path
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+# ─────────────────────────────────────────────────────────
+# Write-ahead journal per lo storage dei libri
+#
+#   snapshot.json   → stato completo (lista ordinata di libri)
+#   journal.log     → mutazioni successive, una per riga:
+#                     "<len> <crc32> <json>\n"
+#   journal.*.old   → segmenti ruotati in attesa di compattazione
+#
+# Ogni scrittura è un append O(record); l'fsync è fatto a lotti da un
+# thread di background. Quando il log supera la soglia, il compattatore
+# lo ruota e lo "piega" nello snapshot fuori dal lock (le operazioni
+# sono idempotenti, quindi un crash a metà compattazione è innocuo).
+# ─────────────────────────────────────────────────────────
+
+Record = Dict[str, Any]
+
+
+def _encode(rec: Record) -> bytes:
+    payload = json.dumps(rec, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+    return b"%d %d " % (len(payload), zlib.crc32(payload)) + payload + b"\n"
+
+
+def iter_records(path: Path) -> Iterator[Tuple[Record, int]]:
+    """
+    Legge i record validi di un segmento e ritorna (record, offset_fine).
+    Si ferma al primo record troncato o corrotto (tipico dopo un crash).
+    """
+    try:
+        data = path.read_bytes()
+    except FileNotFoundError:
+        return
+    pos = 0
+    while pos < len(data):
+        try:
+            sp1 = data.index(b" ", pos)
+            sp2 = data.index(b" ", sp1 + 1)
+            size = int(data[pos:sp1])
+            crc = int(data[sp1 + 1:sp2])
+        except ValueError:
+            return
+        start = sp2 + 1
+        end = start + size
+        if end >= len(data) or data[end:end + 1] != b"\n":
+            return
+        payload = data[start:end]
+        if zlib.crc32(payload) != crc:
+            return
+        try:
+            rec = json.loads(payload.decode("utf-8"))
+        except Exception:
+            return
+        pos = end + 1
+        yield rec, pos
+
+
+def apply_record(books: List[Dict[str, Any]], rec: Record) -> None:
+    """Applica una mutazione alla lista ordinata di libri (idempotente)."""
+    op = rec.get("op")
+    if op == "put":
+        book = rec.get("book") or {}
+        bid = str(book.get("id") or book.get("book_id") or "").strip()
+        for i, b in enumerate(books):
+            if str(b.get("id") or b.get("book_id") or "").strip() == bid:
+                books[i] = book
+                return
+        books.append(book)
+    elif op == "del":
+        bid = str(rec.get("id") or "").strip()
+        books[:] = [b for b in books if str(b.get("id") or b.get("book_id") or "").strip() != bid]
+    elif op == "reorder":
+        bid = str(rec.get("id") or "").strip()
+        for b in books:
+            if str(b.get("id") or b.get("book_id") or "").strip() == bid:
+                chapters = b.get("chapters") or []
+                by_id = {c.get("id"): c for c in chapters if c.get("id")}
+                order = [by_id[cid] for cid in rec.get("order") or [] if cid in by_id]
+                seen = {c.get("id") for c in order}
+                b["chapters"] = order + [c for c in chapters if c.get("id") not in seen]
+                return
+    elif op == "reset":
+        books[:] = list(rec.get("books") or [])
+
+
+class JournalStore:
+    def __init__(self, root: Path, *, fsync_ms: int = 50, compact_bytes: int = 8 * 1024 * 1024):
+        self.root = root
+        self.snapshot_path = root / "snapshot.json"
+        self.log_path = root / "journal.log"
+        self.fsync_s = max(fsync_ms, 1) / 1000.0
+        self.compact_bytes = compact_bytes
+
+        self._lock = threading.Lock()
+        self._compact_lock = threading.Lock()
+        self._fh = None
+        self._dirty = False
+        self._stop = threading.Event()
+        self._wake = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    # ---------- recovery ----------
+    def _read_snapshot(self) -> List[Dict[str, Any]]:
+        try:
+            data = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            return [b for b in data if isinstance(b, dict)] if isinstance(data, list) else []
+        except Exception:
+            return []
+
+    def _segments(self) -> List[Path]:
+        return sorted(self.root.glob("journal.*.old"), key=lambda p: int(p.name.split(".")[1]))
+
+    def load(self) -> List[Dict[str, Any]]:
+        """Snapshot + segmenti ruotati + journal corrente; tronca la coda corrotta."""
+        self.root.mkdir(parents=True, exist_ok=True)
+        with self._lock:
+            books = self._read_snapshot()
+            for seg in self._segments():
+                for rec, _ in iter_records(seg):
+                    apply_record(books, rec)
+            good = 0
+            for rec, end in iter_records(self.log_path):
+                apply_record(books, rec)
+                good = end
+            if self.log_path.exists() and self.log_path.stat().st_size != good:
+                with open(self.log_path, "r+b") as fh:
+                    fh.truncate(good)
+                    fh.flush()
+                    os.fsync(fh.fileno())
+            self._ensure_thread()
+        return books
+
+    # ---------- append ----------
+    def _open(self):
+        if self._fh is None:
+            self.root.mkdir(parents=True, exist_ok=True)
+            self._fh = open(self.log_path, "ab")
+        return self._fh
+
+    def append(self, rec: Record) -> None:
+        data = _encode(rec)
+        with self._lock:
+            fh = self._open()
+            fh.write(data)
+            fh.flush()
+            self._dirty = True
+            big = fh.tell() >= self.compact_bytes
+        self._ensure_thread()
+        if big:
+            self._wake.set()
+
+    def put_book(self, book: Dict[str, Any], is_new: bool = False) -> None:
+        self.append({"op": "put", "book": book})
+
+    def delete_book(self, book_id: str) -> None:
+        self.append({"op": "del", "id": book_id})
+
+    def reorder(self, book_id: str, order: List[str]) -> None:
+        self.append({"op": "reorder", "id": book_id, "order": list(order)})
+
+    def save_all(self, books: List[Dict[str, Any]]) -> None:
+        self.append({"op": "reset", "books": books})
+
+    # ---------- fsync a lotti + compattazione ----------
+    def _ensure_thread(self) -> None:
+        if self._thread is None or not self._thread.is_alive():
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name="journal-sync", daemon=True)
+            self._thread.start()
+
+    def _run(self) -> None:
+        while not self._stop.is_set():
+            self._wake.wait(self.fsync_s)
+            self._wake.clear()
+            self.sync()
+            try:
+                if self.log_path.stat().st_size >= self.compact_bytes:
+                    self.compact()
+            except FileNotFoundError:
+                pass
+            except Exception as e:
+                print(f"⚠️  Compattazione journal fallita: {e}")
+
+    def sync(self) -> None:
+        with self._lock:
+            if self._fh is not None and self._dirty:
+                os.fsync(self._fh.fileno())
+                self._dirty = False
+
+    def compact(self) -> None:
+        """Ruota il log e lo piega nello snapshot; le append continuano sul nuovo file."""
+        with self._compact_lock:
+            with self._lock:
+                if self._fh is not None:
+                    if self._dirty:
+                        os.fsync(self._fh.fileno())
+                        self._dirty = False
+                    self._fh.close()
+                    self._fh = None
+                if self.log_path.exists() and self.log_path.stat().st_size > 0:
+                    segs = self._segments()
+                    n = int(segs[-1].name.split(".")[1]) + 1 if segs else 1
+                    self.log_path.replace(self.root / f"journal.{n}.old")
+
+            segs = self._segments()
+            if not segs:
+                return
+            books = self._read_snapshot()
+            for seg in segs:
+                for rec, _ in iter_records(seg):
+                    apply_record(books, rec)
+            tmp = self.snapshot_path.with_name(f".snapshot.{os.getpid()}.tmp")
+            with open(tmp, "w", encoding="utf-8") as fh:
+                fh.write(json.dumps(books, ensure_ascii=False))
+                fh.flush()
+                os.fsync(fh.fileno())
+            os.replace(tmp, self.snapshot_path)
+            for seg in segs:
+                seg.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        self._stop.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        with self._lock:
+            if self._fh is not None:
+                self._fh.flush()
+                os.fsync(self._fh.fileno())
+                self._fh.close()
+                self._fh = None
+                self._dirty = False
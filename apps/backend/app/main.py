@@ -3,12 +3,13 @@ from __future__ import annotations
 
 from fastapi import FastAPI
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 
-from . import storage
+from . import render_pool, search, storage
+from .compression import CompressionMiddleware, PrecompressedStaticFiles
 from .routers import books as books_router
 from .routers import books_export as books_export_router
 from .routers import generate as generate_router  
+from .routers import search as search_router
 
 app = FastAPI(
     title="EccomiBook Backend",
@@ -19,8 +20,13 @@ app = FastAPI(
 
 # FS
 storage.ensure_dirs()
-app.mount("/static/chapters", StaticFiles(directory=str(storage.CHAPTERS_DIR)), name="chapters")
-app.mount("/static/books", StaticFiles(directory=str(storage.BOOKS_DIR)), name="books")
+storage.load_books()  # migrazione books.json → shard / replay del journal all'avvio
+search.install()      # indice di ricerca aggiornato a ogni modifica
+app.mount("/static/chapters", PrecompressedStaticFiles(directory=str(storage.CHAPTERS_DIR)), name="chapters")
+app.mount("/static/books", PrecompressedStaticFiles(directory=str(storage.BOOKS_DIR)), name="books")
+
+# Compressione gzip/br (soglia minima, tipi già compressi esclusi)
+app.add_middleware(CompressionMiddleware)
 
 # CORS (aperto: ok per status page su dominio diverso)
 app.add_middleware(
@@ -35,6 +41,17 @@ app.add_middleware(
 app.include_router(books_router.router,       prefix="/api/v1", tags=["books"])
 app.include_router(books_export_router.router, prefix="/api/v1", tags=["export"])
 app.include_router(generate_router.router,   prefix="/api/v1", tags=["ai"])
+app.include_router(search_router.router,     prefix="/api/v1", tags=["search"])
+
+@app.on_event("startup")
+def _start_render_pool():
+    render_pool.start()   # worker di export già pronti (font registrati) alla prima richiesta
+
+@app.on_event("shutdown")
+def _close_storage():
+    render_pool.shutdown()
+    storage.close()
+    search.save()
 
 # Health endpoints (sia root che /api/v1 per compatibilità con la status page)
 @app.get("/health")
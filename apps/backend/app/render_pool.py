@@ -0,0 +1,128 @@
+# apps/backend/app/render_pool.py
+from __future__ import annotations
+
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Any, Callable, Dict, Optional
+
+from fastapi import HTTPException
+
+# ─────────────────────────────────────────────────────────
+# Pool di processi per il rendering degli export (ReportLab/PIL)
+#   Il rendering è CPU-bound e tiene il GIL: fatto nel thread della
+#   richiesta blocca autosave e SSE degli altri utenti. Qui gira in
+#   EXPORT_WORKERS processi separati; oltre EXPORT_QUEUE_MAX render
+#   in corso/in attesa si risponde 503 con Retry-After.
+#   EXPORT_WORKERS=0 → rendering nel processo API (come prima).
+# ─────────────────────────────────────────────────────────
+
+WORKERS = int(os.environ.get("EXPORT_WORKERS", str(min(2, os.cpu_count() or 1))))
+MAX_QUEUE = int(os.environ.get("EXPORT_QUEUE_MAX", str(max(WORKERS, 1) * 4)))
+RETRY_AFTER_S = int(os.environ.get("EXPORT_RETRY_AFTER_S", "5"))
+
+STATS: Dict[str, int] = {"submitted": 0, "rejected": 0, "broken": 0}
+
+_LOCK = threading.Lock()
+_POOL: Optional[ProcessPoolExecutor] = None
+_PENDING = 0
+
+
+class Saturated(HTTPException):
+    """Coda piena: condizione temporanea, chi può attendere (i job) riprova."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            status_code=503,
+            detail="Troppi export in corso, riprova tra poco",
+            headers={"Retry-After": str(RETRY_AFTER_S)},
+        )
+
+
+class Interrupted(HTTPException):
+    """Worker morto durante il rendering (es. OOM): riprovare lo stesso export può ripetersi."""
+
+    def __init__(self) -> None:
+        super().__init__(
+            status_code=503,
+            detail="Rendering interrotto, riprova",
+            headers={"Retry-After": str(RETRY_AFTER_S)},
+        )
+
+
+def _init_worker() -> None:
+    # font registrati una volta per processo, non alla prima richiesta
+    from .routers.books_export import _ensure_fonts
+    _ensure_fonts()
+
+
+def _ping() -> int:
+    return os.getpid()
+
+
+def _pool() -> Optional[ProcessPoolExecutor]:
+    global _POOL
+    if WORKERS <= 0:
+        return None
+    with _LOCK:
+        if _POOL is None:
+            # spawn: il processo API ha thread attivi (write-behind, indice), fork non è sicuro
+            _POOL = ProcessPoolExecutor(
+                max_workers=WORKERS,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker,
+            )
+        return _POOL
+
+
+def start() -> None:
+    """Avvia e scalda i worker (import + font) in background, senza attendere."""
+    pool = _pool()
+    if pool is not None:
+        for _ in range(WORKERS):
+            pool.submit(_ping)
+
+
+def shutdown() -> None:
+    global _POOL
+    with _LOCK:
+        pool, _POOL = _POOL, None
+    if pool is not None:
+        pool.shutdown(wait=False, cancel_futures=True)
+
+
+def run(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """
+    Esegue fn(*args, **kwargs) in un worker e ne attende il risultato.
+    fn e argomenti devono essere picklabili (funzioni a livello di modulo).
+    """
+    global _PENDING, _POOL
+    with _LOCK:
+        if _PENDING >= MAX_QUEUE:
+            STATS["rejected"] += 1
+            raise Saturated()
+        _PENDING += 1
+        STATS["submitted"] += 1
+    try:
+        pool = _pool()
+        if pool is None:
+            return fn(*args, **kwargs)
+        try:
+            return pool.submit(fn, *args, **kwargs).result()
+        except BrokenProcessPool:
+            # un worker è morto (es. OOM): il pool verrà ricreato alla prossima richiesta
+            with _LOCK:
+                STATS["broken"] += 1
+                if _POOL is pool:
+                    _POOL = None
+            raise Interrupted() from None
+    finally:
+        with _LOCK:
+            _PENDING -= 1
+
+
+def stats() -> Dict[str, Any]:
+    with _LOCK:
+        return {**STATS, "workers": WORKERS, "max_queue": MAX_QUEUE, "pending": _PENDING}
@@ -0,0 +1,182 @@
+# apps/backend/app/repository.py
+from __future__ import annotations
+
+import hashlib
+import json
+import re
+from typing import Any, Dict, List, Optional, Tuple
+
+# ─────────────────────────────────────────────────────────
+# Repository in-memory della libreria
+#   - book_id → libro                     (lookup O(1))
+#   - book_id → {chapter_id → posizione}  (lookup capitolo O(1))
+#   - book_id → ultimo numero "ch_NNNN"   (nuovo id senza scansioni)
+#   - book_id → ETag (hash del contenuto, ricalcolato solo dopo una modifica)
+# La lista ordinata `books` resta quella servita da GET /books.
+# ─────────────────────────────────────────────────────────
+
+_CH_ID = re.compile(r"^ch_(\d{4,})$")
+
+
+def book_key(book: Dict[str, Any]) -> str:
+    return str(book.get("id") or book.get("book_id") or "").strip()
+
+
+def chapter_key(ch: Dict[str, Any]) -> str:
+    return str(ch.get("id") or ch.get("chapter_id") or ch.get("cid") or "")
+
+
+def content_etag(obj: Any) -> str:
+    """Hash stabile di un oggetto JSON: uguale in tutti i worker per lo stesso contenuto."""
+    raw = json.dumps(obj, ensure_ascii=False, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha1(raw.encode("utf-8")).hexdigest()
+
+
+class BookRepository:
+    def __init__(self, books: List[Dict[str, Any]]):
+        self.books = books
+        self.by_id: Dict[str, Dict[str, Any]] = {}
+        self.chapter_pos: Dict[str, Dict[str, int]] = {}
+        self.chapter_seq: Dict[str, int] = {}
+        self._order: Optional[Dict[str, int]] = None   # book_id → posizione (lazy)
+        self.versions: Dict[str, int] = {}                 # book_id → contatore modifiche locale
+        self._etags: Dict[str, Tuple[int, str]] = {}       # book_id → (versione, etag)
+        for b in books:
+            bid = book_key(b)
+            if bid and bid not in self.by_id:
+                self.by_id[bid] = b
+                self.index_chapters(b)
+
+    # ---------- libri ----------
+    def get(self, book_id: str) -> Optional[Dict[str, Any]]:
+        return self.by_id.get(str(book_id).strip())
+
+    def upsert(self, book: Dict[str, Any]) -> bool:
+        """Inserisce o sostituisce un libro; True se è nuovo."""
+        bid = book_key(book)
+        old = self.by_id.get(bid) if bid else None
+        if old is not None:
+            if old is not book:
+                self.books[self.books.index(old)] = book
+        else:
+            self.books.append(book)
+            if self._order is not None and bid:
+                self._order.setdefault(bid, len(self.books) - 1)
+        if bid:
+            self.by_id[bid] = book
+            self.index_chapters(book)
+        return old is None
+
+    def remove(self, book_id: str) -> Optional[Dict[str, Any]]:
+        bid = str(book_id).strip()
+        book = self.by_id.pop(bid, None)
+        if book is None:
+            return None
+        self.books.remove(book)
+        self._order = None
+        self.chapter_pos.pop(bid, None)
+        self.chapter_seq.pop(bid, None)
+        self.touch(bid)
+        return book
+
+    def position(self, book_id: str) -> Optional[int]:
+        """Posizione del libro nella lista (per la paginazione a cursore)."""
+        if self._order is None:
+            order: Dict[str, int] = {}
+            for i, b in enumerate(self.books):
+                order.setdefault(book_key(b), i)
+            self._order = order
+        return self._order.get(str(book_id).strip())
+
+    def touch(self, book_id: str) -> None:
+        """Invalida l'ETag del libro (chiamata a ogni modifica indicizzata)."""
+        bid = str(book_id).strip()
+        self.versions[bid] = self.versions.get(bid, 0) + 1
+
+    def etag(self, book: Dict[str, Any]) -> str:
+        """ETag del libro, calcolato al massimo una volta per versione."""
+        bid = book_key(book)
+        ver = self.versions.get(bid, 0)
+        cached = self._etags.get(bid)
+        if cached is not None and cached[0] == ver:
+            return cached[1]
+        tag = content_etag(book)
+        # se una modifica è arrivata durante l'hash, non memorizziamo un valore già vecchio
+        if self.versions.get(bid, 0) == ver:
+            self._etags[bid] = (ver, tag)
+        return tag
+
+    # ---------- capitoli ----------
+    def index_chapters(self, book: Dict[str, Any]) -> None:
+        """Ricostruisce gli indici dei capitoli di un solo libro (O(capitoli del libro))."""
+        bid = book_key(book)
+        if not isinstance(book.get("chapters"), list):
+            book["chapters"] = []
+        pos: Dict[str, int] = {}
+        seq = self.chapter_seq.get(bid, 0)
+        for i, ch in enumerate(book["chapters"]):
+            cid = chapter_key(ch)
+            pos.setdefault(cid, i)
+            m = _CH_ID.match(cid)
+            if m:
+                seq = max(seq, int(m.group(1)))
+        self.chapter_pos[bid] = pos
+        self.chapter_seq[bid] = seq
+        self.touch(bid)
+
+    def chapter_index(self, book: Dict[str, Any], chapter_id: str) -> Optional[int]:
+        cid = str(chapter_id)
+        pos = self.chapter_pos.get(book_key(book))
+        if pos is not None:
+            i = pos.get(cid)
+            chapters = book.get("chapters") or []
+            # verifica economica: un lettore senza lock può vedere l'indice durante una modifica
+            if i is None or (i < len(chapters) and chapter_key(chapters[i]) == cid):
+                return i
+        self.index_chapters(book)
+        return self.chapter_pos[book_key(book)].get(cid)
+
+    def get_chapter(self, book: Dict[str, Any], chapter_id: str) -> Optional[Dict[str, Any]]:
+        i = self.chapter_index(book, chapter_id)
+        return book["chapters"][i] if i is not None else None
+
+    def next_chapter_id(self, book: Dict[str, Any]) -> str:
+        bid = book_key(book)
+        if bid not in self.chapter_seq:
+            self.index_chapters(book)
+        return f"ch_{(self.chapter_seq[bid] + 1):04d}"
+
+    def add_chapter(self, book: Dict[str, Any], chapter: Dict[str, Any]) -> None:
+        bid = book_key(book)
+        if bid not in self.chapter_pos:
+            self.index_chapters(book)
+        cid = chapter_key(chapter)
+        book["chapters"].append(chapter)
+        self.chapter_pos[bid].setdefault(cid, len(book["chapters"]) - 1)
+        m = _CH_ID.match(cid)
+        if m:
+            self.chapter_seq[bid] = max(self.chapter_seq[bid], int(m.group(1)))
+
+    def remove_chapter(self, book: Dict[str, Any], chapter_id: str) -> Optional[Dict[str, Any]]:
+        i = self.chapter_index(book, chapter_id)
+        if i is None:
+            return None
+        removed = book["chapters"].pop(i)
+        self.index_chapters(book)
+        return removed
+
+    def reorder_chapters(self, book: Dict[str, Any], ordered_ids: List[str]) -> None:
+        """Riordina mantenendo eventuali 'orfani' in coda."""
+        chapters = book.get("chapters") or []
+        by_id = {c.get("id"): c for c in chapters if c.get("id")}
+        new_list: List[Dict[str, Any]] = []
+        seen = set()
+        for cid in ordered_ids:
+            if cid in by_id and cid not in seen:
+                new_list.append(by_id[cid]); seen.add(cid)
+        for c in chapters:
+            cid = c.get("id")
+            if cid and cid not in seen:
+                new_list.append(c); seen.add(cid)
+        book["chapters"] = new_list
+        self.index_chapters(book)
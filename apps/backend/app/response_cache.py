@@ -0,0 +1,147 @@
+# apps/backend/app/response_cache.py
+from __future__ import annotations
+
+import gzip
+import json
+import os
+import threading
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Optional, Tuple
+
+from fastapi import Request, Response
+
+from .http_cache import cache_headers
+
+try:  # encoder JSON veloce (opzionale)
+    import orjson
+except ImportError:
+    orjson = None
+
+try:  # brotli (opzionale): senza, si servono solo identity e gzip
+    import brotli
+except ImportError:
+    brotli = None
+
+# ─────────────────────────────────────────────────────────
+# Cache delle risposte già serializzate (GET caldi)
+#   chiave  → (kind, id, parametri)
+#   valore  → ETag + bytes JSON + varianti gzip/br (calcolate al
+#             primo client che le accetta)
+# L'ETag deriva dal contenuto del libro: quando il libro cambia
+# l'ETag non coincide più e la voce viene ricostruita. Le voci
+# sono in LRU con un tetto in byte (RESPONSE_CACHE_MB).
+# ─────────────────────────────────────────────────────────
+
+MAX_BYTES = int(float(os.environ.get("RESPONSE_CACHE_MB", "32")) * 1024 * 1024)
+MIN_COMPRESS = 1024          # sotto questa soglia non conviene comprimere
+
+_LOCK = threading.Lock()
+_ENTRIES: "OrderedDict[Tuple, Dict[str, Any]]" = OrderedDict()
+_SIZE = 0
+STATS = {"hits": 0, "misses": 0}
+
+
+def dumps(obj: Any) -> bytes:
+    """Stessa forma di JSONResponse (UTF-8, separatori compatti), con orjson se disponibile."""
+    if orjson is not None:
+        try:
+            return orjson.dumps(obj, default=str, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            pass
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"), default=str).encode("utf-8")
+
+
+def _entry_size(entry: Dict[str, Any]) -> int:
+    return sum(len(v) for k, v in entry.items() if k in ("identity", "gzip", "br"))
+
+
+def _evict() -> None:
+    global _SIZE
+    while _SIZE > MAX_BYTES and len(_ENTRIES) > 1:
+        _, evicted = _ENTRIES.popitem(last=False)
+        _SIZE -= _entry_size(evicted)
+
+
+def _store(key: Tuple, entry: Dict[str, Any]) -> None:
+    global _SIZE
+    with _LOCK:
+        old = _ENTRIES.pop(key, None)
+        if old is not None:
+            _SIZE -= _entry_size(old)
+        _ENTRIES[key] = entry
+        _SIZE += _entry_size(entry)
+        _evict()
+
+
+def _add_variant(key: Tuple, entry: Dict[str, Any], encoding: str, data: bytes) -> None:
+    global _SIZE
+    with _LOCK:
+        if encoding in entry:
+            return
+        entry[encoding] = data
+        if _ENTRIES.get(key) is entry:   # la voce potrebbe essere già stata sostituita
+            _SIZE += len(data)
+            _evict()
+
+
+def _get(key: Tuple, etag: str) -> Optional[Dict[str, Any]]:
+    with _LOCK:
+        entry = _ENTRIES.get(key)
+        if entry is None or entry["etag"] != etag:
+            STATS["misses"] += 1
+            return None
+        _ENTRIES.move_to_end(key)
+        STATS["hits"] += 1
+        return entry
+
+
+def _pick_encoding(request: Request) -> str:
+    accept = request.headers.get("accept-encoding", "")
+    tokens = {t.split(";")[0].strip().lower() for t in accept.split(",")}
+    if brotli is not None and "br" in tokens:
+        return "br"
+    if "gzip" in tokens:
+        return "gzip"
+    return "identity"
+
+
+def _variant(key: Tuple, entry: Dict[str, Any], encoding: str) -> Optional[bytes]:
+    """Corpo nella codifica richiesta (creato una volta sola e tenuto nella voce)."""
+    body = entry["identity"]
+    if encoding == "identity" or len(body) < MIN_COMPRESS:
+        return None
+    data = entry.get(encoding)
+    if data is None:
+        if encoding == "br":
+            data = brotli.compress(body, quality=5)
+        else:
+            data = gzip.compress(body, compresslevel=6, mtime=0)
+        _add_variant(key, entry, encoding, data)
+    return data
+
+
+def json_response(request: Request, key: Tuple, etag: str, build: Callable[[], Any]) -> Response:
+    """
+    Risposta JSON da cache: serializza `build()` solo se manca la voce per questo ETag.
+    Il contenuto è già validato in storage, quindi si salta il response_model di FastAPI.
+    """
+    entry = _get(key, etag)
+    if entry is None:
+        entry = {"etag": etag, "identity": dumps(build())}
+        _store(key, entry)
+    encoding = _pick_encoding(request)
+    body = _variant(key, entry, encoding)
+    headers = cache_headers(etag, {"Vary": "Accept-Encoding"})
+    if body is None:
+        body = entry["identity"]
+    else:
+        headers["Content-Encoding"] = encoding
+        headers["ETag"] = "W/" + etag   # variante compressa: non byte-identica all'originale
+    return Response(content=body, media_type="application/json", headers=headers)
+
+
+def clear() -> None:
+    global _SIZE
+    with _LOCK:
+        _ENTRIES.clear()
+        _SIZE = 0
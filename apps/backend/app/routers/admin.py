@@ -5,7 +5,7 @@ from fastapi import APIRouter, Depends, HTTPException
 from typing import Any, Dict, List
 
 from ..deps import get_owner_full     # protegge con ruolo OWNER_FULL
-from ..users import load_users, save_users, list_users
+from ..users import load_users, list_users, update_users
 
 router = APIRouter(prefix="/admin")
 
@@ -45,30 +45,33 @@ def admin_create_user(payload: Dict[str, Any], _: Dict[str, Any] = Depends(get_o
         if not payload.get(k):
             raise HTTPException(status_code=422, detail=f"Campo mancante: {k}")
 
-    # Carica, verifica duplicati per id / api_key, salva
-    from ..users import USERS, USERS_BY_KEY  # import locale per evitare cicli
-    load_users()
-
     uid = str(payload["id"])
-    if uid in USERS:
-        raise HTTPException(status_code=409, detail="user id già esistente")
-
-    if payload["api_key"] in USERS_BY_KEY:
-        raise HTTPException(status_code=409, detail="api_key già esistente")
-
-    USERS[uid] = {
-        "id": uid,
-        "name": payload["name"],
-        "role": payload["role"],
-        "plan": payload["plan"],
-        "status": payload["status"],
-        "api_key": payload["api_key"],
-    }
-    # ricostruisci indice e salva
-    from ..users import _rebuild_indexes
-    _rebuild_indexes()
-    save_users()
-    return {"ok": True, "user": USERS[uid]}
+
+    # verifica duplicati per id / api_key e salva, sulla copia riletta sotto lock
+    def create(users: Dict[str, Dict[str, Any]]) -> Dict[str, Any]:
+        if uid in users:
+            raise HTTPException(status_code=409, detail="user id già esistente")
+        if any((u.get("api_key") or "").strip() == payload["api_key"] for u in users.values()):
+            raise HTTPException(status_code=409, detail="api_key già esistente")
+        users[uid] = {
+            "id": uid,
+            "name": payload["name"],
+            "role": payload["role"],
+            "plan": payload["plan"],
+            "status": payload["status"],
+            "api_key": payload["api_key"],
+        }
+        return users[uid]
+
+    return {"ok": True, "user": update_users(create)}
+
+
+def _set_field(users: Dict[str, Dict[str, Any]], user_id: str, field: str, value: Any) -> Dict[str, Any]:
+    u = users.get(user_id)
+    if not u:
+        raise HTTPException(status_code=404, detail="user non trovato")
+    u[field] = value
+    return u
 
 
 @router.put("/users/{user_id}/plan", summary="Change Plan")
@@ -76,17 +79,10 @@ def admin_change_plan(user_id: str, payload: Dict[str, Any], _: Dict[str, Any] =
     """
     payload: { "plan": "START|PRO|OWNER" }
     """
-    from ..users import USERS
-    load_users()
-    u = USERS.get(user_id)
-    if not u:
-        raise HTTPException(status_code=404, detail="user non trovato")
     new_plan = payload.get("plan")
     if not new_plan:
         raise HTTPException(status_code=422, detail="plan mancante")
-    u["plan"] = new_plan
-    save_users()
-    return {"ok": True, "user": u}
+    return {"ok": True, "user": update_users(lambda users: _set_field(users, user_id, "plan", new_plan))}
 
 
 @router.put("/users/{user_id}/status", summary="Change Status")
@@ -94,14 +90,7 @@ def admin_change_status(user_id: str, payload: Dict[str, Any], _: Dict[str, Any]
     """
     payload: { "status": "ACTIVE|SUSPENDED" }
     """
-    from ..users import USERS
-    load_users()
-    u = USERS.get(user_id)
-    if not u:
-        raise HTTPException(status_code=404, detail="user non trovato")
     st = payload.get("status")
     if not st:
         raise HTTPException(status_code=422, detail="status mancante")
-    u["status"] = st
-    save_users()
-    return {"ok": True, "user": u}
+    return {"ok": True, "user": update_users(lambda users: _set_field(users, user_id, "status", st))}
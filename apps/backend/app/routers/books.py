@@ -1,13 +1,24 @@
 # apps/backend/app/routers/books.py
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException, Body, Response
-from pydantic import BaseModel, Field
-from typing import Dict, Any, List, Optional
+from fastapi import APIRouter, HTTPException, Body, Response, Query, Request
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel, Field, ValidationError
+from typing import AsyncIterator, Dict, Any, Iterator, List, Optional, Set, Tuple
 from datetime import datetime
-import re
+from contextlib import ExitStack
+import asyncio
+import base64
+import copy
+import json
+import threading
+
+import anyio
 
 from app import storage
+from app import response_cache
+from app.http_cache import make_etag, not_modified, cache_headers
+from app.repository import BookRepository, content_etag
 
 router = APIRouter()
 
@@ -44,6 +55,33 @@ class ChapterUpdateIn(BaseModel):
     content: Optional[str] = None
     language: Optional[str] = None
 
+class BatchOpIn(BaseModel):
+    op: str                             # create_chapter | update_chapter | delete_chapter | reorder | update_book
+                                        # (+ create_book | delete_book nel batch di libreria)
+    book_id: Optional[str] = None       # solo batch di libreria ("@ref" per un libro creato nel batch)
+    chapter_id: Optional[str] = None    # "@ref" per un capitolo creato nel batch
+    ref: Optional[str] = None           # nome con cui riferirsi all'oggetto creato
+    title: Optional[str] = None
+    content: Optional[str] = None
+    language: Optional[str] = None
+    order: Optional[List[str]] = None
+    fields: Optional[Dict[str, Any]] = None   # update_book (campi di BookUpdateIn)
+    book: Optional[BookIn] = None             # create_book
+
+class BatchIn(BaseModel):
+    ops: List[BatchOpIn] = Field(default_factory=list)
+
+class TextEditIn(BaseModel):
+    pos: int = Field(..., ge=0)          # offset nel testo base (code point)
+    delete: int = Field(0, ge=0)        # caratteri da rimuovere
+    insert: str = ""                    # testo da inserire
+
+class ChapterPatchIn(BaseModel):
+    base: str                           # content_hash su cui sono calcolate le modifiche
+    edits: List[TextEditIn] = Field(default_factory=list)
+    title: Optional[str] = None
+    language: Optional[str] = None
+
 # --------- Helpers ---------
 def _ensure_chapters(book: Dict[str, Any]) -> None:
     if not book.get("chapters"):
@@ -60,32 +98,217 @@ def _ensure_first_chapter(book: Dict[str, Any]) -> None:
         })
 
 def _next_chapter_id(book: Dict[str, Any]) -> str:
-    _ensure_chapters(book)
-    max_n = 0
-    for ch in book["chapters"]:
-        m = re.match(r"^ch_(\d{4})$", str(ch.get("id", "")))
-        if m:
-            max_n = max(max_n, int(m.group(1)))
-    return f"ch_{(max_n + 1):04d}"
+    return storage.repository().next_chapter_id(book)
 
 def _find_chapter_index(book: Dict[str, Any], chapter_id: str) -> int:
     _ensure_chapters(book)
-    for i, ch in enumerate(book["chapters"]):
-        if ch.get("id") == chapter_id:
-            return i
-    raise HTTPException(status_code=404, detail="Capitolo non trovato")
+    i = storage.repository().chapter_index(book, chapter_id)
+    if i is None:
+        raise HTTPException(status_code=404, detail="Capitolo non trovato")
+    return i
+
+def _find_chapter(book: Dict[str, Any], chapter_id: str) -> Dict[str, Any]:
+    return book["chapters"][_find_chapter_index(book, chapter_id)]
+
+def _chapter_etag(book_id: str, ch: Dict[str, Any], kind: str = "json") -> str:
+    # il capitolo contiene già content_hash: l'hash dei metadati basta a cambiare col testo
+    return make_etag("chapter", book_id, kind, content_etag(ch))
+
+def _apply_edits(text: str, edits: List[TextEditIn]) -> str:
+    """Applica splice ordinati e non sovrapposti, tutti riferiti al testo base."""
+    out: List[str] = []
+    cur = 0
+    for e in edits:
+        if e.pos < cur or e.pos + e.delete > len(text):
+            raise HTTPException(status_code=422, detail="Modifiche non valide (ordine o intervallo)")
+        out.append(text[cur:e.pos])
+        out.append(e.insert)
+        cur = e.pos + e.delete
+    out.append(text[cur:])
+    return "".join(out)
+
+def _book_summary(book: Dict[str, Any]) -> Dict[str, Any]:
+    chapters = book.get("chapters") or []
+    words = 0
+    for ch in chapters:
+        if "words" in ch and "content" not in ch:
+            words += int(ch.get("words") or 0)
+        else:
+            words += len(str(ch.get("content") or "").split())
+    return {
+        "id": book.get("id") or book.get("book_id"),
+        "title": book.get("title"),
+        "author": book.get("author"),
+        "language": book.get("language"),
+        "updated_at": book.get("updated_at"),
+        "chapters_count": len(chapters),
+        "words_count": words,
+    }
+
+def _project(book: Dict[str, Any], view: str, fields: Optional[List[str]]) -> Dict[str, Any]:
+    if not fields:
+        return book if view == "full" else _book_summary(book)
+    summary = _book_summary(book)
+    return {f: (summary[f] if f in summary else book.get(f)) for f in fields}
+
+def _encode_cursor(pos: int, book_id: str) -> str:
+    raw = f"{pos}:{book_id}".encode("utf-8")
+    return base64.urlsafe_b64encode(raw).decode("ascii").rstrip("=")
+
+def _cursor_start(cursor: str) -> int:
+    """Riparte dopo l'ultimo libro visto; se nel frattempo è stato eliminato, dalla sua vecchia posizione."""
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)).decode("utf-8")
+        pos_s, book_id = raw.split(":", 1)
+        pos = int(pos_s)
+    except Exception:
+        raise HTTPException(status_code=400, detail="Cursor non valido")
+    cur = storage.repository().position(book_id)
+    return cur + 1 if cur is not None else max(pos, 0)
 
 # --------- Endpoints libri ---------
 @router.get("/books")
-def list_books():
-    return storage.load_books()
+def list_books(
+    request: Request,
+    view: str = Query("summary", description='"summary" (default, senza capitoli) | "full"'),
+    fields: Optional[str] = Query(None, description="Proiezione, es. id,title,updated_at"),
+    cursor: Optional[str] = Query(None, description="next_cursor della pagina precedente"),
+    limit: int = Query(100, ge=1, le=500),
+):
+    """
+    Libreria paginata a cursore. Default: vista "summary" (id, titolo, autore,
+    lingua, updated_at, numero capitoli e parole), senza testi né elenco capitoli.
+    """
+    if view not in ("summary", "full"):
+        raise HTTPException(status_code=422, detail='view deve essere "summary" o "full"')
+    repo = storage.repository()
+    books = repo.books
+    start = _cursor_start(cursor) if cursor else 0
+    page = books[start:start + limit]
+    wanted = [f.strip() for f in (fields or "").split(",") if f.strip()] or None
+    next_cursor = None
+    if page and start + len(page) < len(books):
+        last = page[-1]
+        next_cursor = _encode_cursor(start + len(page) - 1, str(last.get("id") or last.get("book_id")))
+    # ETag della pagina: parametri + ETag (in cache) dei libri inclusi
+    etag = make_etag("books", view, fields or "", start, next_cursor or "", *(repo.etag(b) for b in page))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    return response_cache.json_response(
+        request, ("books", view, fields or "", start, limit), etag,
+        lambda: {"items": [_project(b, view, wanted) for b in page], "next_cursor": next_cursor},
+    )
+
+def _changes_payload(since: Optional[int], view: str) -> Dict[str, Any]:
+    delta = storage.changes_since(since) if since is not None else None
+    repo = storage.repository()
+    if delta is None:
+        # since assente o troppo vecchio: snapshot completo
+        return {
+            "revision": storage.revision(),
+            "full": True,
+            "books": [_project(b, view, None) for b in repo.books],
+            "deleted": [],
+        }
+    books = [repo.get(bid) for bid in delta["changed"]]
+    return {
+        "revision": delta["revision"],
+        "full": False,
+        "books": [_project(b, view, None) for b in books if b is not None],
+        "deleted": delta["deleted"],
+    }
+
+# Attese del feed (long-poll e SSE) senza occupare thread del threadpool:
+# ogni attesa è un asyncio.Event, svegliato dal listener di storage a ogni
+# modifica locale; le modifiche degli altri worker si vedono col controllo
+# periodico della revisione (fatto in un thread, ma solo per un istante).
+_FEED_POLL_S = 0.5
+_FEED_WAITERS: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+_FEED_WAITERS_LOCK = threading.Lock()
+
+def _wake_feed_waiters(book_id: Optional[str], kind: str) -> None:
+    with _FEED_WAITERS_LOCK:
+        waiters = list(_FEED_WAITERS)
+    for loop, event in waiters:
+        try:
+            loop.call_soon_threadsafe(event.set)
+        except RuntimeError:   # loop già chiuso
+            pass
+
+storage.add_change_listener(_wake_feed_waiters)
+
+async def _wait_for_change(since: int, timeout: float) -> int:
+    """Long-poll asincrono: ritorna appena la revisione supera `since` (o allo scadere del timeout)."""
+    loop = asyncio.get_running_loop()
+    waiter = (loop, asyncio.Event())
+    with _FEED_WAITERS_LOCK:
+        _FEED_WAITERS.add(waiter)
+    try:
+        deadline = loop.time() + max(timeout, 0.0)
+        while True:
+            waiter[1].clear()          # prima di leggere la revisione: nessun risveglio perso
+            rev = await anyio.to_thread.run_sync(storage.revision)
+            left = deadline - loop.time()
+            if rev != since or left <= 0:
+                return rev
+            with anyio.move_on_after(min(left, _FEED_POLL_S)):
+                await waiter[1].wait()
+    finally:
+        with _FEED_WAITERS_LOCK:
+            _FEED_WAITERS.discard(waiter)
+
+# dichiarata prima di /books/{book_id}, altrimenti "changes" verrebbe preso come id
+@router.get("/books/changes")
+async def books_changes(
+    since: Optional[int] = Query(None, description="Revisione già nota al client"),
+    wait: float = Query(0, ge=0, le=30, description="Long-poll: secondi di attesa se non ci sono novità"),
+    stream: bool = Query(False, description="Server-Sent Events: un evento per ogni nuova revisione"),
+    view: str = Query("summary", description='"summary" | "full"'),
+):
+    """
+    Feed incrementale della libreria: libri creati/modificati ed eliminati
+    dopo la revisione `since`. Se `since` manca o non è più coperto dal
+    buffer delle modifiche risponde con uno snapshot ("full": true).
+    """
+    if view not in ("summary", "full"):
+        raise HTTPException(status_code=422, detail='view deve essere "summary" o "full"')
+    if not stream:
+        if since is not None and wait > 0:
+            await _wait_for_change(since, wait)
+        return await anyio.to_thread.run_sync(_changes_payload, since, view)
+
+    async def sse() -> AsyncIterator[bytes]:
+        last = since
+        yield b":ok\n\n"
+        while True:
+            if last is not None:
+                rev = await _wait_for_change(last, 15)
+            else:
+                rev = await anyio.to_thread.run_sync(storage.revision)
+            if rev == last:
+                yield b": ping\n\n"   # heartbeat ogni 15s
+                continue
+            payload = await anyio.to_thread.run_sync(_changes_payload, last, view)
+            last = payload["revision"]
+            yield ("event: changes\ndata: " + json.dumps(payload, ensure_ascii=False, default=str) + "\n\n").encode("utf-8")
+
+    return StreamingResponse(
+        sse(),
+        media_type="text/event-stream; charset=utf-8",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
 
 @router.get("/books/{book_id}")
-def get_book(book_id: str):
+def get_book(book_id: str, request: Request):
     b = storage.find_book(book_id)
     if not b:
         raise HTTPException(status_code=404, detail="Libro non trovato")
-    return b
+    etag = make_etag("book", storage.repository().etag(b))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    return response_cache.json_response(request, ("book", book_id), etag, lambda: b)
 
 @router.post("/books", status_code=201)
 def create_book(payload: BookIn):
@@ -99,14 +322,13 @@ def create_book(payload: BookIn):
 
 @router.patch("/books/{book_id}")
 def update_book(book_id: str, payload: BookUpdateIn):
-    b = storage.find_book(book_id)
-    if not b:
-        raise HTTPException(status_code=404, detail="Libro non trovato")
-    data = payload.dict(exclude_unset=True)
-    for k, v in data.items():
-        b[k] = v
-    b["updated_at"] = datetime.utcnow().isoformat()
-    storage.persist_book(b)
+    with storage.edit_book(book_id) as b:
+        if not b:
+            raise HTTPException(status_code=404, detail="Libro non trovato")
+        data = payload.dict(exclude_unset=True)
+        for k, v in data.items():
+            b[k] = v
+        b["updated_at"] = datetime.utcnow().isoformat()
     return b
 
 @router.delete("/books/{book_id}", status_code=204, summary="Delete Book")
@@ -114,112 +336,102 @@ def delete_book(book_id: str):
     """
     Elimina il libro con ID book_id. Ritorna 204 se ok, 404 se non trovato.
     """
-    # Se il modulo storage ha una funzione dedicata, usala:
-    if hasattr(storage, "delete_book"):
-        ok = storage.delete_book(book_id)  # deve restituire True/False
-        if not ok:
-            raise HTTPException(status_code=404, detail="Libro non trovato")
-        return Response(status_code=204)
-
-    # Fallback generico: carica tutti i libri, rimuovi quello richiesto, salva
-    books = storage.load_books()
-    # NB: supporto sia "id" sia "book_id"
-    new_books = [
-        b for b in books
-        if (b.get("id") or b.get("book_id")) != book_id
-    ]
-    if len(new_books) == len(books):
+    ok = storage.delete_book(book_id)  # lookup O(1) sul repository
+    if not ok:
         raise HTTPException(status_code=404, detail="Libro non trovato")
-
-    # Salva la lista aggiornata (adatta al tuo storage)
-    if hasattr(storage, "save_books"):
-        storage.save_books(new_books)
-    elif hasattr(storage, "persist_books"):
-        storage.persist_books(new_books)  # se esiste equivalente
-    else:
-        # Se non hai una funzione per salvare l'intera lista, creane una in storage.py
-        raise RuntimeError("Aggiungi save_books(new_books) nel modulo storage.")
-
     return Response(status_code=204)
 
 # --------- Endpoints capitoli ---------
 @router.post("/books/{book_id}/chapters", status_code=201)
 def create_chapter(book_id: str, payload: ChapterCreateIn = Body(default=ChapterCreateIn())):
-    b = storage.find_book(book_id)
-    if not b:
-        raise HTTPException(status_code=404, detail="Libro non trovato")
+    with storage.edit_book(book_id) as b:
+        if not b:
+            raise HTTPException(status_code=404, detail="Libro non trovato")
 
-    _ensure_chapters(b)
-    new_id = _next_chapter_id(b)
-    chapter = {
-        "id": new_id,
-        "title": payload.title or "Nuovo capitolo",
-        "content": payload.content or "",
-        "language": payload.language or b.get("language", "it")
-    }
-    b["chapters"].append(chapter)
-    b["updated_at"] = datetime.utcnow().isoformat()
-    storage.persist_book(b)
-    return {"ok": True, "chapter": chapter, "count": len(b["chapters"])}
+        _ensure_chapters(b)
+        new_id = _next_chapter_id(b)
+        chapter = {
+            "id": new_id,
+            "title": payload.title or "Nuovo capitolo",
+            "content": payload.content or "",
+            "language": payload.language or b.get("language", "it")
+        }
+        storage.repository().add_chapter(b, chapter)
+        b["updated_at"] = datetime.utcnow().isoformat()
+    return {"ok": True, "chapter": storage.chapter_with_body(chapter), "count": len(b["chapters"])}
 
 @router.get("/books/{book_id}/chapters/{chapter_id}")
-def get_chapter(book_id: str, chapter_id: str):
+def get_chapter(book_id: str, chapter_id: str, request: Request):
     b = storage.find_book(book_id)
     if not b:
         raise HTTPException(status_code=404, detail="Libro non trovato")
-    ci = _find_chapter_index(b, chapter_id)
-    return b["chapters"][ci]
+    ch = _find_chapter(b, chapter_id)
+    etag = _chapter_etag(book_id, ch)
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    return response_cache.json_response(
+        request, ("chapter", book_id, chapter_id), etag, lambda: storage.chapter_with_body(ch))
 
 # ==== EXPORT CAPITOLO: Markdown ====
 @router.get("/books/{book_id}/chapters/{chapter_id}.md", summary="Export Chapter MD")
-def export_chapter_md(book_id: str, chapter_id: str):
+def export_chapter_md(book_id: str, chapter_id: str, request: Request):
     b = storage.find_book(book_id)
     if not b:
         raise HTTPException(status_code=404, detail="Libro non trovato")
 
-    ch = next((c for c in b.get("chapters", []) if str(c.get("id")) == chapter_id), None)
-    if not ch:
-        raise HTTPException(status_code=404, detail="Capitolo non trovato")
+    ch = _find_chapter(b, chapter_id)
+    etag = _chapter_etag(book_id, ch, "md")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
 
     title = (ch.get("title") or chapter_id).strip()
-    body  = str(ch.get("content") or "")
+    body  = storage.chapter_body(ch)
     md    = f"# {title}\n\n{body}"
 
-    headers = {
+    headers = cache_headers(etag, {
         "Content-Disposition": f'attachment; filename="{book_id}_{chapter_id}.md"'
-    }
+    })
     return Response(content=md, media_type="text/markdown; charset=utf-8", headers=headers)
 
 
 # ==== EXPORT CAPITOLO: TXT ====
 @router.get("/books/{book_id}/chapters/{chapter_id}.txt", summary="Export Chapter TXT")
-def export_chapter_txt(book_id: str, chapter_id: str):
+def export_chapter_txt(book_id: str, chapter_id: str, request: Request):
     b = storage.find_book(book_id)
     if not b:
         raise HTTPException(status_code=404, detail="Libro non trovato")
 
-    ch = next((c for c in b.get("chapters", []) if str(c.get("id")) == chapter_id), None)
-    if not ch:
-        raise HTTPException(status_code=404, detail="Capitolo non trovato")
+    ch = _find_chapter(b, chapter_id)
+    etag = _chapter_etag(book_id, ch, "txt")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
 
     title = (ch.get("title") or chapter_id).strip()
-    body  = str(ch.get("content") or "")
+    body  = storage.chapter_body(ch)
     txt   = f"{title}\n\n{body}"
 
-    headers = {
+    headers = cache_headers(etag, {
         "Content-Disposition": f'attachment; filename="{book_id}_{chapter_id}.txt"'
-    }
+    })
     return Response(content=txt, media_type="text/plain; charset=utf-8", headers=headers)
 
 @router.get("/books/{book_id}/chapters", summary="List Chapters")
-def list_chapters(book_id: str):
+def list_chapters(book_id: str, request: Request):
     b = storage.find_book(book_id)
     if not b:
         raise HTTPException(status_code=404, detail="Libro non trovato")
-    return {"items": b.get("chapters", [])}
+    etag = make_etag("chapters", storage.repository().etag(b))
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    return response_cache.json_response(
+        request, ("chapters", book_id), etag, lambda: {"items": b.get("chapters", [])})
 
 @router.get("/books/{book_id}/chapters/{chapter_id}.pdf", summary="Export Chapter (PDF)")
-def export_chapter_pdf(book_id: str, chapter_id: str):
+def export_chapter_pdf(book_id: str, chapter_id: str, request: Request):
     try:
         from fpdf import FPDF
     except Exception:
@@ -229,65 +441,92 @@ def export_chapter_pdf(book_id: str, chapter_id: str):
     if not b:
         raise HTTPException(status_code=404, detail="Libro non trovato")
 
-    for ch in b.get("chapters", []):
-        if ch.get("id") == chapter_id:
-            title = (ch.get("title") or chapter_id).strip()
-            content = (ch.get("content") or "").replace("\r\n", "\n")
-
-            pdf = FPDF()
-            pdf.set_auto_page_break(auto=True, margin=15)
-            pdf.add_page()
-            pdf.set_font("Helvetica", "B", 16)
-            pdf.multi_cell(0, 10, txt=title)
-            pdf.ln(4)
-            pdf.set_font("Helvetica", size=12)
-            for line in content.split("\n"):
-                pdf.multi_cell(0, 7, txt=line)
-
-            pdf_bytes = pdf.output(dest="S").encode("latin1", "ignore")
-            filename = f"{book_id}.{chapter_id}.pdf"
-            headers = { "Content-Disposition": f'attachment; filename="{filename}"' }
-            return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
-
-    raise HTTPException(status_code=404, detail="Capitolo non trovato")
+    ch = _find_chapter(b, chapter_id)
+    etag = _chapter_etag(book_id, ch, "pdf")
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    title = (ch.get("title") or chapter_id).strip()
+    content = storage.chapter_body(ch).replace("\r\n", "\n")
+
+    pdf = FPDF()
+    pdf.set_auto_page_break(auto=True, margin=15)
+    pdf.add_page()
+    pdf.set_font("Helvetica", "B", 16)
+    pdf.multi_cell(0, 10, txt=title)
+    pdf.ln(4)
+    pdf.set_font("Helvetica", size=12)
+    for line in content.split("\n"):
+        pdf.multi_cell(0, 7, txt=line)
+
+    pdf_bytes = pdf.output(dest="S").encode("latin1", "ignore")
+    filename = f"{book_id}.{chapter_id}.pdf"
+    headers = cache_headers(etag, { "Content-Disposition": f'attachment; filename="{filename}"' })
+    return Response(content=pdf_bytes, media_type="application/pdf", headers=headers)
     
 @router.put("/books/{book_id}/chapters/{chapter_id}")
 def update_chapter(book_id: str, chapter_id: str, payload: ChapterUpdateIn = Body(...)):
-    b = storage.find_book(book_id)
-    if not b:
-        raise HTTPException(status_code=404, detail="Libro non trovato")
+    with storage.edit_book(book_id) as b:
+        if not b:
+            raise HTTPException(status_code=404, detail="Libro non trovato")
+
+        _ensure_chapters(b)
+        ci = _find_chapter_index(b, chapter_id)
+        ch = b["chapters"][ci]
+
+        data = payload.dict(exclude_unset=True)
+        if data.get("title") is not None:
+            ch["title"] = data["title"]
+        if data.get("content") is not None:
+            ch["content"] = data["content"]
+        if data.get("language") is not None:
+            ch["language"] = data["language"]
 
-    _ensure_chapters(b)
-    ci = _find_chapter_index(b, chapter_id)
-    ch = b["chapters"][ci]
+        b["chapters"][ci] = ch
+        b["updated_at"] = datetime.utcnow().isoformat()
+    return {"ok": True, "chapter": storage.chapter_with_body(ch)}
 
-    data = payload.dict(exclude_unset=True)
-    if data.get("title") is not None:
-        ch["title"] = data["title"]
-    if data.get("content") is not None:
-        ch["content"] = data["content"]
-    if data.get("language") is not None:
-        ch["language"] = data["language"]
+@router.patch("/books/{book_id}/chapters/{chapter_id}")
+def patch_chapter(book_id: str, chapter_id: str, payload: ChapterPatchIn = Body(...)):
+    """
+    Autosave incrementale: applica una lista di modifiche al testo salvato.
+    `base` è il content_hash letto dal client; se nel frattempo il testo è
+    cambiato risponde 409 (il client rilegge o ripiega su PUT).
+    """
+    with storage.edit_book(book_id) as b:
+        if not b:
+            raise HTTPException(status_code=404, detail="Libro non trovato")
 
-    b["chapters"][ci] = ch
-    b["updated_at"] = datetime.utcnow().isoformat()
-    storage.persist_book(b)
-    return {"ok": True, "chapter": ch}
+        _ensure_chapters(b)
+        ch = _find_chapter(b, chapter_id)
+        current = storage.chapter_version(ch)
+        if payload.base != current:
+            raise HTTPException(status_code=409, detail="Versione base non aggiornata",
+                                headers={"X-Content-Hash": current})
+
+        if payload.edits:
+            ch["content"] = _apply_edits(storage.chapter_body(ch), payload.edits)
+        if payload.title is not None:
+            ch["title"] = payload.title
+        if payload.language is not None:
+            ch["language"] = payload.language
+        b["updated_at"] = datetime.utcnow().isoformat()
+    meta = storage.chapter_meta(ch)
+    return {"ok": True, "chapter": meta, "content_hash": meta["content_hash"]}
 
 @router.delete("/books/{book_id}/chapters/{chapter_id}")
 def delete_chapter(book_id: str, chapter_id: str):
-    b = storage.find_book(book_id)
-    if not b:
-        raise HTTPException(status_code=404, detail="Libro non trovato")
+    with storage.edit_book(book_id) as b:
+        if not b:
+            raise HTTPException(status_code=404, detail="Libro non trovato")
 
-    _ensure_chapters(b)
-    ci = _find_chapter_index(b, chapter_id)
-    removed = b["chapters"].pop(ci)
+        _ensure_chapters(b)
+        _find_chapter_index(b, chapter_id)
+        removed = storage.repository().remove_chapter(b, chapter_id)
 
-    # ❌ rimosso: non ricreiamo più un capitolo se array vuoto
+        # ❌ rimosso: non ricreiamo più un capitolo se array vuoto
 
-    b["updated_at"] = datetime.utcnow().isoformat()
-    storage.persist_book(b)
+        b["updated_at"] = datetime.utcnow().isoformat()
     return {"ok": True, "removed": removed["id"], "count": len(b["chapters"])}
 
 @router.post("/books/{book_id}/chapters/reorder")
@@ -298,41 +537,204 @@ def reorder_chapters(book_id: str, payload: ReorderIn = Body(...)):
     except ValueError:
         raise HTTPException(status_code=404, detail="Libro non trovato")
 
-# ==== EXPORT LIBRO: Markdown ====
+# ==== EXPORT LIBRO: Markdown / TXT (in streaming, un capitolo alla volta) ====
+def _stream_book(b: Dict[str, Any], book_id: str, heading: str, separator: str, empty: str) -> Iterator[str]:
+    """
+    Emette il documento capitolo per capitolo: il testo di ciascuno viene letto
+    dal blob solo quando tocca a lui, quindi la memoria resta costante.
+    """
+    chapters = list(b.get("chapters") or [])   # istantanea dell'ordine al momento della richiesta
+    if not chapters:
+        # se non ci sono capitoli metto una pagina vuota con titolo libro
+        title = (b.get("title") or f"book_{book_id}").strip()
+        yield empty.format(title=title)
+        return
+    for i, ch in enumerate(chapters):
+        t = (ch.get("title") or ch.get("id") or "Senza titolo").strip()
+        yield (separator if i else "") + heading.format(title=t) + storage.chapter_body(ch) + "\n"
+
+
 @router.get("/export/books/{book_id}/export/md", summary="Export Book MD")
 def export_book_md(book_id: str):
     b = storage.find_book(book_id)
     if not b:
         raise HTTPException(status_code=404, detail="Libro non trovato")
-
-    title = (b.get("title") or f"book_{book_id}").strip()
-    parts = []
-    for ch in b.get("chapters", []):
-        t = (ch.get("title") or ch.get("id") or "Senza titolo").strip()
-        c = str(ch.get("content") or "")
-        parts.append(f"# {t}\n\n{c}\n")
-
-    # se non ci sono capitoli metto una pagina vuota con titolo libro
-    md = "\n\n---\n\n".join(parts) if parts else f"# {title}\n\n*(Nessun capitolo)*"
-
     headers = { "Content-Disposition": f'attachment; filename="{book_id}.md"' }
-    return Response(content=md, media_type="text/markdown; charset=utf-8", headers=headers)
+    return StreamingResponse(
+        _stream_book(b, book_id, "# {title}\n\n", "\n\n---\n\n", "# {title}\n\n*(Nessun capitolo)*"),
+        media_type="text/markdown; charset=utf-8",
+        headers=headers,
+    )
 
 
-# ==== EXPORT LIBRO: TXT ====
 @router.get("/export/books/{book_id}/export/txt", summary="Export Book TXT")
 def export_book_txt(book_id: str):
     b = storage.find_book(book_id)
     if not b:
         raise HTTPException(status_code=404, detail="Libro non trovato")
-
-    title = (b.get("title") or f"book_{book_id}").strip()
-    parts = []
-    for ch in b.get("chapters", []):
-        t = (ch.get("title") or ch.get("id") or "Senza titolo").strip()
-        c = str(ch.get("content") or "")
-        parts.append(f"{t}\n\n{c}\n")
-
-    txt = "\n\n--------------------\n\n".join(parts) if parts else f"{title}\n\n(Nessun capitolo)"
     headers = { "Content-Disposition": f'attachment; filename="{book_id}.txt"' }
-    return Response(content=txt, media_type="text/plain; charset=utf-8", headers=headers)
+    return StreamingResponse(
+        _stream_book(b, book_id, "{title}\n\n", "\n\n--------------------\n\n", "{title}\n\n(Nessun capitolo)"),
+        media_type="text/plain; charset=utf-8",
+        headers=headers,
+    )
+
+
+# --------- Batch ---------
+# Le operazioni vengono applicate in ordine su una COPIA dei libri: se una
+# fallisce si risponde con l'errore (indice incluso) e non si salva nulla.
+# Altrimenti ogni libro toccato viene salvato una sola volta.
+_CHAPTER_OPS = ("create_chapter", "update_chapter", "delete_chapter", "reorder", "update_book")
+
+def _resolve(value: Optional[str], refs: Dict[str, str]) -> str:
+    v = str(value or "")
+    if v.startswith("@"):
+        if v[1:] not in refs:
+            raise HTTPException(status_code=422, detail=f"Riferimento sconosciuto: {v}")
+        return refs[v[1:]]
+    return v
+
+def _apply_book_op(work: BookRepository, book: Dict[str, Any], op: BatchOpIn, refs: Dict[str, str]) -> Dict[str, Any]:
+    """Applica un'operazione al libro (copia) e ritorna il risultato da restituire al client."""
+    now = datetime.utcnow().isoformat()
+    _ensure_chapters(book)
+    if op.op == "update_book":
+        data = BookUpdateIn(**(op.fields or {})).dict(exclude_unset=True)
+        book.update(data)
+        book["updated_at"] = now
+        return {"op": op.op, "ok": True}
+    if op.op == "create_chapter":
+        chapter = {
+            "id": work.next_chapter_id(book),
+            "title": op.title or "Nuovo capitolo",
+            "content": op.content or "",
+            "language": op.language or book.get("language", "it"),
+        }
+        work.add_chapter(book, chapter)
+        if op.ref:
+            refs[op.ref] = chapter["id"]
+        book["updated_at"] = now
+        return {"op": op.op, "ok": True, "chapter": chapter}
+    if op.op == "update_chapter":
+        ch = work.get_chapter(book, _resolve(op.chapter_id, refs))
+        if ch is None:
+            raise HTTPException(status_code=404, detail="Capitolo non trovato")
+        if op.title is not None:
+            ch["title"] = op.title
+        if op.content is not None:
+            ch["content"] = op.content
+        if op.language is not None:
+            ch["language"] = op.language
+        book["updated_at"] = now
+        return {"op": op.op, "ok": True, "chapter": ch}
+    if op.op == "delete_chapter":
+        removed = work.remove_chapter(book, _resolve(op.chapter_id, refs))
+        if removed is None:
+            raise HTTPException(status_code=404, detail="Capitolo non trovato")
+        book["updated_at"] = now
+        return {"op": op.op, "ok": True, "removed": removed.get("id")}
+    if op.op == "reorder":
+        if op.order is None:
+            raise HTTPException(status_code=422, detail="order mancante")
+        work.reorder_chapters(book, [_resolve(cid, refs) for cid in op.order])
+        book["updated_at"] = now
+        return {"op": op.op, "ok": True}
+    raise HTTPException(status_code=422, detail=f"Operazione non supportata: {op.op}")
+
+def _run_op(i: int, op: BatchOpIn, fn, *args) -> Dict[str, Any]:
+    try:
+        return fn(*args)
+    except HTTPException as e:
+        raise HTTPException(status_code=e.status_code, detail=f"Operazione {i} ({op.op}): {e.detail}")
+    except ValidationError as e:
+        # es. update_book con campi del tipo sbagliato: errore del client, non 500
+        errors = "; ".join(f"{'.'.join(str(p) for p in err['loc'])}: {err['msg']}" for err in e.errors())
+        raise HTTPException(status_code=422, detail=f"Operazione {i} ({op.op}): campi non validi ({errors})")
+
+def _batch_result(res: Dict[str, Any]) -> Dict[str, Any]:
+    # dopo il salvataggio i testi sono nei blob: nel risultato solo i metadati
+    if "chapter" in res:
+        res = {**res, "chapter": storage.chapter_meta(res["chapter"])}
+    return res
+
+@router.post("/books/batch")
+def library_batch(payload: BatchIn = Body(...)):
+    """
+    Batch a livello di libreria: create_book / delete_book più le operazioni
+    sui capitoli (con book_id). Tutte o nessuna; un salvataggio per libro toccato.
+    """
+    explicit = sorted({str(op.book_id).strip() for op in payload.ops
+                       if op.book_id and not str(op.book_id).startswith("@")})
+    with ExitStack() as stack:
+        for bid in explicit:   # ordine fisso: niente deadlock tra batch concorrenti
+            stack.enter_context(storage.book_locked(bid))
+
+        refs: Dict[str, str] = {}
+        works: Dict[str, Any] = {}          # book_id → (copia, repository locale)
+        deleted: List[str] = []
+        results: List[Dict[str, Any]] = []
+        ts = int(datetime.utcnow().timestamp())
+        for i, op in enumerate(payload.ops):
+            if op.op == "create_book":
+                if op.book is None:
+                    raise HTTPException(status_code=422, detail=f"Operazione {i} (create_book): book mancante")
+                now = datetime.utcnow().isoformat()
+                new_id, n = f"book_{ts}", 1
+                while storage.find_book(new_id) or new_id in works:
+                    n += 1
+                    new_id = f"book_{ts}_{n}"
+                book = op.book.dict()
+                book.update({"id": new_id, "created_at": now, "updated_at": now})
+                _ensure_chapters(book)
+                works[new_id] = (book, BookRepository([book]))
+                if op.ref:
+                    refs[op.ref] = new_id
+                results.append({"op": op.op, "ok": True, "book_id": new_id})
+                continue
+
+            bid = _run_op(i, op, _resolve, op.book_id, refs).strip()
+            if not bid:
+                raise HTTPException(status_code=422, detail=f"Operazione {i} ({op.op}): book_id mancante")
+            if bid not in works and bid not in deleted:
+                live = storage.find_book(bid)
+                if live is not None:
+                    work = copy.deepcopy(live)
+                    works[bid] = (work, BookRepository([work]))
+            if bid not in works:
+                raise HTTPException(status_code=404, detail=f"Operazione {i} ({op.op}): Libro non trovato")
+
+            if op.op == "delete_book":
+                works.pop(bid)
+                deleted.append(bid)
+                results.append({"op": op.op, "ok": True, "book_id": bid})
+            elif op.op in _CHAPTER_OPS:
+                book, work = works[bid]
+                res = _run_op(i, op, _apply_book_op, work, book, op, refs)
+                results.append({**res, "book_id": bid})
+            else:
+                raise HTTPException(status_code=422, detail=f"Operazione {i}: non supportata ({op.op})")
+
+        for bid in deleted:
+            storage.delete_book(bid)
+        for bid, (book, _) in works.items():
+            storage.persist_book(book)
+    return {"ok": True, "results": [_batch_result(r) for r in results]}
+
+@router.post("/books/{book_id}/batch")
+def book_batch(book_id: str, payload: BatchIn = Body(...)):
+    """
+    Applica in ordine create_chapter / update_chapter / delete_chapter /
+    reorder / update_book con un solo salvataggio. I capitoli creati possono
+    essere riferiti dalle operazioni successive con "@<ref>".
+    """
+    with storage.book_locked(book_id):
+        live = storage.find_book(book_id)
+        if not live:
+            raise HTTPException(status_code=404, detail="Libro non trovato")
+        book = copy.deepcopy(live)
+        work = BookRepository([book])
+        refs: Dict[str, str] = {}
+        results = [_run_op(i, op, _apply_book_op, work, book, op, refs) for i, op in enumerate(payload.ops)]
+        if payload.ops:
+            storage.persist_book(book)
+    return {"ok": True, "results": [_batch_result(r) for r in results], "count": len(book["chapters"])}
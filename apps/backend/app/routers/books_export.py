@@ -1,9 +1,9 @@
 # apps/backend/app/routers/books_export.py
 from __future__ import annotations
 
-from fastapi import APIRouter, HTTPException, Query
-from fastapi.responses import StreamingResponse, PlainTextResponse, FileResponse
-from typing import List, Tuple
+from fastapi import APIRouter, Depends, HTTPException, Query, Request, Response
+from fastapi.responses import StreamingResponse, FileResponse
+from typing import Any, BinaryIO, Callable, Dict, Iterator, List, Tuple
 from io import BytesIO
 from zipfile import ZipFile, ZIP_DEFLATED
 from pathlib import Path
@@ -18,8 +18,18 @@ from reportlab.pdfbase import pdfmetrics
 from reportlab.pdfbase.ttfonts import TTFont
 
 from pydantic import BaseModel
-
-from app import storage
+import hashlib
+import json
+import os
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from concurrent.futures import Future
+
+from app import export_cache, export_jobs, render_pool, storage
+from app.deps import get_current_user
+from app.http_cache import not_modified, cache_headers
 
 router = APIRouter()
 
@@ -90,8 +100,8 @@ def _get_book_or_404(book_id: str) -> dict:
 
 
 def _chapter_body(book: dict, ch: dict) -> str:
-    # 1) inline (più aggiornato)
-    txt = (ch.get("content") or ch.get("text") or "").strip()
+    # 1) inline o blob content-addressed (più aggiornato)
+    txt = (storage.chapter_body(ch) or ch.get("text") or "").strip()
     if txt:
         return txt
 
@@ -120,6 +130,18 @@ def _chapter_body(book: dict, ch: dict) -> str:
     return ""
 
 
+def _stream_chapters(book: dict, head: List[str], heading: str) -> Iterator[str]:
+    """
+    Documento testuale in streaming: intestazione, poi un capitolo alla volta,
+    letto con _chapter_body solo quando serve (stesso testo di "\n".join(...)).
+    """
+    chapters = list(book.get("chapters") or [])   # istantanea al momento della richiesta
+    yield "\n".join(head + [""])
+    for i, ch in enumerate(chapters, start=1):
+        title = str(ch.get("title") or "Senza titolo")
+        yield "\n" + heading.format(i=i, title=title) + "\n" + (_chapter_body(book, ch) or "") + "\n"
+
+
 def _collect_book_texts(book: dict) -> List[Tuple[str, str]]:
     out: List[Tuple[str, str]] = []
     for ch in (book.get("chapters") or []):
@@ -130,23 +152,179 @@ def _collect_book_texts(book: dict) -> List[Tuple[str, str]]:
 
 
 # =========================================================
-# Rendering PDF
+# Cache degli export (vedi app/export_cache.py)
+# =========================================================
+
+def _items_digest(items: List[Tuple[str, str]]) -> List[Tuple[str, str]]:
+    """Titolo + hash del testo di ogni capitolo: la parte della chiave che segue il contenuto."""
+    return [(title, hashlib.sha1((text or "").encode("utf-8")).hexdigest()) for title, text in items]
+
+
+def _has_stored_text(ch: dict) -> bool:
+    if ch.get("content") is not None:
+        return bool(str(ch["content"]).strip())
+    if ch.get("content_hash"):
+        return bool(ch.get("words", 1))        # words = 0: blob vuoto o di soli spazi
+    return False
+
+
+def _chapters_digest(book: dict, chapters: List[dict]) -> List[Tuple[str, str]]:
+    """
+    Come _items_digest, ma dal content_hash salvato: niente letture né hash dei testi,
+    quindi un export già in cache costa solo la chiave. I capitoli senza testo proprio
+    (che _chapter_body prende da text / content_path / file per convenzione) si leggono.
+    """
+    out: List[Tuple[str, str]] = []
+    for ch in chapters:
+        title = str(ch.get("title") or "Senza titolo")
+        if _has_stored_text(ch):
+            out.append((title, storage.chapter_version(ch)))
+        else:
+            out.append(_items_digest([(title, _chapter_body(book, ch))])[0])
+    return out
+
+
+def _cached_export(request: Request, key: str, ext: str, render, media_type: str, disposition: str):
+    """Serve l'export dal file in cache (renderizzandolo al primo miss); ETag = chiave."""
+    etag = f'"{key}"'
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    path, hit = export_cache.get_or_render(key, ext, render)
+    return FileResponse(
+        path,
+        media_type=media_type,
+        headers=cache_headers(etag, {"Content-Disposition": disposition, "X-Cache": "HIT" if hit else "MISS"}),
+    )
+
+
+def _book_snapshot(book: dict) -> Tuple[dict, List[dict]]:
+    """Copia dei capitoli al momento della richiesta: i testi si leggono solo per renderizzare,
+    ma sono quelli della chiave (i blob sono immutabili, i testi inline copiati)."""
+    chapters = [dict(ch) for ch in (book.get("chapters") or [])]
+    return {**book, "chapters": chapters}, chapters
+
+
+def _book_pdf_spec(book: dict, *, cover: bool, cover_mode: str, backcover_text: str | None, size: str) -> Dict[str, Any]:
+    """Chiave, funzione e argomenti del PDF del libro: condivisi da export sincrono e job."""
+    snap, chapters = _book_snapshot(book)
+    return {
+        "kind": "pdf",
+        "book_id": book.get("id"),
+        "key": export_cache.make_key(
+            "book-pdf", book.get("title"), book.get("author"), _chapters_digest(snap, chapters),
+            cover, cover_mode, backcover_text, size,
+        ),
+        "ext": "pdf",
+        "media_type": "application/pdf",
+        "filename": f"{book.get('id','book')}.pdf",
+        "total": len(chapters),
+        "fn": _render_pdf,
+        # argomenti calcolati solo in caso di miss (lettura dei testi)
+        "load_args": lambda: (snap.get("title") or "Senza titolo", snap.get("author"), _collect_book_texts(snap)),
+        "kwargs": {
+            "show_cover": cover, "cover_mode": cover_mode,
+            "backcover_text": backcover_text, "page_size": _resolve_pagesize(size),
+        },
+    }
+
+
+def _kdp_spec(book: dict, *, size: str, cover_mode: str, backcover_text: str | None,
+              ai_cover: bool, theme: str) -> Dict[str, Any]:
+    snap, chapters = _book_snapshot(book)
+    return {
+        "kind": "kdp",
+        "book_id": book.get("id"),
+        "key": export_cache.make_key(
+            "kdp-zip", book.get("title"), book.get("author"), _chapters_digest(snap, chapters),
+            size, cover_mode, backcover_text, ai_cover, theme,
+        ),
+        "ext": "zip",
+        "media_type": "application/zip",
+        "filename": f"{book.get('id','book')}_kdp.zip",
+        "total": len(chapters),
+        "fn": _render_kdp_zip,
+        "load_args": lambda: (snap.get("title"), snap.get("author"), _collect_book_texts(snap)),
+        "kwargs": {
+            "size": size, "cover_mode": cover_mode, "backcover_text": backcover_text,
+            "ai_cover": ai_cover, "theme": theme,
+        },
+    }
+
+
+def _spec_response(request: Request, spec: Dict[str, Any], disposition: str):
+    def render(tmp: Path) -> None:
+        # il worker scrive direttamente il file: nessun bytes dell'export nel processo API
+        render_pool.run(spec["fn"], *spec["load_args"](), out=str(tmp), **spec["kwargs"])
+
+    return _cached_export(
+        request, spec["key"], spec["ext"], render, spec["media_type"],
+        f'{disposition}; filename="{spec["filename"]}"',
+    )
+
+
+# =========================================================
+# Motore di a-capo (PDF e copertine JPG)
+#   Ogni parola distinta viene misurata una sola volta (cache per
+#   font+corpo) e la larghezza della riga si accumula: costo lineare
+#   nel numero di parole invece di rimisurare la riga a ogni parola.
+#   Le righe prodotte sono identiche a quelle del vecchio algoritmo
+#   ((riga + " " + parola).strip() misurata per intero).
 # =========================================================
 
+_WIDTH_CACHE_MAX = 50_000           # parole per font/corpo prima di svuotare
+_WIDTHS: Dict[tuple, Dict[str, float]] = {}
+
+
+def _width_fn(key: tuple, measure: Callable[[str], float]) -> Callable[[str], float]:
+    cache = _WIDTHS.get(key)
+    if cache is None or len(cache) > _WIDTH_CACHE_MAX:
+        cache = _WIDTHS[key] = {}
+
+    def width(word: str) -> float:
+        w = cache.get(word)
+        if w is None:
+            w = cache[word] = measure(word)
+        return w
+    return width
+
+
+def _break_words(words, max_w: float, width: Callable[[str], float], measure: Callable[[str], float]) -> List[str]:
+    """Spezza una sequenza di parole in righe <= max_w. L'ultima riga può essere vuota."""
+    out: List[str] = []
+    space_w = width(" ")
+    parts: List[str] = []           # riga corrente (parole da unire con " ")
+    line_w = 0.0
+    for w in words:
+        if parts and w and not w[-1].isspace() and not parts[0][0].isspace():
+            # caso comune: la riga cresce di " " + parola
+            trial_w = line_w + space_w + width(w)
+            if trial_w <= max_w:
+                parts.append(w)
+                line_w = trial_w
+                continue
+        else:
+            # riga vuota o spazi/tab ai bordi: strip come prima, rimisurando solo se serve
+            trial = (" ".join(parts) + " " + w).strip() if parts else w.strip()
+            trial_w = measure(trial) if parts else (width(trial) if trial else 0.0)
+            if trial_w <= max_w:
+                parts = [trial] if trial else []
+                line_w = trial_w
+                continue
+        if parts:
+            out.append(" ".join(parts))
+        parts = [w] if w else []
+        line_w = width(w) if w else 0.0
+    out.append(" ".join(parts))
+    return out
+
+
 def _wrap_text(text: str, canv: canvas.Canvas, max_w: float, font_name: str, font_size: int) -> List[str]:
+    measure = lambda s: pdfmetrics.stringWidth(s, font_name, font_size)
+    width = _width_fn((font_name, font_size), measure)
     out: List[str] = []
     for raw_line in (text or "").splitlines():
-        words = raw_line.split(" ")
-        line = ""
-        for w in words:
-            trial = (line + " " + w).strip()
-            if canv.stringWidth(trial, font_name, font_size) <= max_w:
-                line = trial
-            else:
-                if line:
-                    out.append(line)
-                line = w
-        out.append(line)
+        out.extend(_break_words(raw_line.split(" "), max_w, width, measure))
     return out
 
 
@@ -154,6 +332,51 @@ def _wrap_title(title: str, canv: canvas.Canvas, max_w: float, font_name: str, f
     return _wrap_text(title, canv, max_w, font_name, font_size)
 
 
+# =========================================================
+# Rendering PDF
+# =========================================================
+
+
+# Layout per capitolo: le righe già spezzate restano in memoria (LRU), chiave =
+# hash del testo + font/corpo/larghezza, e su disco in export_cache, condivise
+# tra i worker del render pool (un nuovo export finisce su un worker qualsiasi).
+# Riesportando un libro si ri-spezzano solo i capitoli modificati; il disegno
+# delle pagine resta un passaggio unico perché i capitoli scorrono uno dopo
+# l'altro sulla stessa pagina.
+_LAYOUT_MAX_BYTES = int(float(os.environ.get("LAYOUT_CACHE_MB", "64")) * 1024 * 1024)
+_LAYOUT_LOCK = threading.Lock()
+_LAYOUTS: "OrderedDict[tuple, Tuple[str, ...]]" = OrderedDict()
+_LAYOUT_SIZE = 0
+
+
+def _layout_lines(text: str, canv: canvas.Canvas, max_w: float, font_name: str, font_size: int) -> Tuple[str, ...]:
+    global _LAYOUT_SIZE
+    text = text or ""
+    digest = hashlib.sha1(text.encode("utf-8")).hexdigest()
+    key = (digest, font_name, font_size, round(max_w, 3))
+    with _LAYOUT_LOCK:
+        lines = _LAYOUTS.get(key)
+        if lines is not None:
+            _LAYOUTS.move_to_end(key)
+            return lines
+    data = export_cache.get_or_build(
+        export_cache.make_key("layout", *key), "lines",
+        lambda: json.dumps(_wrap_text(text, canv, max_w, font_name, font_size), ensure_ascii=False).encode("utf-8"),
+    )
+    try:
+        lines = tuple(json.loads(data))
+    except ValueError:          # file rovinato: si ri-spezza (e al prossimo build si riscrive)
+        lines = tuple(_wrap_text(text, canv, max_w, font_name, font_size))
+    with _LAYOUT_LOCK:
+        if key not in _LAYOUTS:
+            _LAYOUTS[key] = lines
+            _LAYOUT_SIZE += sum(len(l) for l in lines)
+            while _LAYOUT_SIZE > _LAYOUT_MAX_BYTES and len(_LAYOUTS) > 1:
+                _, old = _LAYOUTS.popitem(last=False)
+                _LAYOUT_SIZE -= sum(len(l) for l in old)
+    return lines
+
+
 def _draw_footer(c: canvas.Canvas, *, width: float, left: float, right: float, bottom: float,
                  footer_left: str, footer_right: str, font: str, font_size: int):
     y = bottom / 2.0
@@ -175,14 +398,16 @@ def _render_pdf(
     margins_cm: Tuple[float, float, float, float] = (2.0, 2.0, 2.0, 2.0),  # L,R,T,B
     body_font_size: int = 11,
     line_h: int = 15,
-) -> bytes:
+    progress: Callable[[int, int], None] | None = None,   # (capitoli fatti, totale)
+    out: str | BinaryIO | None = None,                    # path o file: il PDF va lì, niente bytes
+) -> bytes | None:
     _ensure_fonts()
 
     # Normalizza cover_mode per compat
     if show_cover and cover_mode == "none":
         cover_mode = "front"
 
-    buf = BytesIO()
+    buf = out if out is not None else BytesIO()
     c = canvas.Canvas(buf, pagesize=page_size)
     width, height = page_size
 
@@ -234,7 +459,7 @@ def _render_pdf(
         c.setFont(_BODY_FONT, body_font_size)
 
         # Corpo testo
-        para_lines = _wrap_text(text or "", c, max_width, _BODY_FONT, body_font_size)
+        para_lines = _layout_lines(text, c, max_width, _BODY_FONT, body_font_size)
         for line in para_lines:
             if y < mb + line_h:
                 draw_footer_if_needed()
@@ -246,6 +471,8 @@ def _render_pdf(
             y -= line_h
 
         y -= (line_h * 2)
+        if progress:
+            progress(idx, len(items))
 
     if items:
         draw_footer_if_needed()
@@ -256,6 +483,8 @@ def _render_pdf(
         _draw_typographic_backcover(c, width=width, height=height, text=backcover_text)
 
     c.save()
+    if out is not None:
+        return None
     buf.seek(0)
     return buf.read()
 
@@ -264,8 +493,10 @@ def _render_pdf(
 # Cover tipografica (placeholder locale)
 # =========================================================
 
-_COVER_DIR = Path("/tmp/eccomibook_covers")
-_COVER_DIR.mkdir(parents=True, exist_ok=True)
+# Le copertine JPG finiscono nella cache degli export (LRU, EXPORT_CACHE_MB):
+# chiave = tutti i parametri, quindi una richiesta ripetuta non tocca PIL.
+COVER_RENDER_VERSION = 1
+_COVER_LOCK = threading.Lock()    # i font PIL in cache sono condivisi tra i thread
 
 
 def _slugify(x: str) -> str:
@@ -287,6 +518,7 @@ def _pick_colors(style: str) -> tuple[str, str]:
     return ("#fafafa", "#111827")      # default tipografica
 
 
+@lru_cache(maxsize=32)
 def _load_font(size: int, bold=False) -> ImageFont.FreeTypeFont:
     candidates = [
         "/usr/share/fonts/truetype/dejavu/DejaVuSerif-Bold.ttf" if bold else "/usr/share/fonts/truetype/dejavu/DejaVuSerif.ttf",
@@ -303,21 +535,10 @@ def _load_font(size: int, bold=False) -> ImageFont.FreeTypeFont:
 
 
 def _wrap_text_pil(draw: ImageDraw.ImageDraw, text: str, font: ImageFont.ImageFont, max_w: int) -> list[str]:
-    lines, cur = [], ""
-    for word in (text or "").split():
-        trial = (cur + " " + word).strip()
-        if draw.textlength(trial, font=font) <= max_w:
-            cur = trial
-        else:
-            if cur:
-                lines.append(cur)
-            cur = word
-    if cur:
-        lines.append(cur)
-    out = []
-    for line in "\n".join(lines).splitlines():
-        out.append(line)
-    return out
+    measure = lambda s: draw.textlength(s, font=font)
+    width = _width_fn(("pil", getattr(font, "path", id(font)), getattr(font, "size", 0)), measure)
+    lines = _break_words((text or "").split(), max_w, width, measure)
+    return [line for line in lines if line]
 
 
 def _draw_typographic_cover(c: canvas.Canvas, *, width, height, title, author, theme="auto"):
@@ -352,15 +573,40 @@ def _draw_typographic_backcover(c: canvas.Canvas, *, width, height, text=None):
         y -= 15
 
 
-def create_cover_image(title: str, author: str = "", style: str = "tipografica", size: str = "6x9") -> str:
+def _cover_dims(size: str) -> Tuple[int, int]:
     # Misure “fronte” a 300 DPI (KDP: 6x9 -> 1800x2700). A4: 2480x3508
     if (size or "").lower() in ("6x9", "kdp"):
-        W, H = 1800, 2700
-    elif (size or "").lower() in ("5x8",):
-        W, H = 1500, 2400
-    else:  # A4
-        W, H = 2480, 3508
+        return 1800, 2700
+    if (size or "").lower() in ("5x8",):
+        return 1500, 2400
+    return 2480, 3508  # A4
+
+
+def _cover_key(title: str, author: str, style: str, size: str) -> str:
+    W, H = _cover_dims(size)
+    return export_cache.make_key("cover", COVER_RENDER_VERSION, (title or "").strip() or "Senza titolo", author, style, W, H)
+
+
+def _cover_image(title: str, author: str, style: str, size: str) -> Tuple[Path, bool, str]:
+    """(path del JPG in cache, hit, nome file per il download)."""
+    W, H = _cover_dims(size)
+    key = _cover_key(title, author, style, size)
+    title = (title or "").strip() or "Senza titolo"
+
+    def render(tmp: Path) -> None:
+        with _COVER_LOCK:
+            _draw_cover_image(tmp, title, author, style, W, H)
+
+    path, hit = export_cache.get_or_render(key, "jpg", render)
+    filename = f"{_slugify(title)}_{_slugify(author)}_{_slugify(style)}_{W}x{H}.jpg"
+    return path, hit, filename
 
+
+def create_cover_image(title: str, author: str = "", style: str = "tipografica", size: str = "6x9") -> str:
+    return str(_cover_image(title, author, style, size)[0])
+
+
+def _draw_cover_image(out_path: Path, title: str, author: str, style: str, W: int, H: int) -> None:
     bg, fg = _pick_colors(style)
     im = Image.new("RGB", (W, H), bg)
     d = ImageDraw.Draw(im)
@@ -377,7 +623,6 @@ def create_cover_image(title: str, author: str = "", style: str = "tipografica",
     max_w = W - pad * 2
 
     # Titolo (centrato)
-    title = (title or "").strip() or "Senza titolo"
     t_lines = _wrap_text_pil(d, title, f_title, max_w)
     y = int(H * 0.25)
     for line in t_lines:
@@ -393,14 +638,77 @@ def create_cover_image(title: str, author: str = "", style: str = "tipografica",
 
     # Bollino discreto
     tag = "Creato con EccomiBook"
-    d.text((W // 2 - d.textlength(tag, font=_load_font(28)) / 2, H - 120),
-           tag, font=_load_font(28), fill=fg)
+    f_tag = _load_font(28)
+    d.text((W // 2 - d.textlength(tag, font=f_tag) / 2, H - 120),
+           tag, font=f_tag, fill=fg)
 
-    # Salva su /tmp ed esponi path
-    fname = f"{_slugify(title)}_{_slugify(author)}_{_slugify(style)}_{W}x{H}.jpg"
-    out_path = _COVER_DIR / fname
     im.save(out_path, format="JPEG", quality=92, optimize=True)
-    return str(out_path)
+
+
+def _render_kdp_zip(
+    book_title: str | None,
+    author: str | None,
+    items: List[Tuple[str, str]],
+    *,
+    size: str,
+    cover_mode: str,
+    backcover_text: str | None,
+    ai_cover: bool,
+    theme: str,
+    progress: Callable[[int, int], None] | None = None,
+    out: str | BinaryIO | None = None,
+) -> bytes | None:
+    """
+    ZIP KDP (interno + copertine opzionali + metadata). A livello di modulo per il pool di processi.
+    Con `out` (path o file) lo ZIP viene scritto lì e non si ritorna nulla.
+    """
+    zip_out = out if out is not None else BytesIO()
+    with ZipFile(zip_out, "w", ZIP_DEFLATED) as z:
+        # --- Interior (sempre senza cover pagina interna) ---
+        # ogni PDF viene scritto direttamente nella sua voce dello ZIP
+        with z.open("interior.pdf", "w", force_zip64=True) as f:
+            _render_pdf(
+                book_title or "Senza titolo",
+                author,
+                items,
+                show_cover=False,
+                page_size=_resolve_pagesize(size),
+                progress=progress,
+                out=f,
+            )
+
+        # --- Copertine opzionali (tipografiche integrate) ---
+        if cover_mode in ("front", "front_back") and ai_cover:
+            with z.open("cover_front.pdf", "w") as f:
+                c = canvas.Canvas(f, pagesize=_resolve_pagesize(size))
+                width, height = c._pagesize
+                _draw_typographic_cover(
+                    c, width=width, height=height, title=(book_title or ""), author=author, theme=theme
+                )
+                c.showPage()
+                c.save()
+
+            if cover_mode == "front_back":
+                with z.open("cover_back.pdf", "w") as f:
+                    c2 = canvas.Canvas(f, pagesize=_resolve_pagesize(size))
+                    width, height = c2._pagesize
+                    _draw_typographic_backcover(c2, width=width, height=height, text=backcover_text)
+                    c2.showPage()
+                    c2.save()
+
+        meta = [
+            f"Title: {book_title or 'Senza titolo'}",
+            f"Author: {author or ''}",
+            f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}",
+            f"Chapters: {len(items)}",
+            f"Trim size: {size}",
+            f"Cover mode: {cover_mode}",
+            f"AI cover: {ai_cover}",
+            f"Theme: {theme}",
+            f"Backcover chars: {len(backcover_text or '')}",
+        ]
+        z.writestr("metadata.txt", "\n".join(meta))
+    return None if out is not None else zip_out.getvalue()
 
 
 # =========================================================
@@ -409,6 +717,7 @@ def create_cover_image(title: str, author: str = "", style: str = "tipografica",
 
 @router.get("/export/books/{book_id}/export/pdf")
 def export_book_pdf(
+    request: Request,
     book_id: str,
     cover: bool = Query(True, description="(Compat) Includi copertina tipografica"),
     cover_mode: str = Query("front", description='"none" | "front" | "front_back"'),
@@ -416,41 +725,20 @@ def export_book_pdf(
     size: str = Query("A4", description="A4 | 6x9 | 5x8"),
 ):
     book = _get_book_or_404(book_id)
-    items = _collect_book_texts(book)
-    pdf_bytes = _render_pdf(
-        book.get("title") or "Senza titolo",
-        book.get("author"),
-        items,
-        show_cover=cover,
-        cover_mode=cover_mode,
-        backcover_text=backcover_text,
-        page_size=_resolve_pagesize(size),
-    )
-    filename = f"{book.get('id','book')}.pdf"
-    return StreamingResponse(
-        BytesIO(pdf_bytes),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'inline; filename="{filename}"'}
-    )
+    spec = _book_pdf_spec(book, cover=cover, cover_mode=cover_mode, backcover_text=backcover_text, size=size)
+    return _spec_response(request, spec, "inline")
 
 
 @router.get("/export/books/{book_id}/export/txt")
 def export_book_txt(book_id: str):
     book = _get_book_or_404(book_id)
-    items = _collect_book_texts(book)
-    lines: List[str] = []
-    lines.append((book.get("title") or "Senza titolo"))
+    head = [book.get("title") or "Senza titolo"]
     if book.get("author"):
-        lines.append(f"di {book['author']}")
-    lines.append("")
-    for i, (title, text) in enumerate(items, start=1):
-        lines.append(f"Capitolo {i}: {title}")
-        lines.append(text or "")
-        lines.append("")
-    body = "\n".join(lines)
+        head.append(f"di {book['author']}")
     filename = f"{book.get('id','book')}.txt"
-    return PlainTextResponse(
-        content=body,
+    return StreamingResponse(
+        _stream_chapters(book, head, "Capitolo {i}: {title}"),
+        media_type="text/plain; charset=utf-8",
         headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
 
@@ -458,19 +746,12 @@ def export_book_txt(book_id: str):
 @router.get("/export/books/{book_id}/export/md")
 def export_book_md(book_id: str):
     book = _get_book_or_404(book_id)
-    items = _collect_book_texts(book)
-    parts: List[str] = [f"# {book.get('title') or 'Senza titolo'}"]
+    head = [f"# {book.get('title') or 'Senza titolo'}"]
     if book.get("author"):
-        parts.append(f"_di {book['author']}_")
-    parts.append("")
-    for i, (title, text) in enumerate(items, start=1):
-        parts.append(f"## Capitolo {i}: {title}")
-        parts.append(text or "")
-        parts.append("")
-    md = "\n".join(parts)
+        head.append(f"_di {book['author']}_")
     filename = f"{book.get('id','book')}.md"
-    return PlainTextResponse(
-        content=md,
+    return StreamingResponse(
+        _stream_chapters(book, head, "## Capitolo {i}: {title}"),
         media_type="text/markdown; charset=utf-8",
         headers={"Content-Disposition": f'attachment; filename="{filename}"'}
     )
@@ -479,6 +760,7 @@ def export_book_md(book_id: str):
 # ✅ GET/POST compat (legacy)
 @router.api_route("/export/books/{book_id}/export/kdp", methods=["GET", "POST"])
 def export_book_kdp(
+    request: Request,
     book_id: str,
     size: str = Query("A4", description="A4 | 6x9 | 5x8"),
     cover_mode: str = Query("none", description="none | front | front_back"),
@@ -494,101 +776,108 @@ def export_book_kdp(
       - metadata.txt
     """
     book = _get_book_or_404(book_id)
-    items = _collect_book_texts(book)
-
-    # --- Interior (sempre senza cover pagina interna) ---
-    interior_bytes = _render_pdf(
-        book.get("title") or "Senza titolo",
-        book.get("author"),
-        items,
-        show_cover=False,
-        page_size=_resolve_pagesize(size),
-    )
-
-    # --- Copertine opzionali ---
-    cover_front = None
-    cover_back = None
-    if cover_mode in ("front", "front_back") and ai_cover:
-        # usa le cover tipografiche integrate
-        buf_f = BytesIO()
-        c = canvas.Canvas(buf_f, pagesize=_resolve_pagesize(size))
-        _draw_typographic_cover(
-            c, *c._pagesize, title=(book.get("title") or ""), author=book.get("author"), theme=theme
-        )
-        c.showPage()
-        c.save()
-        buf_f.seek(0)
-        cover_front = buf_f.read()
-
-        if cover_mode == "front_back":
-            buf_b = BytesIO()
-            c2 = canvas.Canvas(buf_b, pagesize=_resolve_pagesize(size))
-            _draw_typographic_backcover(c2, *c2._pagesize, text=backcover_text)
-            c2.showPage()
-            c2.save()
-            buf_b.seek(0)
-            cover_back = buf_b.read()
-
-    # --- ZIP out ---
-    zip_buf = BytesIO()
-    with ZipFile(zip_buf, "w", ZIP_DEFLATED) as z:
-        z.writestr("interior.pdf", interior_bytes)
-        if cover_front:
-            z.writestr("cover_front.pdf", cover_front)
-        if cover_back:
-            z.writestr("cover_back.pdf", cover_back)
-        meta = [
-            f"Title: {book.get('title') or 'Senza titolo'}",
-            f"Author: {book.get('author') or ''}",
-            f"Generated: {datetime.utcnow().strftime('%Y-%m-%d %H:%M UTC')}",
-            f"Chapters: {len(items)}",
-            f"Trim size: {size}",
-            f"Cover mode: {cover_mode}",
-            f"AI cover: {ai_cover}",
-            f"Theme: {theme}",
-            f"Backcover chars: {len(backcover_text or '')}",
-        ]
-        z.writestr("metadata.txt", "\n".join(meta))
-    zip_buf.seek(0)
-
-    filename = f"{book.get('id','book')}_kdp.zip"
-    return StreamingResponse(
-        zip_buf,
-        media_type="application/zip",
-        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
-    )
+    spec = _kdp_spec(book, size=size, cover_mode=cover_mode, backcover_text=backcover_text,
+                     ai_cover=ai_cover, theme=theme)
+    return _spec_response(request, spec, "attachment")
 
 
 @router.get("/export/books/{book_id}/chapters/{chapter_id}/export/pdf")
 def export_single_chapter_pdf(
+    request: Request,
     book_id: str,
     chapter_id: str,
     cover: bool = Query(False, description="Cover pagina iniziale (default: False)"),
     size: str = Query("A4", description="A4 | 6x9 | 5x8"),
 ):
     book = _get_book_or_404(book_id)
-    ch = next((c for c in (book.get("chapters") or [])
-               if str(c.get("id") or c.get("chapter_id") or c.get("cid")) == str(chapter_id)), None)
+    ch = storage.repository().get_chapter(book, chapter_id)
     if not ch:
         raise HTTPException(status_code=404, detail="Capitolo non trovato")
-
     title = str(ch.get("title") or "Senza titolo")
-    body = _chapter_body(book, ch)
-    pdf_bytes = _render_pdf(
-        f"{book.get('title') or 'Libro'} — {title}",
-        book.get("author"),
-        [(title, body)],
-        show_cover=cover,  # anteprima capitolo default SENZA cover
-        page_size=_resolve_pagesize(size),
+    snap, (ch,) = _book_snapshot({**book, "chapters": [ch]})
+    # titolo/autore del libro finiscono nel PDF: fanno parte della chiave
+    key = export_cache.make_key(
+        "chapter-pdf", book.get("title"), book.get("author"), _chapters_digest(snap, [ch]), cover, size,
     )
+
+    def render(tmp: Path) -> None:
+        render_pool.run(
+            _render_pdf,
+            f"{book.get('title') or 'Libro'} — {title}",
+            book.get("author"),
+            [(title, _chapter_body(snap, ch))],
+            show_cover=cover,  # anteprima capitolo default SENZA cover
+            page_size=_resolve_pagesize(size),
+            out=str(tmp),
+        )
+
     filename = f"{book.get('id','book')}_{chapter_id}.pdf"
-    return StreamingResponse(
-        BytesIO(pdf_bytes),
-        media_type="application/pdf",
-        headers={"Content-Disposition": f'inline; filename="{filename}"'}
+    return _cached_export(request, key, "pdf", render, "application/pdf", f'inline; filename="{filename}"')
+
+
+# -------- Export asincroni (job in coda, vedi app/export_jobs.py) --------
+
+class ExportJobIn(BaseModel):
+    book_id: str
+    kind: str = "kdp"                   # "pdf" | "kdp"
+    size: str = "A4"
+    cover: bool = True                  # solo pdf
+    cover_mode: str | None = None       # default: "front" per pdf, "none" per kdp
+    backcover_text: str | None = None
+    ai_cover: bool = False              # solo kdp
+    theme: str = "auto"                 # solo kdp
+
+
+def _job_owner(request: Request, user: Dict[str, Any]) -> str:
+    # senza login tutti sono demo_user: l'equità tra utenti passa per l'IP
+    if user.get("id") == "demo_user" and request.client:
+        return f"demo:{request.client.host}"
+    return str(user.get("id"))
+
+
+@router.post("/export/jobs", status_code=202)
+def create_export_job(payload: ExportJobIn, request: Request, user: Dict[str, Any] = Depends(get_current_user)):
+    """Avvia un export in background; lo stato si legge con GET /export/jobs/{id}."""
+    book = _get_book_or_404(payload.book_id)
+    if payload.kind == "pdf":
+        spec = _book_pdf_spec(book, cover=payload.cover, cover_mode=payload.cover_mode or "front",
+                              backcover_text=payload.backcover_text, size=payload.size)
+    elif payload.kind == "kdp":
+        spec = _kdp_spec(book, size=payload.size, cover_mode=payload.cover_mode or "none",
+                         backcover_text=payload.backcover_text, ai_cover=payload.ai_cover, theme=payload.theme)
+    else:
+        raise HTTPException(status_code=400, detail='kind deve essere "pdf" o "kdp"')
+    return export_jobs.view(export_jobs.submit(_job_owner(request, user), spec))
+
+
+@router.get("/export/jobs/{job_id}")
+def get_export_job(job_id: str):
+    job = export_jobs.get(job_id)
+    if not job:
+        raise HTTPException(status_code=404, detail="Job non trovato")
+    return export_jobs.view(job)
+
+
+@router.get("/export/jobs/{job_id}/download")
+def download_export_job(job_id: str, request: Request):
+    job, path = export_jobs.artifact(job_id)
+    etag = f'"{job["key"]}"'
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    return FileResponse(
+        path,
+        media_type=job["media_type"],
+        headers=cache_headers(etag, {"Content-Disposition": f'attachment; filename="{job["filename"]}"'}),
     )
 
 
+@router.get("/export/cache/stats")
+def export_cache_stats():
+    """Contatori della cache degli export (hit/miss/eviction, byte occupati) e del pool di rendering."""
+    return {**export_cache.stats(), "render_pool": render_pool.stats()}
+
+
 # -------- Preview capitolo via POST (testo volatile) --------
 
 class ChapterPreviewIn(BaseModel):
@@ -596,25 +885,140 @@ class ChapterPreviewIn(BaseModel):
     author: str | None = None
     chapter_title: str
     text: str
+    book_id: str | None = None          # opzionali: con entrambi (e per lo stesso utente)
+    chapter_id: str | None = None       # le anteprime superate si scartano
+
+
+# Anteprime recenti in memoria (TTL breve) + una sola render per contenuto:
+#   - stessa chiave già pronta        → risposta immediata
+#   - stessa chiave in corso          → si attende la stessa render
+#   - stesso capitolo, testo diverso  → al massimo una render in corso e una
+#     in attesa; una richiesta più recente sostituisce quella in attesa,
+#     che risponde 409 senza renderizzare. "Stesso capitolo" = stesso
+#     utente + book_id + chapter_id: senza id (i titoli non identificano
+#     nulla) si unificano solo le richieste identiche
+PREVIEW_TTL_S = float(os.environ.get("PREVIEW_CACHE_TTL_S", "120"))
+PREVIEW_MAX = 64
+_PREVIEW_COND = threading.Condition()
+_PREVIEWS: "OrderedDict[str, Tuple[float, bytes]]" = OrderedDict()
+_PREVIEW_INFLIGHT: Dict[str, Future] = {}
+_PREVIEW_SLOTS: Dict[tuple, Dict[str, Any]] = {}    # (utente, libro, capitolo) → {"running": bool, "latest": ticket}
+
+
+class _PreviewSuperseded(Exception):
+    pass
+
+
+def _preview_cached(key: str) -> bytes | None:
+    entry = _PREVIEWS.get(key)
+    if entry is None:
+        return None
+    if entry[0] < time.monotonic():
+        del _PREVIEWS[key]
+        return None
+    _PREVIEWS.move_to_end(key)
+    return entry[1]
+
+
+def _preview_pdf(slot: tuple | None, key: str, render: Callable[[], bytes]) -> Tuple[bytes, str]:
+    """
+    Ritorna (pdf, esito) con esito HIT | SHARED | MISS; _PreviewSuperseded se superata
+    (solo con uno slot: senza, nessuna richiesta ne scarta un'altra).
+    """
+    while True:
+        state = None
+        with _PREVIEW_COND:
+            data = _preview_cached(key)
+            if data is not None:
+                return data, "HIT"
+            fut = _PREVIEW_INFLIGHT.get(key)
+            owner = fut is None
+            if owner:
+                fut = _PREVIEW_INFLIGHT[key] = Future()
+                fut.slot = slot
+            if owner and slot is not None:
+                state = _PREVIEW_SLOTS.setdefault(slot, {"running": False, "latest": 0})
+                state["latest"] += 1
+                ticket = state["latest"]
+                _PREVIEW_COND.notify_all()          # chi è in attesa sullo stesso capitolo è superato
+                while state["running"] and state["latest"] == ticket:
+                    _PREVIEW_COND.wait()
+                if state["latest"] != ticket:
+                    _PREVIEW_INFLIGHT.pop(key, None)
+                    fut.set_exception(_PreviewSuperseded())
+                    raise _PreviewSuperseded()
+                state["running"] = True
+        if owner:
+            break
+        try:
+            return fut.result(), "SHARED"
+        except _PreviewSuperseded:
+            if slot is not None and slot == fut.slot:
+                raise
+            # superata per il capitolo di chi la renderizzava, non per questa richiesta: si riprova
+
+    def release() -> None:
+        _PREVIEW_INFLIGHT.pop(key, None)
+        if state is not None:
+            state["running"] = False
+            if state["latest"] == ticket:
+                _PREVIEW_SLOTS.pop(slot, None)
+            _PREVIEW_COND.notify_all()
+
+    try:
+        data = render()
+    except BaseException as e:
+        with _PREVIEW_COND:
+            release()
+        fut.set_exception(e)
+        raise
+    with _PREVIEW_COND:
+        _PREVIEWS[key] = (time.monotonic() + PREVIEW_TTL_S, data)
+        while len(_PREVIEWS) > PREVIEW_MAX:
+            _PREVIEWS.popitem(last=False)
+        release()
+    fut.set_result(data)
+    return data, "MISS"
 
 
 @router.post("/export/preview/chapter/pdf")
 def export_preview_chapter_pdf(
     body: ChapterPreviewIn,
+    request: Request,
     size: str = Query("A4", description="A4 | 6x9 | 5x8"),
+    user: Dict[str, Any] = Depends(get_current_user),
 ):
     items = [(body.chapter_title or "Senza titolo", body.text or "")]
-    pdf_bytes = _render_pdf(
-        body.book_title or "Bozza libro",
-        body.author,
-        items,
-        show_cover=False,
-        page_size=_resolve_pagesize(size),
-    )
-    return StreamingResponse(
-        BytesIO(pdf_bytes),
+    key = export_cache.make_key("preview", body.book_title, body.author, items, size)
+    etag = f'"{key}"'
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    slot = None
+    if body.book_id and body.chapter_id:
+        slot = (_job_owner(request, user), body.book_id, body.chapter_id)
+
+    def render() -> bytes:
+        return render_pool.run(
+            _render_pdf,
+            body.book_title or "Bozza libro",
+            body.author,
+            items,
+            show_cover=False,
+            page_size=_resolve_pagesize(size),
+        )
+
+    try:
+        pdf_bytes, outcome = _preview_pdf(slot, key, render)
+    except _PreviewSuperseded:
+        raise HTTPException(status_code=409, detail="Anteprima superata da una richiesta più recente")
+    return Response(
+        content=pdf_bytes,
         media_type="application/pdf",
-        headers={"Content-Disposition": 'inline; filename="preview_chapter.pdf"'}
+        headers=cache_headers(etag, {
+            "Content-Disposition": 'inline; filename="preview_chapter.pdf"',
+            "X-Cache": outcome,
+        }),
     )
 
 
@@ -622,6 +1026,7 @@ def export_preview_chapter_pdf(
 
 @router.get("/generate/cover")
 def generate_cover(
+    request: Request,
     title: str,
     author: str = "",
     style: str = "tipografica",
@@ -632,6 +1037,12 @@ def generate_cover(
     style: tipografica | artistica | fotografica | light | dark
     size : 6x9 | 5x8 | A4
     """
-    img_path = create_cover_image(title=title, author=author, style=style, size=size)
-    filename = Path(img_path).name
-    return FileResponse(img_path, media_type="image/jpeg", filename=filename)
+    etag = f'"{_cover_key(title, author, style, size)}"'
+    cached = not_modified(request, etag)
+    if cached:
+        return cached
+    img_path, hit, filename = _cover_image(title, author, style, size)
+    return FileResponse(
+        img_path, media_type="image/jpeg", filename=filename,
+        headers=cache_headers(etag, {"X-Cache": "HIT" if hit else "MISS"}),
+    )
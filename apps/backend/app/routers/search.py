@@ -0,0 +1,24 @@
+# apps/backend/app/routers/search.py
+from __future__ import annotations
+
+from typing import Optional
+
+from fastapi import APIRouter, Query
+
+from app import search as search_index
+
+router = APIRouter()
+
+
+@router.get("/search", summary="Search Library")
+def search_library(
+    q: str = Query(..., min_length=1, description="Testo da cercare (titoli, metadati, capitoli)"),
+    book_id: Optional[str] = Query(None, description="Limita la ricerca a un libro"),
+    limit: int = Query(20, ge=1, le=100),
+):
+    """
+    Ricerca full-text con indice invertito (normalizzazione italiana, BM25).
+    Ogni risultato ha libro, eventuale capitolo, punteggio, estratto e
+    posizioni [inizio, fine] dei termini trovati nell'estratto.
+    """
+    return search_index.search(q, limit=limit, book_id=(book_id or "").strip() or None)
@@ -0,0 +1,383 @@
+# apps/backend/app/search.py
+from __future__ import annotations
+
+import heapq
+import math
+import os
+import pickle
+import re
+import threading
+import time
+import unicodedata
+from functools import lru_cache
+from typing import Any, Dict, List, Optional, Set, Tuple
+
+from . import storage
+from .repository import book_key, chapter_key
+
+# ─────────────────────────────────────────────────────────
+# Ricerca full-text sulla libreria (GET /search)
+#
+#   documento → metadati del libro (id "<book>\x1f") oppure un capitolo
+#               (id "<book>\x1f<capitolo>")
+#   postings  → termine → {documento: frequenza}
+#
+# Normalizzazione italiana: minuscole, niente accenti, elisioni
+# ("dell'anima" → "anima"), stop word, stemming leggero della vocale
+# finale (libro/libri → "libr"). Punteggio BM25, titolo con peso 3.
+#
+# L'indice si aggiorna in modo incrementale: storage notifica i libri
+# toccati, che vengono reindicizzati alla ricerca successiva (solo i
+# capitoli con firma cambiata, cioè content_hash o titolo). Viene
+# salvato su disco (search/index.pkl) per non reindicizzare all'avvio,
+# ogni SAVE_EVERY_S da un thread: sotto _LOCK si prende solo una copia
+# superficiale, il pickle avviene fuori dal lock; intanto le liste di
+# postings toccate dagli aggiornamenti vengono copiate (copy-on-write).
+# ─────────────────────────────────────────────────────────
+
+INDEX_PATH = storage.file_path("search/index.pkl")
+SAVE_EVERY_S = 30.0
+_FORMAT = 2                     # 2: stop word confrontate senza accenti ("piu", "perche")
+
+_STOP_WORDS_RAW = """
+a ad al alla alle allo agli ai all anche avere aveva c che chi ci coi col come con contro cui
+da dal dalla dalle dallo dagli dai dall degli dei del della delle dello dell dentro di dove e ed
+è era erano essere fa fra gli ha hanno ho i il in io la le lei lo loro lui ma mi mia mie miei mio
+ne nei nel nella nelle nello negli nell noi non nostro o per perché più poi quale quando quanto
+quella quelle quello quelli questa queste questo questi se sei si sia siamo sono su sua sue sui
+sul sulla sulle sullo sugli sull suo suoi ti tra tu tua tue tuo tuoi tutti tutto un una uno
+vi voi
+"""
+_TOKEN = re.compile(r"\w+", re.UNICODE)
+_K1, _B = 1.2, 0.75
+
+_LOCK = threading.RLock()                 # indice (tenuto anche mentre si legge dallo storage)
+_PENDING_LOCK = threading.Lock()          # solo _PENDING: usato dentro i lock di storage
+_SAVE_LOCK = threading.Lock()             # un salvataggio alla volta
+_POSTINGS: Dict[str, Dict[str, int]] = {}
+_DOCS: Dict[str, Dict[str, Any]] = {}     # doc → {book, chapter, sig, len, terms}
+_NORM: Dict[str, float] = {}              # doc → k1·(1 − b + b·len/avg), ricalcolato se la media deriva
+_NORM_AVG = 0.0
+_BOOK_DOCS: Dict[str, Set[str]] = {}      # book_id → documenti del libro
+_TOTAL_LEN = 0
+_PENDING: Set[Optional[str]] = set()      # libri da reindicizzare (None = tutti)
+_DIRTY = False
+_READY = False
+_SNAPSHOT = False                         # un pickle sta leggendo le liste condivise
+_OWNED: Set[str] = set()                  # termini con lista già copiata durante il pickle
+
+
+# ---------- normalizzazione ----------
+def _fold(text: str) -> str:
+    text = unicodedata.normalize("NFKD", text.lower())
+    return "".join(c for c in text if not unicodedata.combining(c))
+
+
+# stessa forma dei token (minuscole, senza accenti): "più" deve scartare anche "piu"
+_STOP_WORDS = frozenset(_fold(w) for w in _STOP_WORDS_RAW.split())
+
+
+def _stem(tok: str) -> str:
+    return tok[:-1] if len(tok) > 4 and tok[-1] in "aeio" else tok
+
+
+@lru_cache(maxsize=200_000)
+def normalize(token: str) -> Optional[str]:
+    """Token originale → termine indicizzato (None se stop word o troppo corto)."""
+    t = _fold(token)
+    if len(t) < 2 or t in _STOP_WORDS:
+        return None
+    return _stem(t)
+
+
+def tokenize(text: str) -> List[str]:
+    norm = normalize
+    return [t for t in map(norm, _TOKEN.findall(text or "")) if t]
+
+
+def _doc_id(book_id: str, chapter_id: str = "") -> str:
+    return f"{book_id}\x1f{chapter_id}"
+
+
+# ---------- aggiornamento indice ----------
+def _writable(term: str, plist: Dict[str, int]) -> Dict[str, int]:
+    """Lista di postings modificabile: durante un pickle, copia di quella condivisa."""
+    if not _SNAPSHOT or term in _OWNED:
+        return plist
+    plist = _POSTINGS[term] = dict(plist)
+    _OWNED.add(term)
+    return plist
+
+
+def _remove_doc(doc: str) -> None:
+    global _TOTAL_LEN, _DIRTY
+    info = _DOCS.pop(doc, None)
+    if info is None:
+        return
+    for term in info["terms"]:
+        plist = _POSTINGS.get(term)
+        if plist is not None:
+            plist = _writable(term, plist)
+            plist.pop(doc, None)
+            if not plist:
+                del _POSTINGS[term]
+    _TOTAL_LEN -= info["len"]
+    _NORM.pop(doc, None)
+    docs = _BOOK_DOCS.get(info["book"])
+    if docs is not None:
+        docs.discard(doc)
+    _DIRTY = True
+
+
+def _add_doc(doc: str, book_id: str, chapter_id: str, sig: Any, fields: List[Tuple[str, int]]) -> None:
+    global _TOTAL_LEN, _DIRTY
+    tf: Dict[str, int] = {}
+    length = 0
+    for text, weight in fields:
+        for t in tokenize(text):
+            tf[t] = tf.get(t, 0) + weight
+            length += weight
+    for term, n in tf.items():
+        plist = _POSTINGS.get(term)
+        if plist is None:
+            _POSTINGS[term] = {doc: n}
+        else:
+            _writable(term, plist)[doc] = n
+    _DOCS[doc] = {"book": book_id, "chapter": chapter_id, "sig": sig, "len": length, "terms": tuple(tf)}
+    _BOOK_DOCS.setdefault(book_id, set()).add(doc)
+    _TOTAL_LEN += length
+    _NORM[doc] = _K1 * (1 - _B + _B * length / (_NORM_AVG or length or 1))
+    _DIRTY = True
+
+
+def _refresh_norms() -> None:
+    """La lunghezza media cambia con gli aggiornamenti: i fattori si ricalcolano solo se deriva >10%."""
+    global _NORM_AVG
+    avg = (_TOTAL_LEN / len(_DOCS)) if _DOCS else 0.0
+    if avg and (not _NORM_AVG or abs(avg - _NORM_AVG) / _NORM_AVG > 0.1):
+        _NORM_AVG = avg
+        for doc, info in _DOCS.items():
+            _NORM[doc] = _K1 * (1 - _B + _B * info["len"] / avg)
+
+
+def _book_sig(book: Dict[str, Any]) -> Tuple:
+    return tuple(str(book.get(k) or "") for k in ("title", "author", "description", "abstract", "genre"))
+
+
+def _index_book(book: Dict[str, Any]) -> None:
+    """Reindicizza un libro: solo i documenti la cui firma è cambiata."""
+    bid = book_key(book)
+    if not bid:
+        return
+    seen = set()
+    doc = _doc_id(bid)
+    seen.add(doc)
+    sig = _book_sig(book)
+    if _DOCS.get(doc, {}).get("sig") != sig:
+        _remove_doc(doc)
+        _add_doc(doc, bid, "", sig, [(sig[0], 3), (sig[1], 2), (sig[2], 1), (sig[3], 1), (sig[4], 1)])
+    for ch in book.get("chapters") or []:
+        cid = chapter_key(ch)
+        if not cid:
+            continue
+        doc = _doc_id(bid, cid)
+        seen.add(doc)
+        sig = (storage.chapter_version(ch), str(ch.get("title") or ""))
+        if _DOCS.get(doc, {}).get("sig") != sig:
+            _remove_doc(doc)
+            _add_doc(doc, bid, cid, sig, [(sig[1], 3), (storage.chapter_body(ch), 1)])
+    for doc in list(_BOOK_DOCS.get(bid, ())):
+        if doc not in seen:
+            _remove_doc(doc)
+
+
+def _remove_book(book_id: str) -> None:
+    for doc in list(_BOOK_DOCS.pop(book_id, ())):
+        _remove_doc(doc)
+
+
+def _sync_all() -> None:
+    repo = storage.repository()
+    live = set()
+    for b in list(repo.books):
+        live.add(book_key(b))
+        _index_book(b)
+    for bid in list(_BOOK_DOCS):
+        if bid not in live:
+            _remove_book(bid)
+
+
+def _on_change(book_id: Optional[str], kind: str) -> None:
+    # chiamata sotto i lock di storage: si annota soltanto (mai _LOCK, o ci sarebbe un deadlock)
+    with _PENDING_LOCK:
+        _PENDING.add(None if kind == "reload" or not book_id else book_id)
+
+
+def catch_up() -> None:
+    """Applica le modifiche annotate (all'avvio: confronto completo con lo storage)."""
+    global _READY
+    with _LOCK:
+        with _PENDING_LOCK:
+            if not _READY:
+                _PENDING.add(None)
+            pending = set(_PENDING)
+            _PENDING.clear()
+        if not _READY:
+            _load()
+            _READY = True
+        if not pending:
+            return
+        if None in pending:
+            _sync_all()
+        else:
+            repo = storage.repository()
+            for bid in pending:
+                book = repo.get(bid)
+                if book is None:
+                    _remove_book(bid)
+                else:
+                    _index_book(book)
+        _refresh_norms()
+
+
+# ---------- persistenza ----------
+def _load() -> None:
+    global _POSTINGS, _DOCS, _BOOK_DOCS, _TOTAL_LEN
+    try:
+        with open(INDEX_PATH, "rb") as fh:
+            state = pickle.load(fh)
+        if state.get("format") != _FORMAT:
+            return
+    except FileNotFoundError:
+        return
+    except Exception as e:
+        print(f"⚠️  Indice di ricerca illeggibile, lo ricostruisco: {e}")
+        return
+    _POSTINGS = state["postings"]
+    _DOCS = state["docs"]
+    _BOOK_DOCS = {}
+    _TOTAL_LEN = 0
+    for doc, info in _DOCS.items():
+        _BOOK_DOCS.setdefault(info["book"], set()).add(doc)
+        _TOTAL_LEN += info["len"]
+    _refresh_norms()
+
+
+def save() -> None:
+    """Scrive l'indice su disco (atomico) se è cambiato; le ricerche non attendono il pickle."""
+    global _DIRTY, _SNAPSHOT, _OWNED
+    with _SAVE_LOCK:
+        with _LOCK:
+            if not _DIRTY or not _READY:
+                return
+            # copia superficiale: le liste restano condivise finché _SNAPSHOT è attivo
+            state = {"format": _FORMAT, "docs": dict(_DOCS), "postings": dict(_POSTINGS)}
+            _DIRTY = False
+            _SNAPSHOT, _OWNED = True, set()
+        try:
+            INDEX_PATH.parent.mkdir(parents=True, exist_ok=True)
+            tmp = INDEX_PATH.with_name(f".{INDEX_PATH.name}.{os.getpid()}.tmp")
+            with open(tmp, "wb") as fh:
+                pickle.dump(state, fh, protocol=pickle.HIGHEST_PROTOCOL)
+            os.replace(tmp, INDEX_PATH)
+        except BaseException:
+            with _LOCK:
+                _DIRTY = True
+            raise
+        finally:
+            with _LOCK:
+                _SNAPSHOT, _OWNED = False, set()
+
+
+def _saver() -> None:
+    try:
+        catch_up()
+    except Exception as e:
+        print(f"⚠️  Indicizzazione iniziale fallita: {e}")
+    while True:
+        time.sleep(SAVE_EVERY_S)
+        try:
+            save()
+        except Exception as e:
+            print(f"⚠️  Salvataggio dell'indice di ricerca fallito: {e}")
+
+
+def install() -> None:
+    """Registra l'indice sulle modifiche dello storage, lo prepara e lo salva periodicamente in background."""
+    storage.add_change_listener(_on_change)
+    threading.Thread(target=_saver, name="search-index", daemon=True).start()
+
+
+# ---------- interrogazione ----------
+def _snippet(text: str, terms: Set[str], width: int = 160) -> Tuple[str, List[List[int]]]:
+    """Estratto attorno alla prima occorrenza, con le posizioni dei termini trovati."""
+    matches = [(m.start(), m.end()) for m in _TOKEN.finditer(text) if normalize(m.group(0)) in terms]
+    if not matches:
+        cut = text[:width].strip()
+        return (cut + ("…" if len(text) > width else "")), []
+    first = matches[0][0]
+    start = max(0, first - width // 3)
+    if start > 0:
+        sp = text.rfind(" ", 0, start)
+        start = sp + 1 if sp >= 0 and start - sp < 20 else start
+    end = min(len(text), start + width)
+    prefix = "…" if start > 0 else ""
+    snippet = prefix + text[start:end] + ("…" if end < len(text) else "")
+    off = len(prefix) - start
+    highlights = [[s + off, e + off] for s, e in matches if s >= start and e <= end]
+    return snippet.replace("\n", " "), highlights
+
+
+def _scores(terms: List[str], book_id: Optional[str]) -> Dict[str, float]:
+    n_docs = max(len(_DOCS), 1)
+    allowed = _BOOK_DOCS.get(book_id, set()) if book_id is not None else None
+    norm = _NORM
+    scores: Dict[str, float] = {}
+    get = scores.get
+    for term in set(terms):
+        plist = _POSTINGS.get(term)
+        if not plist:
+            continue
+        idf = math.log(1 + (n_docs - len(plist) + 0.5) / (len(plist) + 0.5))
+        w = idf * (_K1 + 1)
+        if allowed is not None:
+            plist = {d: tf for d, tf in plist.items() if d in allowed}
+        for doc, tf in plist.items():
+            scores[doc] = get(doc, 0.0) + w * tf / (tf + norm[doc])
+    return scores
+
+
+def search(q: str, *, limit: int = 20, book_id: Optional[str] = None) -> Dict[str, Any]:
+    catch_up()
+    terms = tokenize(q)
+    if not terms:
+        return {"query": q, "total": 0, "items": []}
+    with _LOCK:
+        scored = _scores(terms, book_id)
+        top = heapq.nlargest(limit, scored.items(), key=lambda x: x[1])
+        hits = [(doc, score, dict(_DOCS[doc])) for doc, score in top]
+    repo = storage.repository()
+    wanted = set(terms)
+    items = []
+    for doc, score, info in hits:
+        book = repo.get(info["book"])
+        if book is None:
+            continue
+        item = {
+            "book_id": info["book"],
+            "book_title": book.get("title"),
+            "chapter_id": info["chapter"] or None,
+            "chapter_title": None,
+            "score": round(score, 4),
+        }
+        if info["chapter"]:
+            ch = repo.get_chapter(book, info["chapter"])
+            if ch is None:
+                continue
+            item["chapter_title"] = ch.get("title")
+            text = storage.chapter_body(ch)
+        else:
+            text = " — ".join(x for x in (book.get("title"), book.get("author"), book.get("description") or book.get("abstract")) if x)
+        item["snippet"], item["highlights"] = _snippet(text, wanted)
+        items.append(item)
+    return {"query": q, "total": len(scored), "items": items}
@@ -0,0 +1,203 @@
+# apps/backend/app/sqlite_store.py
+from __future__ import annotations
+
+import json
+import sqlite3
+import sys
+import threading
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
+
+# ─────────────────────────────────────────────────────────
+# Backend SQLite (STORAGE_BACKEND=sqlite), in modalità WAL.
+#   books    → una riga per libro (metadati senza capitoli)
+#   chapters → una riga per capitolo (posizione nel libro)
+# Lo store ricorda l'ultimo JSON scritto per ogni riga: persist_book
+# aggiorna solo le righe davvero cambiate (tipicamente una).
+# ─────────────────────────────────────────────────────────
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS books (
+    id        TEXT PRIMARY KEY,
+    position  INTEGER NOT NULL,
+    data      TEXT NOT NULL
+);
+CREATE INDEX IF NOT EXISTS books_position ON books(position);
+CREATE TABLE IF NOT EXISTS chapters (
+    book_id    TEXT NOT NULL,
+    position   INTEGER NOT NULL,
+    chapter_id TEXT NOT NULL,
+    data       TEXT NOT NULL,
+    PRIMARY KEY (book_id, position)
+);
+CREATE INDEX IF NOT EXISTS chapters_by_id ON chapters(book_id, chapter_id);
+"""
+
+
+def _book_id(book: Dict[str, Any]) -> str:
+    return str(book.get("id") or book.get("book_id") or "").strip()
+
+
+def _dumps(obj: Any) -> str:
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":"))
+
+
+class SqliteStore:
+    def __init__(self, path: Path):
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn: Optional[sqlite3.Connection] = None
+        # book_id → (json metadati, [json capitoli]) come sono su disco
+        self._written: Dict[str, Tuple[str, List[str]]] = {}
+
+    def _db(self) -> sqlite3.Connection:
+        if self._conn is None:
+            self.path.parent.mkdir(parents=True, exist_ok=True)
+            conn = sqlite3.connect(str(self.path), check_same_thread=False, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=5000")
+            conn.executescript(_SCHEMA)
+            self._conn = conn
+        return self._conn
+
+    @staticmethod
+    def _split(book: Dict[str, Any]) -> Tuple[str, List[Tuple[str, str]]]:
+        meta = {k: v for k, v in book.items() if k != "chapters"}
+        chapters = [(str(c.get("id") or ""), _dumps(c)) for c in (book.get("chapters") or [])]
+        return _dumps(meta), chapters
+
+    # ---------- lettura ----------
+    def is_empty(self) -> bool:
+        with self._lock:
+            return self._db().execute("SELECT 1 FROM books LIMIT 1").fetchone() is None
+
+    def load(self) -> List[Dict[str, Any]]:
+        with self._lock:
+            db = self._db()
+            books: List[Dict[str, Any]] = []
+            by_id: Dict[str, Dict[str, Any]] = {}
+            for bid, data in db.execute("SELECT id, data FROM books ORDER BY position"):
+                b = json.loads(data)
+                b["chapters"] = []
+                books.append(b)
+                by_id[bid] = b
+                self._written[bid] = (data, [])
+            for bid, data in db.execute("SELECT book_id, data FROM chapters ORDER BY book_id, position"):
+                if bid in by_id:
+                    by_id[bid]["chapters"].append(json.loads(data))
+                    self._written[bid][1].append(data)
+            return books
+
+    def load_one(self, book_id: str) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            db = self._db()
+            row = db.execute("SELECT data FROM books WHERE id = ?", (book_id,)).fetchone()
+            if row is None:
+                self._written.pop(book_id, None)
+                return None
+            b = json.loads(row[0])
+            rows = [r[0] for r in db.execute(
+                "SELECT data FROM chapters WHERE book_id = ? ORDER BY position", (book_id,))]
+            b["chapters"] = [json.loads(r) for r in rows]
+            self._written[book_id] = (row[0], rows)
+            return b
+
+    # ---------- scrittura ----------
+    def _write_book(self, db: sqlite3.Connection, book: Dict[str, Any], position: Optional[int]) -> None:
+        bid = _book_id(book)
+        meta, chapters = self._split(book)
+        old_meta, old_chapters = self._written.get(bid, (None, []))
+        if position is not None:
+            db.execute(
+                "INSERT INTO books(id, position, data) VALUES (?, ?, ?) "
+                "ON CONFLICT(id) DO UPDATE SET data = excluded.data",
+                (bid, position, meta),
+            )
+        elif meta != old_meta:
+            db.execute("UPDATE books SET data = ? WHERE id = ?", (meta, bid))
+        for i, (cid, data) in enumerate(chapters):
+            if i >= len(old_chapters) or old_chapters[i] != data:
+                db.execute(
+                    "INSERT OR REPLACE INTO chapters(book_id, position, chapter_id, data) VALUES (?, ?, ?, ?)",
+                    (bid, i, cid, data),
+                )
+        if len(old_chapters) > len(chapters):
+            db.execute("DELETE FROM chapters WHERE book_id = ? AND position >= ?", (bid, len(chapters)))
+        self._written[bid] = (meta, [data for _, data in chapters])
+
+    def put_book(self, book: Dict[str, Any], books: List[Dict[str, Any]], is_new: bool) -> None:
+        if not _book_id(book):
+            return
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                position = None
+                if is_new or _book_id(book) not in self._written:
+                    row = db.execute("SELECT COALESCE(MAX(position), -1) + 1 FROM books").fetchone()
+                    position = row[0]
+                self._write_book(db, book, position)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                self._written.pop(_book_id(book), None)
+                raise
+
+    def delete_book(self, book_id: str, books: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            db.execute("DELETE FROM chapters WHERE book_id = ?", (book_id,))
+            db.execute("DELETE FROM books WHERE id = ?", (book_id,))
+            db.execute("COMMIT")
+            self._written.pop(book_id, None)
+
+    def reorder(self, book: Dict[str, Any], order: List[str]) -> None:
+        self.put_book(book, [], is_new=False)
+
+    def save_all(self, books: List[Dict[str, Any]]) -> None:
+        with self._lock:
+            db = self._db()
+            db.execute("BEGIN IMMEDIATE")
+            try:
+                db.execute("DELETE FROM chapters")
+                db.execute("DELETE FROM books")
+                self._written.clear()
+                for i, b in enumerate(x for x in books if _book_id(x)):
+                    self._write_book(db, b, i)
+                db.execute("COMMIT")
+            except Exception:
+                db.execute("ROLLBACK")
+                self._written.clear()
+                raise
+
+    def close(self) -> None:
+        with self._lock:
+            if self._conn is not None:
+                self._conn.close()
+                self._conn = None
+
+
+def import_books_json(src: Path, db_path: Path) -> int:
+    """Importer una tantum: books.json (lista) → database SQLite. Ritorna i libri importati."""
+    data = json.loads(Path(src).read_text(encoding="utf-8"))
+    books = [b for b in data if isinstance(b, dict)] if isinstance(data, list) else []
+    store = SqliteStore(Path(db_path))
+    try:
+        store.save_all(books)
+    finally:
+        store.close()
+    return len([b for b in books if _book_id(b)])
+
+
+if __name__ == "__main__":
+    # uso: python -m app.sqlite_store <books.json> [<db>]
+    from . import storage
+
+    if len(sys.argv) < 2:
+        print("uso: python -m app.sqlite_store <books.json> [<db>]")
+        sys.exit(2)
+    target = Path(sys.argv[2]) if len(sys.argv) > 2 else storage.SQLITE_PATH
+    n = import_books_json(Path(sys.argv[1]), target)
+    print(f"✅ Importati {n} libri in {target}")
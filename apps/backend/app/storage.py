@@ -1,10 +1,24 @@
 # apps/backend/app/storage.py
 from __future__ import annotations
 
+import hashlib
 import json
 import os
+import re
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from functools import lru_cache
 from pathlib import Path
-from typing import Any, Dict, List, Optional
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+
+from .repository import BookRepository
+
+try:  # lock advisory tra processi (POSIX); su Windows resta solo il lock tra thread
+    import fcntl
+except ImportError:
+    fcntl = None
 
 # Root persistente su Render (override con env STORAGE_ROOT se serve)
 DEFAULT_ROOT = "/opt/render/project/data/eccomibook"
@@ -12,65 +26,855 @@ BASE_DIR = Path(os.environ.get("STORAGE_ROOT", DEFAULT_ROOT)).resolve()
 
 BOOKS_DIR = BASE_DIR / "books"
 CHAPTERS_DIR = BASE_DIR / "chapters"
-BOOKS_JSON = BASE_DIR / "books.json"
+BLOBS_DIR = CHAPTERS_DIR / "blobs"              # testi capitoli content-addressed (sha256)
+BOOKS_JSON = BASE_DIR / "books.json"          # formato legacy (migrato all'avvio)
+
+# Layout "sharded": un file per libro + manifest con l'ordine della libreria
+LIBRARY_DIR = BASE_DIR / "library"
+MANIFEST_JSON = LIBRARY_DIR / "manifest.json"
+
+# Journal (STORAGE_BACKEND=journal): snapshot + write-ahead log
+JOURNAL_DIR = BASE_DIR / "journal"
+
+# SQLite (STORAGE_BACKEND=sqlite)
+SQLITE_PATH = Path(os.environ.get("STORAGE_SQLITE_PATH", str(BASE_DIR / "eccomibook.db"))).resolve()
+
+# Coordinamento tra worker (uvicorn --workers N)
+LOCK_FILE = BASE_DIR / ".storage.lock"
+LOCKS_DIR = BASE_DIR / "locks"                  # un lock file per libro
+GENERATION_JSON = BASE_DIR / ".generation.json"
 
-# Cache opzionale in-process
+# "shards" (default) | "journal" | "sqlite"
+STORAGE_BACKEND = os.environ.get("STORAGE_BACKEND", "shards").strip().lower()
+
+# Cache opzionale in-process (+ indici: vedi repository.py)
 BOOKS_CACHE: Optional[List[Dict[str, Any]]] = None
+REPO: Optional[BookRepository] = None
+
+_SAFE_ID = re.compile(r"^[A-Za-z0-9_.\-]{1,80}$")
 
 
 def ensure_dirs() -> None:
     BASE_DIR.mkdir(parents=True, exist_ok=True)
     BOOKS_DIR.mkdir(parents=True, exist_ok=True)
     CHAPTERS_DIR.mkdir(parents=True, exist_ok=True)
+    LIBRARY_DIR.mkdir(parents=True, exist_ok=True)
+    BLOBS_DIR.mkdir(parents=True, exist_ok=True)
+
+
+# ─────────────────────────────────────────────────────────
+# Helper di basso livello (shard + manifest)
+# ─────────────────────────────────────────────────────────
+def _env_int(name: str, default: int) -> int:
+    try:
+        return int(os.getenv(name, "").strip() or default)
+    except Exception:
+        return default
+
+
+def _book_id(book: Dict[str, Any]) -> str:
+    return str(book.get("id") or book.get("book_id") or "").strip()
+
+
+def _shard_path(book_id: str) -> Path:
+    """File del singolo libro; gli id "strani" vengono hashati per avere un nome sicuro."""
+    if _SAFE_ID.match(book_id) and not book_id.startswith("."):
+        return LIBRARY_DIR / f"{book_id}.json"
+    digest = hashlib.sha1(book_id.encode("utf-8")).hexdigest()
+    return LIBRARY_DIR / f"id_{digest}.json"
+
+
+def _atomic_write(path: Path, text: str, durable: bool = True) -> None:
+    """Scrive su file temporaneo + fsync + rename: chi legge vede il vecchio o il nuovo, mai metà."""
+    tmp = path.with_name(f".{path.name}.{os.getpid()}.tmp")
+    with open(tmp, "w", encoding="utf-8") as fh:
+        fh.write(text)
+        if durable:
+            fh.flush()
+            os.fsync(fh.fileno())
+    os.replace(tmp, path)
+
+
+def _write_shard(book: Dict[str, Any]) -> None:
+    _atomic_write(_shard_path(_book_id(book)), json.dumps(book, ensure_ascii=False))
+
+
+def _write_manifest(books: List[Dict[str, Any]]) -> None:
+    order = [bid for bid in (_book_id(b) for b in books) if bid]
+    _atomic_write(MANIFEST_JSON, json.dumps({"version": 1, "order": order}, ensure_ascii=False))
+
+
+def _read_manifest() -> List[str]:
+    try:
+        data = json.loads(MANIFEST_JSON.read_text(encoding="utf-8"))
+        order = data.get("order") if isinstance(data, dict) else None
+        return [str(x) for x in order] if isinstance(order, list) else []
+    except Exception:
+        return []
+
+
+def _read_shard(book_id: str) -> Optional[Dict[str, Any]]:
+    try:
+        data = json.loads(_shard_path(book_id).read_text(encoding="utf-8"))
+        return data if isinstance(data, dict) else None
+    except Exception:
+        return None
+
+
+def _read_library() -> List[Dict[str, Any]]:
+    books: List[Dict[str, Any]] = []
+    for bid in _read_manifest():
+        b = _read_shard(bid)
+        if b is not None:
+            books.append(b)
+    return books
+
+
+def _read_legacy_books_json() -> List[Dict[str, Any]]:
     if not BOOKS_JSON.exists():
-        BOOKS_JSON.write_text("[]", encoding="utf-8")
+        return []
+    try:
+        data = json.loads(BOOKS_JSON.read_text(encoding="utf-8"))
+        return [b for b in data if isinstance(b, dict)] if isinstance(data, list) else []
+    except Exception:
+        return []
+
+
+def migrate_legacy_books_json() -> None:
+    """
+    Converte il vecchio books.json (lista unica) nel layout a shard.
+    Idempotente: se il manifest esiste già non fa nulla; il file legacy
+    viene rinominato in books.json.migrated per non rimigrarlo.
+    """
+    LIBRARY_DIR.mkdir(parents=True, exist_ok=True)
+    if MANIFEST_JSON.exists():
+        return
+    books = _read_legacy_books_json()
+    for b in books:
+        if _book_id(b):
+            _write_shard(b)
+    _write_manifest(books)
+    if BOOKS_JSON.exists():
+        BOOKS_JSON.replace(BOOKS_JSON.with_name(BOOKS_JSON.name + ".migrated"))
+
+
+class ShardStore:
+    """Backend di default: un file JSON per libro + manifest."""
+
+    def load(self) -> List[Dict[str, Any]]:
+        migrate_legacy_books_json()
+        return _read_library()
+
+    def load_one(self, book_id: str) -> Optional[Dict[str, Any]]:
+        return _read_shard(book_id)
+
+    def put_book(self, book: Dict[str, Any], books: List[Dict[str, Any]], is_new: bool) -> None:
+        if _book_id(book):
+            _write_shard(book)
+        if is_new:
+            _write_manifest(books)
+
+    def delete_book(self, book_id: str, books: List[Dict[str, Any]]) -> None:
+        _write_manifest(books)
+        _shard_path(book_id).unlink(missing_ok=True)
+
+    def reorder(self, book: Dict[str, Any], order: List[str]) -> None:
+        _write_shard(book)
+
+    def save_all(self, books: List[Dict[str, Any]]) -> None:
+        keep = set()
+        for b in books:
+            if _book_id(b):
+                _write_shard(b)
+                keep.add(_shard_path(_book_id(b)).name)
+        _write_manifest(books)
+        for p in LIBRARY_DIR.glob("*.json"):
+            if p != MANIFEST_JSON and p.name not in keep:
+                p.unlink(missing_ok=True)
+
+    def close(self) -> None:
+        pass
+
+
+def _seed_books() -> List[Dict[str, Any]]:
+    """Libri già presenti su file (shard o books.json legacy), per inizializzare un backend nuovo."""
+    return _read_library() if MANIFEST_JSON.exists() else _read_legacy_books_json()
+
+
+class _JournalAdapter:
+    """Adatta JournalStore all'interfaccia dei backend (migrando books.json/shard al primo avvio)."""
+
+    def __init__(self):
+        from .journal import JournalStore
+        self.journal = JournalStore(
+            JOURNAL_DIR,
+            fsync_ms=_env_int("STORAGE_JOURNAL_FSYNC_MS", 50),
+            compact_bytes=_env_int("STORAGE_JOURNAL_COMPACT_BYTES", 8 * 1024 * 1024),
+        )
+
+    def load(self) -> List[Dict[str, Any]]:
+        fresh = not any(JOURNAL_DIR.glob("*")) if JOURNAL_DIR.exists() else True
+        books = self.journal.load()
+        if fresh:
+            seed = _seed_books()
+            if seed:
+                self.journal.save_all(seed)
+                self.journal.compact()
+                books = seed
+        return books
+
+    def put_book(self, book: Dict[str, Any], books: List[Dict[str, Any]], is_new: bool) -> None:
+        self.journal.put_book(book)
+
+    def delete_book(self, book_id: str, books: List[Dict[str, Any]]) -> None:
+        self.journal.delete_book(book_id)
+
+    def reorder(self, book: Dict[str, Any], order: List[str]) -> None:
+        self.journal.reorder(_book_id(book), order)
+
+    def save_all(self, books: List[Dict[str, Any]]) -> None:
+        self.journal.save_all(books)
+
+    def close(self) -> None:
+        self.journal.close()
+
+
+def _sqlite_store():
+    from .sqlite_store import SqliteStore
+
+    class _SeededSqliteStore(SqliteStore):
+        def load(self) -> List[Dict[str, Any]]:
+            if self.is_empty():
+                seed = _seed_books()
+                if seed:
+                    self.save_all(seed)
+            return super().load()
+
+    return _SeededSqliteStore(SQLITE_PATH)
+
+
+# ─────────────────────────────────────────────────────────
+# Testi dei capitoli: blob content-addressed fuori dal record del libro
+#   il capitolo conserva solo content_hash / size / words
+#   i blob non più referenziati da nessun capitolo vengono eliminati
+#   da collect_blobs() (mark & sweep, vedi sotto)
+# ─────────────────────────────────────────────────────────
+_BLOB_LOCK = threading.Lock()     # scrittura/riuso di un blob vs. sweep del GC (stesso processo)
+
+
+def _blob_path(content_hash: str) -> Path:
+    return BLOBS_DIR / content_hash[:2] / f"{content_hash}.txt"
+
+
+def put_chapter_body(text: str) -> Dict[str, Any]:
+    """Scrive il testo (solo se non esiste già: testi identici sono deduplicati)."""
+    data = (text or "").encode("utf-8")
+    h = hashlib.sha256(data).hexdigest()
+    p = _blob_path(h)
+    with _BLOB_LOCK:
+        try:
+            os.utime(p)         # blob riusato: "ringiovanito", il GC non lo tocca
+        except FileNotFoundError:
+            p.parent.mkdir(parents=True, exist_ok=True)
+            _atomic_write(p, text or "")
+            # niente .gz/.br qui: li crea /static/chapters alla prima richiesta compressa
+    return {"content_hash": h, "size": len(data), "words": len((text or "").split())}
+
+
+@lru_cache(maxsize=64)
+def _read_blob(content_hash: str) -> str:
+    return _blob_path(content_hash).read_text(encoding="utf-8")
+
+
+def read_chapter_body(content_hash: str) -> str:
+    """Legge un blob (immutabile, quindi cacheabile per hash)."""
+    try:
+        return _read_blob(content_hash)
+    except OSError as e:
+        # non è un capitolo vuoto: è un testo perso, va segnalato (e non messo in cache)
+        print(f"❌ Testo del capitolo illeggibile (blob {content_hash}): {e}")
+        return ""
+
+
+def chapter_body(ch: Dict[str, Any]) -> str:
+    """Testo del capitolo: inline (legacy / non ancora salvato) oppure dal blob."""
+    if ch.get("content") is not None:
+        return str(ch.get("content") or "")
+    h = ch.get("content_hash")
+    return read_chapter_body(h) if h else ""
+
+
+def chapter_version(ch: Dict[str, Any]) -> str:
+    """Versione del testo (sha256): content_hash, o l'hash del testo inline non ancora salvato."""
+    if ch.get("content") is not None:
+        return hashlib.sha256(str(ch.get("content") or "").encode("utf-8")).hexdigest()
+    return ch.get("content_hash") or hashlib.sha256(b"").hexdigest()
+
+
+def chapter_meta(ch: Dict[str, Any]) -> Dict[str, Any]:
+    """Capitolo senza testo, con hash/size/words allineati anche se il testo è ancora inline."""
+    meta = {k: v for k, v in ch.items() if k != "content"}
+    if ch.get("content") is not None:
+        data = str(ch.get("content") or "").encode("utf-8")
+        meta.update(content_hash=hashlib.sha256(data).hexdigest(), size=len(data),
+                    words=len(str(ch.get("content") or "").split()))
+    elif not meta.get("content_hash"):
+        meta["content_hash"] = chapter_version(ch)
+    return meta
+
+
+def chapter_with_body(ch: Dict[str, Any]) -> Dict[str, Any]:
+    """Copia del capitolo con 'content' valorizzato (per le risposte API)."""
+    return {**ch, "content": chapter_body(ch), "content_hash": chapter_version(ch)}
+
+
+def _externalize_bodies(book: Dict[str, Any]) -> bool:
+    """Sposta i 'content' inline nei blob; True se il libro è cambiato."""
+    changed = False
+    for ch in book.get("chapters") or []:
+        if isinstance(ch, dict) and "content" in ch:
+            # prima l'hash nuovo, poi via il testo: chi legge in parallelo vede sempre quello nuovo
+            ch.update(put_chapter_body(str(ch["content"] or "")))
+            ch.pop("content", None)
+            changed = True
+    return changed
+
+
+def _externalize_live(book: Dict[str, Any]) -> None:
+    """_externalize_bodies per un libro già nel repository: il dict cambia, quindi
+    ETag e risposte in cache costruite col testo inline non sono più valide."""
+    if _externalize_bodies(book) and REPO is not None:
+        REPO.touch(_book_id(book))
+
+
+# ─────────────────────────────────────────────────────────
+# GC dei blob (mark & sweep)
+#   mark: gli hash referenziati dalla libreria, letti sotto locked()
+#   dopo il riallineamento con gli altri worker;
+#   sweep: i blob non referenziati più vecchi di STORAGE_BLOB_GRACE_S
+#   (con i loro .gz/.br). La grazia copre i blob appena scritti (o
+#   riusati: put_chapter_body ne aggiorna l'mtime) da una modifica non
+#   ancora registrata, anche in un altro worker.
+#   Parte in background dopo una scrittura, al massimo ogni
+#   STORAGE_BLOB_GC_S secondi (0 = disattivato).
+# ─────────────────────────────────────────────────────────
+BLOB_GC_S = _env_int("STORAGE_BLOB_GC_S", 600)
+BLOB_GRACE_S = _env_int("STORAGE_BLOB_GRACE_S", 600)
+
+_GC_RUNNING = threading.Lock()
+_LAST_GC = time.monotonic()
+
+
+def _referenced_blobs() -> set:
+    with locked():
+        return {
+            ch.get("content_hash")
+            for b in repository().books
+            for ch in (b.get("chapters") or [])
+            if isinstance(ch, dict) and ch.get("content_hash")
+        }
+
+
+def collect_blobs(grace_s: Optional[int] = None) -> int:
+    """Elimina i blob non referenziati da nessun capitolo; ritorna quanti testi ha rimosso."""
+    grace = BLOB_GRACE_S if grace_s is None else grace_s
+    live = _referenced_blobs()
+    cutoff = time.time() - grace
+    removed = 0
+    if not BLOBS_DIR.exists():
+        return 0
+    for sub in BLOBS_DIR.iterdir():
+        if not sub.is_dir():
+            continue
+        for f in sub.iterdir():
+            h = f.name.split(".", 1)[0]
+            if f.name.startswith(".") or h in live:
+                continue
+            with _BLOB_LOCK:
+                try:
+                    if f.stat().st_mtime > cutoff:
+                        continue
+                    f.unlink()
+                except FileNotFoundError:
+                    continue
+            if f.suffix == ".txt":
+                removed += 1
+    return removed
+
+
+def _maybe_collect_blobs() -> None:
+    """Avvia il GC dei blob in background se è passato almeno BLOB_GC_S dall'ultimo giro."""
+    global _LAST_GC
+    if BLOB_GC_S <= 0 or time.monotonic() - _LAST_GC < BLOB_GC_S:
+        return
+    if not _GC_RUNNING.acquire(blocking=False):
+        return
+    _LAST_GC = time.monotonic()
+
+    def run() -> None:
+        try:
+            n = collect_blobs()
+            if n:
+                print(f"🧹 Eliminati {n} testi di capitoli non più referenziati")
+        except Exception as e:
+            print(f"⚠️  GC dei blob fallito: {e}")
+        finally:
+            _GC_RUNNING.release()
+
+    threading.Thread(target=run, name="storage-blob-gc", daemon=True).start()
+
+
+_STORE: Optional[Any] = None
+
+
+def _store():
+    """Backend selezionato con STORAGE_BACKEND: "shards" (default) | "journal" | "sqlite"."""
+    global _STORE
+    if _STORE is None:
+        if STORAGE_BACKEND == "journal":
+            _STORE = _JournalAdapter()
+        elif STORAGE_BACKEND == "sqlite":
+            _STORE = _sqlite_store()
+        else:
+            _STORE = ShardStore()
+    return _STORE
+
+
+# Lock globale, tenuto solo per le modifiche strutturali (creazione, eliminazione,
+# manifest) e per l'aggiornamento del contatore di generazione
+_IO_LOCK = threading.RLock()
+
+# Lock per libro: modifiche a libri diversi procedono in parallelo
+_BOOK_LOCKS: Dict[str, threading.RLock] = {}
+_BOOK_LOCKS_GUARD = threading.Lock()
+_BOOK_HELD = threading.local()   # per thread: book_id → profondità (rientranza del flock)
+
+
+# ─────────────────────────────────────────────────────────
+# Write-behind (STORAGE_WRITE_BEHIND_MS > 0)
+#   persist_book aggiorna solo la memoria e marca il libro "dirty";
+#   un thread unisce tutte le modifiche di un libro in una scrittura
+#   ogni N ms. STORAGE_MAX_LAG_MS è il ritardo massimo tollerato: oltre,
+#   chi scrive esegue il flush da sé. Lo shutdown fa sempre flush().
+# ─────────────────────────────────────────────────────────
+WRITE_BEHIND_MS = _env_int("STORAGE_WRITE_BEHIND_MS", 0)
+MAX_LAG_MS = _env_int("STORAGE_MAX_LAG_MS", 5000)
+
+_DIRTY: Dict[str, float] = {}     # book_id → istante della prima modifica non salvata
+_DIRTY_LOCK = threading.Lock()
+_FLUSH_STOP = threading.Event()
+_FLUSHER: Optional[threading.Thread] = None
+
+
+def _mark_dirty(book_id: str) -> None:
+    """Chiamata col lock del libro già preso."""
+    global _FLUSHER
+    now = time.monotonic()
+    with _DIRTY_LOCK:
+        since = _DIRTY.setdefault(book_id, now)
+        if _FLUSHER is None or not _FLUSHER.is_alive():
+            _FLUSH_STOP.clear()
+            _FLUSHER = threading.Thread(target=_flush_loop, name="storage-write-behind", daemon=True)
+            _FLUSHER.start()
+    # gli ascoltatori (es. ricerca) non aspettano il flush su disco
+    _notify([(None, book_id, "put")])
+    if (now - since) * 1000 >= MAX_LAG_MS:
+        # il flusher è in ritardo: questo libro lo scrive chi sta modificando
+        flush([book_id])
+
+
+def _flush_loop() -> None:
+    while not _FLUSH_STOP.wait(WRITE_BEHIND_MS / 1000.0):
+        flush()
+
+
+def flush(book_ids: Optional[List[str]] = None) -> None:
+    """Scrive su disco i libri con modifiche pendenti (tutti, o solo quelli indicati)."""
+    with _DIRTY_LOCK:
+        if book_ids is None:
+            pending = dict(_DIRTY)
+            _DIRTY.clear()
+        else:
+            pending = {bid: _DIRTY.pop(bid) for bid in book_ids if bid in _DIRTY}
+    for bid, since in pending.items():
+        try:
+            with book_locked(bid):
+                book = REPO.get(bid) if REPO is not None else None
+                if book is None:
+                    continue
+                _externalize_live(book)
+                _store().put_book(book, REPO.books, is_new=False)
+                with locked():
+                    _committed(bid, "put")
+        except Exception as e:
+            # riprova al prossimo giro, mantenendo l'età originale
+            with _DIRTY_LOCK:
+                _DIRTY[bid] = min(_DIRTY.get(bid, since), since)
+            print(f"⚠️  Flush write-behind fallito per {bid}: {e}")
+
+
+def close() -> None:
+    """Chiusura ordinata: flush del write-behind, fsync del journal, stop dei thread."""
+    global _STORE, _FLUSHER
+    _FLUSH_STOP.set()
+    if _FLUSHER is not None:
+        _FLUSHER.join(timeout=5)
+        _FLUSHER = None
+    flush()
+    with _IO_LOCK:
+        if _STORE is not None:
+            _STORE.close()
+            _STORE = None
+
+
+# ─────────────────────────────────────────────────────────
+# Multi-worker: flock esclusivo sulle scritture + contatore di
+# generazione su disco. Ogni scrittura incrementa la generazione e
+# annota quale libro ha toccato; gli altri processi, alla prossima
+# lettura, vedono il file cambiato (stat) e ricaricano solo quei libri.
+# NB: journal e write-behind restano modalità a singolo worker (stato
+# in memoria non condiviso): _claim_single_worker() rifiuta l'avvio se
+# WEB_CONCURRENCY > 1 o se un altro processo usa già lo STORAGE_ROOT.
+# ─────────────────────────────────────────────────────────
+_GEN_CHANGES_KEEP = 256
+SINGLE_WORKER_LOCK = BASE_DIR / ".single-worker.lock"
+_SINGLE_FD: Optional[int] = None
+_LOCK_FD: Optional[int] = None
+_LOCK_DEPTH = 0
+_SEEN_GEN = 0
+_GEN_STAT: Optional[tuple] = None
+
+
+def file_path(rel: str) -> Path:
+    """Path assoluto di un file sotto lo STORAGE_ROOT."""
+    return BASE_DIR / rel
+
+
+def _single_worker_mode() -> Optional[str]:
+    if STORAGE_BACKEND == "journal":
+        return "STORAGE_BACKEND=journal"
+    if WRITE_BEHIND_MS > 0:
+        return "STORAGE_WRITE_BEHIND_MS"
+    return None
+
+
+def _claim_single_worker() -> None:
+    """In modalità a singolo worker tiene un flock esclusivo sullo STORAGE_ROOT per tutta la vita del processo."""
+    global _SINGLE_FD
+    mode = _single_worker_mode()
+    if mode is None or _SINGLE_FD is not None:
+        return
+    workers = _env_int("WEB_CONCURRENCY", 1)
+    if workers > 1:
+        raise RuntimeError(
+            f"{mode} funziona con un solo worker, ma WEB_CONCURRENCY={workers}: "
+            "usa --workers 1 oppure STORAGE_BACKEND=shards/sqlite senza write-behind"
+        )
+    if fcntl is None:
+        return
+    fd = os.open(str(SINGLE_WORKER_LOCK), os.O_RDWR | os.O_CREAT, 0o644)
+    try:
+        fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        os.close(fd)
+        raise RuntimeError(
+            f"{mode} funziona con un solo worker, ma un altro processo sta già usando {BASE_DIR}"
+        ) from None
+    _SINGLE_FD = fd
+
+
+@contextmanager
+def locked():
+    """Sezione critica tra thread (RLock) e tra processi (flock su LOCK_FILE)."""
+    global _LOCK_FD, _LOCK_DEPTH
+    with _IO_LOCK:
+        if _LOCK_DEPTH == 0 and fcntl is not None:
+            if _LOCK_FD is None:
+                BASE_DIR.mkdir(parents=True, exist_ok=True)
+                _LOCK_FD = os.open(str(LOCK_FILE), os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(_LOCK_FD, fcntl.LOCK_EX)
+        _LOCK_DEPTH += 1
+        try:
+            if _LOCK_DEPTH == 1:
+                _sync_with_disk(exact=True)
+            yield
+        finally:
+            _LOCK_DEPTH -= 1
+            if _LOCK_DEPTH == 0 and fcntl is not None and _LOCK_FD is not None:
+                fcntl.flock(_LOCK_FD, fcntl.LOCK_UN)
+
+
+@contextmanager
+def book_locked(book_id: str):
+    """
+    Lock di un singolo libro (RLock per i thread + flock su locks/<libro>.lock
+    per i worker). Ordine dei lock: prima il libro, poi eventualmente locked().
+    """
+    bid = str(book_id).strip()
+    with _BOOK_LOCKS_GUARD:
+        lk = _BOOK_LOCKS.setdefault(bid, threading.RLock())
+    with lk:
+        held = _BOOK_HELD.__dict__.setdefault("depth", {})
+        depth = held.get(bid, 0)
+        fd = None
+        if depth == 0 and fcntl is not None:
+            LOCKS_DIR.mkdir(parents=True, exist_ok=True)
+            fd = os.open(str(LOCKS_DIR / (_shard_path(bid).stem + ".lock")), os.O_RDWR | os.O_CREAT, 0o644)
+            fcntl.flock(fd, fcntl.LOCK_EX)
+        held[bid] = depth + 1
+        try:
+            if depth == 0:
+                _sync_with_disk(exact=True)
+            yield
+        finally:
+            held[bid] -= 1
+            if not held[bid]:
+                del held[bid]
+            if fd is not None:
+                fcntl.flock(fd, fcntl.LOCK_UN)
+                os.close(fd)
+
+
+def _read_generation() -> Dict[str, Any]:
+    try:
+        data = json.loads(GENERATION_JSON.read_text(encoding="utf-8"))
+        if isinstance(data, dict) and isinstance(data.get("gen"), int):
+            return data
+    except Exception:
+        pass
+    return {"gen": 0, "changes": []}
+
+
+def _stat_key(path: Path) -> Optional[tuple]:
+    try:
+        st = os.stat(path)
+    except FileNotFoundError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _committed(book_id: Optional[str], kind: str = "put") -> None:
+    """Da chiamare sotto locked() dopo una scrittura: incrementa la generazione su disco."""
+    global _SEEN_GEN, _GEN_STAT
+    data = _read_generation()
+    gen = data["gen"] + 1
+    changes = list(data.get("changes") or [])[-(_GEN_CHANGES_KEEP - 1):]
+    changes.append([gen, book_id, kind])
+    _atomic_write(GENERATION_JSON, json.dumps({"gen": gen, "changes": changes}, ensure_ascii=False), durable=False)
+    _SEEN_GEN = gen
+    _GEN_STAT = _stat_key(GENERATION_JSON)
+    _record_changes([(gen, book_id, kind)])
+    _maybe_collect_blobs()
+
+
+def _sync_with_disk(exact: bool = False) -> None:
+    """
+    Se un altro processo ha scritto, aggiorna la cache (solo i libri toccati, se possibile).
+    Le letture senza lock usano la scorciatoia dello stat (inode, mtime, size), che però
+    può non cambiare: il file è sostituito con rename (inode riusati), l'mtime avanza a
+    tick del kernel e la dimensione spesso resta uguale. Sotto lock (exact=True), prima
+    di un read-modify-write, il numero di generazione si legge sempre dal file.
+    """
+    global _SEEN_GEN, _GEN_STAT
+    if REPO is None:
+        return
+    key = _stat_key(GENERATION_JSON)
+    if not exact and (key is None or key == _GEN_STAT):
+        return
+    with _IO_LOCK:
+        if not exact and key == _GEN_STAT:
+            return
+        data = _read_generation()
+        _GEN_STAT = key
+        gen = data["gen"]
+        if gen == _SEEN_GEN:
+            return
+        changes = [c for c in data.get("changes") or [] if c[0] > _SEEN_GEN]
+        store = _store()
+        incremental = (
+            gen > _SEEN_GEN
+            and changes and changes[0][0] == _SEEN_GEN + 1
+            and all(c[2] in ("put", "create", "delete") and c[1] for c in changes)
+            and hasattr(store, "load_one")
+        )
+        if incremental:
+            # in ordine: i "create" vengono accodati come nel manifest
+            for bid in dict.fromkeys(c[1] for c in changes):
+                fresh = store.load_one(bid)
+                if fresh is None:
+                    REPO.remove(bid)
+                else:
+                    REPO.upsert(fresh)
+        else:
+            _set_cache(store.load())
+        _SEEN_GEN = gen
+        _record_changes([tuple(c) for c in changes] if incremental else [(gen, None, "reload")])
+
+
+# ─────────────────────────────────────────────────────────
+# Feed delle modifiche (GET /books/changes)
+#   La revisione è la generazione su disco: monotona e uguale in
+#   tutti i worker. Il ring buffer tiene le ultime modifiche viste
+#   da questo processo (proprie e degli altri worker); chi chiede
+#   un `since` più vecchio riceve uno snapshot completo.
+#   Con il write-behind una modifica entra nel feed al flush.
+# ─────────────────────────────────────────────────────────
+CHANGES_KEEP = _env_int("STORAGE_CHANGES_KEEP", 1024)
+
+_CHANGES: Deque[Tuple[int, Optional[str], str]] = deque(maxlen=CHANGES_KEEP)
+_CHANGES_COND = threading.Condition()
+
+# callback(book_id, kind) per ogni modifica registrata (es. indice di ricerca).
+# Vengono chiamate sotto i lock di storage: devono solo annotare, non lavorare.
+_LISTENERS: List[Callable[[Optional[str], str], None]] = []
+
+
+def add_change_listener(fn: Callable[[Optional[str], str], None]) -> None:
+    if fn not in _LISTENERS:
+        _LISTENERS.append(fn)
+
+
+def _notify(entries: List[tuple]) -> None:
+    for fn in _LISTENERS:
+        for _, bid, kind in entries:
+            try:
+                fn(bid, kind)
+            except Exception as e:
+                print(f"⚠️  Listener modifiche fallito: {e}")
+
+
+def _record_changes(entries: List[tuple]) -> None:
+    fresh = []
+    with _CHANGES_COND:
+        for gen, bid, kind in entries:
+            if not _CHANGES or gen > _CHANGES[-1][0]:
+                _CHANGES.append((gen, bid, kind))
+                fresh.append((gen, bid, kind))
+        _CHANGES_COND.notify_all()
+    _notify(fresh)
+
+
+def revision() -> int:
+    """Revisione corrente della libreria (dopo il riallineamento con gli altri worker)."""
+    repository()
+    return _SEEN_GEN
+
+
+def changes_since(since: int) -> Optional[Dict[str, Any]]:
+    """
+    {"revision", "changed": [book_id], "deleted": [book_id]} dalle modifiche dopo `since`,
+    oppure None se il ring buffer non copre più `since` (serve uno snapshot).
+    """
+    repo = repository()
+    rev = _SEEN_GEN
+    if since == rev:
+        return {"revision": rev, "changed": [], "deleted": []}
+    with _CHANGES_COND:
+        entries = [c for c in _CHANGES if c[0] > since]
+        covered = since < rev and bool(_CHANGES) and _CHANGES[0][0] <= since + 1
+    if not covered or any(kind == "reload" or not bid for _, bid, kind in entries):
+        return None
+    changed: List[str] = []
+    deleted: List[str] = []
+    for bid in dict.fromkeys(bid for _, bid, _ in entries):
+        (changed if repo.get(bid) is not None else deleted).append(bid)
+    return {"revision": rev, "changed": changed, "deleted": deleted}
+
+
+def wait_for_change(since: int, timeout: float) -> int:
+    """Long-poll: ritorna appena la revisione supera `since` (o allo scadere del timeout)."""
+    deadline = time.monotonic() + max(timeout, 0.0)
+    while True:
+        rev = revision()
+        left = deadline - time.monotonic()
+        if rev != since or left <= 0:
+            return rev
+        with _CHANGES_COND:
+            # risveglio immediato per le scritture locali; ogni 0.5s controlla gli altri worker
+            _CHANGES_COND.wait(min(left, 0.5))
+
+
+# ─────────────────────────────────────────────────────────
+# API pubblica
+# ─────────────────────────────────────────────────────────
+def _set_cache(books: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    global BOOKS_CACHE, REPO
+    BOOKS_CACHE = books
+    REPO = BookRepository(books)
+    return books
+
+
+def repository() -> BookRepository:
+    """Repository indicizzato della libreria (caricato al primo uso, riallineato con gli altri worker)."""
+    if REPO is None or REPO.books is not BOOKS_CACHE:
+        _set_cache(load_books())
+    else:
+        _sync_with_disk()
+    return REPO
+
+
+def _load_from_store() -> List[Dict[str, Any]]:
+    global _SEEN_GEN, _GEN_STAT
+    _claim_single_worker()
+    with locked():
+        _GEN_STAT = _stat_key(GENERATION_JSON)
+        data = _read_generation()
+        _SEEN_GEN = data["gen"]
+        with _CHANGES_COND:
+            _CHANGES.clear()
+            _CHANGES.extend(tuple(c) for c in data.get("changes") or [] if c[0] <= _SEEN_GEN)
+        _notify([(_SEEN_GEN, None, "reload")])
+        books = _store().load()
+        migrated = False
+        for b in books:
+            # migrazione una tantum dei testi inline verso i blob
+            if _externalize_bodies(b):
+                _store().put_book(b, books, is_new=False)
+                migrated = True
+        if migrated:
+            _committed(None, "reload")
+    return books
 
 
 def load_books() -> List[Dict[str, Any]]:
     """Carica i libri (usa la cache se presente)."""
-    global BOOKS_CACHE
     if BOOKS_CACHE is not None:
         return BOOKS_CACHE
     ensure_dirs()
-    try:
-        data = json.loads(BOOKS_JSON.read_text(encoding="utf-8"))
-        BOOKS_CACHE = data if isinstance(data, list) else []
-    except Exception:
-        BOOKS_CACHE = []
-    return BOOKS_CACHE
+    return _set_cache(_load_from_store())
 
 
 def save_books(books: List[Dict[str, Any]]) -> None:
-    """Salva i libri su disco e aggiorna la cache."""
-    global BOOKS_CACHE
-    BOOKS_CACHE = books
+    """Riscrive l'intera libreria e aggiorna la cache."""
     ensure_dirs()
-    BOOKS_JSON.write_text(
-        json.dumps(books, ensure_ascii=False, indent=2),
-        encoding="utf-8",
-    )
+    with _DIRTY_LOCK:
+        _DIRTY.clear()
+    with locked():
+        for b in books:
+            _externalize_bodies(b)
+        _set_cache(books)
+        _store().save_all(books)
+        _committed(None, "reload")
 
 def delete_book(book_id: str) -> bool:
     """Rimuove un libro per id. Ritorna True se ha eliminato, False se non trovato."""
-    books = load_books()
-    new_books = [b for b in books if (b.get("id") or b.get("book_id")) != book_id]
-    if len(new_books) == len(books):
-        return False
-    save_books(new_books)
+    bid = str(book_id).strip()
+    with book_locked(bid), locked():
+        if repository().remove(bid) is None:
+            return False
+        with _DIRTY_LOCK:
+            _DIRTY.pop(bid, None)
+        _store().delete_book(bid, BOOKS_CACHE)
+        _committed(bid, "delete")
+    with _BOOK_LOCKS_GUARD:
+        _BOOK_LOCKS.pop(bid, None)
     return True
 
 # ====== SHIM di compatibilità per vecchi router (safe) ======
 def load_books_from_disk() -> List[Dict[str, Any]]:
     """Legacy alias: rilegge sempre da disco e aggiorna la cache."""
     ensure_dirs()
-    try:
-        data = json.loads(BOOKS_JSON.read_text(encoding="utf-8"))
-        data = data if isinstance(data, list) else []
-    except Exception:
-        data = []
-    global BOOKS_CACHE
-    BOOKS_CACHE = data
-    return BOOKS_CACHE
+    return _set_cache(_load_from_store())
 
 def save_books_to_disk(books: List[Dict[str, Any]]) -> None:
     """Legacy alias."""
@@ -80,46 +884,65 @@ def save_books_to_disk(books: List[Dict[str, Any]]) -> None:
 
 def find_book(book_id: str) -> Optional[Dict[str, Any]]:
     """Trova un libro accettando sia 'id' sia 'book_id' (string match, trim)."""
-    bid = str(book_id).strip()
-    for b in load_books():
-        cur = str(b.get("id") or b.get("book_id") or "").strip()
-        if cur == bid:
-            return b
-    return None
+    return repository().get(book_id)
 
 
 def persist_book(book: Dict[str, Any]) -> None:
-    books = load_books()
-    target = str(book.get("id") or book.get("book_id") or "").strip()
-    for i, b in enumerate(books):
-        cur = str(b.get("id") or b.get("book_id") or "").strip()
-        if cur == target and cur:
-            books[i] = book
-            save_books(books)
+    """
+    Salva un solo libro (shard o record di journal, a seconda del backend).
+    La scrittura avviene col solo lock del libro; il lock globale serve
+    soltanto se il libro è nuovo (manifest) e per il contatore di generazione.
+    """
+    ensure_dirs()
+    bid = _book_id(book)
+    with book_locked(bid):
+        repo = repository()
+        if bid and repo.get(bid) is book:
+            repo.index_chapters(book)
+            is_new = False
+        else:
+            with locked():
+                is_new = repo.upsert(book)
+                if is_new:
+                    _externalize_live(book)
+                    _store().put_book(book, repo.books, is_new=True)
+                    _committed(bid or None, "create")
+                    return
+        if WRITE_BEHIND_MS > 0 and bid:
+            _mark_dirty(bid)
             return
-    books.append(book)
-    save_books(books)
+        _externalize_live(book)
+        _store().put_book(book, repo.books, is_new=False)
+        with locked():
+            _committed(bid or None, "put")
+
+
+@contextmanager
+def edit_book(book_id: str):
+    """
+    Read-modify-write di un libro sotto il suo lock (anche tra worker):
+        with storage.edit_book(bid) as b: ...
+    Produce None se il libro non esiste; salva all'uscita se non ci sono eccezioni.
+    """
+    with book_locked(book_id):
+        book = find_book(book_id)
+        yield book
+        if book is not None:
+            persist_book(book)
 
 
 def reorder_chapters(book_id: str, ordered_ids: List[str]) -> Dict[str, Any]:
     """Riordina i capitoli mantenendo eventuali 'orfani' in coda."""
-    book = find_book(book_id)
-    if not book:
-        raise ValueError("Libro non trovato")
-    chapters = book.get("chapters", [])
-    by_id = {c.get("id"): c for c in chapters if c.get("id")}
-    new_list: List[Dict[str, Any]] = []
-    seen = set()
-
-    for cid in ordered_ids:
-        if cid in by_id and cid not in seen:
-            new_list.append(by_id[cid]); seen.add(cid)
-
-    for c in chapters:
-        cid = c.get("id")
-        if cid and cid not in seen:
-            new_list.append(c); seen.add(cid)
-
-    book["chapters"] = new_list
-    persist_book(book)
+    ensure_dirs()
+    with book_locked(book_id):
+        book = find_book(book_id)
+        if not book:
+            raise ValueError("Libro non trovato")
+        repository().reorder_chapters(book, ordered_ids)
+        if WRITE_BEHIND_MS > 0:
+            _mark_dirty(_book_id(book))
+            return book
+        _store().reorder(book, [c.get("id") for c in book["chapters"]])
+        with locked():
+            _committed(_book_id(book), "put")
     return book
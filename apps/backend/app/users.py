@@ -1,16 +1,34 @@
 # apps/backend/app/users.py
 from __future__ import annotations
 
-from typing import Dict, Any, Optional, List
+from typing import Dict, Any, Callable, Optional, List, TypeVar
 import json
+import os
 
 from . import storage
 
+T = TypeVar("T")
+
 # In-memory “DB”
 USERS: Dict[str, Dict[str, Any]] = {}         # key: user_id
 USERS_BY_KEY: Dict[str, Dict[str, Any]] = {}  # key: api_key -> user
 
 _USERS_PATH = storage.file_path("admin/users.json")
+_USERS_STAT: Optional[tuple] = None  # (inode, mtime_ns, size) dell'ultimo load/save
+
+
+def _stat_users() -> Optional[tuple]:
+    try:
+        st = os.stat(_USERS_PATH)
+    except OSError:
+        return None
+    return (st.st_ino, st.st_mtime_ns, st.st_size)
+
+
+def _refresh_if_changed() -> None:
+    """Con più worker: se un altro processo ha salvato users.json, ricarica."""
+    if _stat_users() != _USERS_STAT:
+        load_users()
 
 
 def _rebuild_indexes() -> None:
@@ -23,61 +41,68 @@ def _rebuild_indexes() -> None:
             USERS_BY_KEY[k] = u
 
 
+def _read_users() -> Dict[str, Dict[str, Any]]:
+    path = _USERS_PATH
+    if not path.exists():
+        return {}
+    data = json.loads(path.read_text(encoding="utf-8") or "{}")
+    if not isinstance(data, dict):
+        raise ValueError("users.json non è un oggetto")
+    return data
+
+
 def load_users() -> None:
     """Carica gli utenti da disco in USERS / USERS_BY_KEY."""
-    global USERS
+    global USERS, _USERS_STAT
+    _USERS_STAT = _stat_users()
     try:
-        path = _USERS_PATH
-        if path.exists():
-            data = json.loads(path.read_text(encoding="utf-8") or "{}")
-            if isinstance(data, dict):
-                USERS = data
-                _rebuild_indexes()
-                return
+        USERS = _read_users()
     except Exception:
-        pass
-    USERS = {}
+        USERS = {}
     _rebuild_indexes()
 
 
-def save_users() -> None:
-    """Salva USERS su disco (atomico)."""
-    try:
-        path = _USERS_PATH
-        path.parent.mkdir(parents=True, exist_ok=True)
-        tmp = path.with_suffix(".tmp")
-        tmp.write_text(json.dumps(USERS, ensure_ascii=False, indent=2), encoding="utf-8")
+def update_users(mutate: Callable[[Dict[str, Dict[str, Any]]], T]) -> T:
+    """
+    Read-modify-write di users.json sotto il lock condiviso tra worker: rilegge
+    il file, applica mutate(users) alla copia appena letta e salva (atomico).
+    Se mutate solleva un'eccezione (es. HTTPException 409) non si scrive nulla.
+    """
+    global USERS, _USERS_STAT
+    path = _USERS_PATH
+    path.parent.mkdir(parents=True, exist_ok=True)
+    with storage.locked():
+        # sempre riletto: lo stat può non cambiare anche se il file è cambiato (come per la generazione)
+        users = _read_users()
+        result = mutate(users)
+        tmp = path.with_name(f"{path.stem}.{os.getpid()}.tmp")
+        tmp.write_text(json.dumps(users, ensure_ascii=False, indent=2), encoding="utf-8")
         tmp.replace(path)
-    except Exception as e:
-        print(f"⚠️  Impossibile salvare users.json: {e}")
+        USERS = users
+        _USERS_STAT = _stat_users()
+        _rebuild_indexes()
+    return result
 
 
 def get_user_by_api_key(api_key: str) -> Optional[Dict[str, Any]]:
     if not api_key:
         return None
+    _refresh_if_changed()
     return USERS_BY_KEY.get(api_key.strip())
 
 
 def list_users() -> List[Dict[str, Any]]:
+    _refresh_if_changed()
     return list(USERS.values())
 
 
-def _put_user(u: Dict[str, Any]) -> Dict[str, Any]:
-    """Inserisce/Aggiorna utente nel DB in-memory e ricostruisce gli indici."""
-    uid = u.get("id")
-    if not uid:
-        raise ValueError("user.id mancante")
-    USERS[str(uid)] = u
-    _rebuild_indexes()
-    return u
-
-
 def seed_demo_users() -> None:
     """
     Semina alcuni utenti di esempio.
     - OWNER_FULL: può usare /admin/*
     - USER: piano START
     """
+    _refresh_if_changed()
     if USERS:
         return
 
@@ -97,6 +122,12 @@ def seed_demo_users() -> None:
         "status": "ACTIVE",
         "api_key": "demo_key_user",
     }
-    _put_user(owner)
-    _put_user(user)
-    save_users()
+
+    def seed(users: Dict[str, Dict[str, Any]]) -> None:
+        if not users:           # un altro worker può averli già creati
+            users.update({owner["id"]: owner, user["id"]: user})
+
+    try:
+        update_users(seed)
+    except Exception as e:
+        print(f"⚠️  Impossibile salvare users.json: {e}")
@@ -0,0 +1,81 @@
+# apps/backend/bench/bench_response_cache.py
+"""
+Richieste/secondo sui GET caldi di un libro da 200 capitoli, con e senza response_cache.
+
+    cd apps/backend && python bench/bench_response_cache.py [--requests 1000]
+
+"senza cache" ripristina il percorso precedente (jsonable_encoder + JSONResponse
+a ogni richiesta) sostituendo response_cache.json_response; tutto il resto
+(ETag, compressione, routing) resta quello vero. Client: TestClient in-process,
+richieste sequenziali.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+os.environ.setdefault("STORAGE_ROOT", tempfile.mkdtemp(prefix="bench-response-cache-"))
+os.environ.setdefault("EXPORT_WORKERS", "0")
+sys.path.insert(0, str(BACKEND_DIR))
+
+from fastapi.encoders import jsonable_encoder  # noqa: E402
+from fastapi.responses import JSONResponse  # noqa: E402
+from fastapi.testclient import TestClient  # noqa: E402
+
+from app import response_cache, storage  # noqa: E402
+from app.http_cache import cache_headers  # noqa: E402
+from app.main import app  # noqa: E402
+
+URLS = ("/api/v1/books/bench", "/api/v1/books/bench/chapters")
+ENCODINGS = ("identity", "gzip")
+
+
+def _uncached(request, key, etag, build):
+    return JSONResponse(jsonable_encoder(build()), headers=cache_headers(etag, {"Vary": "Accept-Encoding"}))
+
+
+def _seed() -> None:
+    chapters = [
+        {"id": f"ch_{i:04d}", "title": f"Capitolo {i}", "content": "parola " * 1500,
+         "language": "it", "updated_at": "2026-01-01T00:00:00"}
+        for i in range(1, 201)
+    ]
+    storage.persist_book({"id": "bench", "title": "Bench", "author": "Autore", "chapters": chapters})
+
+
+def _rps(client: TestClient, url: str, encoding: str, n: int) -> float:
+    headers = {"Accept-Encoding": encoding}
+    client.get(url, headers=headers)
+    t0 = time.perf_counter()
+    for _ in range(n):
+        r = client.get(url, headers=headers)
+        assert r.status_code == 200
+    return n / (time.perf_counter() - t0)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--requests", type=int, default=1000)
+    args = ap.parse_args()
+
+    _seed()
+    cached = response_cache.json_response
+    print(f"{'endpoint':32s} {'encoding':9s} {'senza cache':>12s} {'con cache':>10s}")
+    with TestClient(app) as client:
+        for url in URLS:
+            for encoding in ENCODINGS:
+                response_cache.json_response = _uncached
+                before = _rps(client, url, encoding, args.requests)
+                response_cache.json_response = cached
+                response_cache.clear()
+                after = _rps(client, url, encoding, args.requests)
+                print(f"{url:32s} {encoding:9s} {before:9.0f} r/s {after:7.0f} r/s", flush=True)
+
+
+if __name__ == "__main__":
+    main()
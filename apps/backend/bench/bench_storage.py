@@ -0,0 +1,134 @@
+# apps/backend/bench/bench_storage.py
+"""
+Confronto dei backend di storage (shards, journal, sqlite) a 100 / 1.000 / 10.000 libri.
+
+    cd apps/backend && python bench/bench_storage.py [--sizes 100,1000,10000] [--backends shards,journal,sqlite]
+
+Ogni combinazione gira in un processo separato con uno STORAGE_ROOT temporaneo
+(storage.py legge la configurazione all'import). Misure:
+  seed    → save_books dell'intera libreria
+  load    → avvio a freddo (load_books da disco)
+  update  → edit_book di un capitolo di un libro a caso (media, p95)
+  find    → find_book per id (media)
+  disk    → byte occupati (esclusi i blob dei capitoli, uguali per tutti)
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+CHAPTERS = 5
+UPDATES = 300
+FINDS = 20000
+
+
+def _library(n: int):
+    return [
+        {
+            "id": f"book-{i:05d}",
+            "title": f"Libro {i}",
+            "author": "Autore",
+            "language": "it",
+            "chapters": [
+                {"id": f"ch_{j:04d}", "title": f"Capitolo {j}", "content": f"Libro {i}, capitolo {j}. " * 40}
+                for j in range(1, CHAPTERS + 1)
+            ],
+        }
+        for i in range(n)
+    ]
+
+
+def _disk_bytes(root: Path) -> int:
+    total = 0
+    for p in root.rglob("*"):
+        if p.is_file() and "blobs" not in p.parts:
+            total += p.stat().st_size
+    return total
+
+
+def run_case(backend: str, n: int) -> dict:
+    """Eseguita nel processo figlio (env già impostato)."""
+    sys.path.insert(0, str(BACKEND_DIR))
+    from app import storage
+
+    storage.ensure_dirs()
+    books = _library(n)
+    t0 = time.perf_counter()
+    storage.save_books(books)
+    storage.close()
+    seed = time.perf_counter() - t0
+
+    storage.BOOKS_CACHE = None
+    storage.REPO = None
+    t0 = time.perf_counter()
+    storage.load_books()
+    load = time.perf_counter() - t0
+
+    rnd = random.Random(n)
+    times = []
+    for k in range(UPDATES):
+        bid = f"book-{rnd.randrange(n):05d}"
+        t0 = time.perf_counter()
+        with storage.edit_book(bid) as b:
+            b["chapters"][rnd.randrange(CHAPTERS)]["content"] = f"modifica {k} " * 40
+        times.append(time.perf_counter() - t0)
+
+    ids = [f"book-{rnd.randrange(n):05d}" for _ in range(FINDS)]
+    t0 = time.perf_counter()
+    for bid in ids:
+        storage.find_book(bid)
+    find = (time.perf_counter() - t0) / FINDS
+    storage.close()
+
+    times.sort()
+    return {
+        "backend": backend,
+        "books": n,
+        "seed_s": seed,
+        "load_s": load,
+        "update_ms": statistics.mean(times) * 1000,
+        "update_p95_ms": times[int(len(times) * 0.95) - 1] * 1000,
+        "find_us": find * 1e6,
+        "disk_kb": _disk_bytes(Path(os.environ["STORAGE_ROOT"])) / 1024,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--sizes", default="100,1000,10000")
+    ap.add_argument("--backends", default="shards,journal,sqlite")
+    ap.add_argument("--case", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.case:
+        backend, n = args.case.split(":")
+        print(json.dumps(run_case(backend, int(n))))
+        return
+
+    print(f"{'backend':8s} {'libri':>6s} {'seed s':>8s} {'load s':>8s} {'update ms':>10s} {'p95 ms':>8s} "
+          f"{'find µs':>8s} {'disco KB':>9s}")
+    for n in (int(x) for x in args.sizes.split(",")):
+        for backend in args.backends.split(","):
+            with tempfile.TemporaryDirectory(prefix="bench-storage-") as root:
+                env = {**os.environ, "STORAGE_ROOT": root, "STORAGE_BACKEND": backend,
+                       "STORAGE_WRITE_BEHIND_MS": "0", "STORAGE_BLOB_GC_S": "0"}
+                out = subprocess.run(
+                    [sys.executable, __file__, "--case", f"{backend}:{n}"],
+                    env=env, check=True, capture_output=True, text=True,
+                ).stdout
+            r = json.loads(out.strip().splitlines()[-1])
+            print(f"{r['backend']:8s} {r['books']:6d} {r['seed_s']:8.2f} {r['load_s']:8.3f} {r['update_ms']:10.2f} "
+                  f"{r['update_p95_ms']:8.2f} {r['find_us']:8.2f} {r['disk_kb']:9.0f}", flush=True)
+
+
+if __name__ == "__main__":
+    main()
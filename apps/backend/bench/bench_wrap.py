@@ -0,0 +1,118 @@
+# apps/backend/bench/bench_wrap.py
+"""
+Wrapping del testo su un libro da 100.000 parole: motore lineare (_break_words)
+contro l'implementazione quadratica precedente, con verifica che le righe coincidano.
+
+    cd apps/backend && python bench/bench_wrap.py [--words 100000]
+
+Esce con codice 1 se una qualsiasi riga differisce.
+"""
+from __future__ import annotations
+
+import argparse
+import random
+import sys
+import time
+from io import BytesIO
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+from PIL import Image, ImageDraw  # noqa: E402
+from reportlab.pdfgen import canvas  # noqa: E402
+
+from app.routers import books_export  # noqa: E402
+
+VOCAB = (
+    "l'amore è più forte della morte, disse lei; poi tacque. Nel mezzo del cammin di nostra vita "
+    "mi ritrovai per una selva oscura perché la diritta via era smarrita — WAVE VAT «citazione» "
+    "12.345,67€ supercalifragilistichespiralidoso " + "x" * 90
+).split(" ")
+ODD = ["", "\tTab", "fine\t", " ", " nbsp"]
+
+
+# ---------- implementazione precedente (riferimento) ----------
+def old_wrap_text(text, canv, max_w, font_name, font_size):
+    out = []
+    for raw_line in (text or "").splitlines():
+        line = ""
+        for w in raw_line.split(" "):
+            trial = (line + " " + w).strip()
+            if canv.stringWidth(trial, font_name, font_size) <= max_w:
+                line = trial
+            else:
+                if line:
+                    out.append(line)
+                line = w
+        out.append(line)
+    return out
+
+
+def old_wrap_text_pil(draw, text, font, max_w):
+    lines, cur = [], ""
+    for word in (text or "").split():
+        trial = (cur + " " + word).strip()
+        if draw.textlength(trial, font=font) <= max_w:
+            cur = trial
+        else:
+            if cur:
+                lines.append(cur)
+            cur = word
+    if cur:
+        lines.append(cur)
+    return "\n".join(lines).splitlines()
+
+
+def make_book(words: int, seed: int = 1) -> str:
+    """Paragrafi di lunghezza variabile, con qualche tab/spazio/parola vuota ai bordi."""
+    rnd = random.Random(seed)
+    paras, n = [], 0
+    while n < words:
+        k = rnd.randint(5, 400)
+        n += k
+        ws = [rnd.choice(VOCAB) for _ in range(k)]
+        if rnd.random() < 0.05:
+            ws.insert(rnd.randint(0, k), rnd.choice(ODD))
+        paras.append(" ".join(ws))
+    return "\n".join(paras)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--words", type=int, default=100_000)
+    ap.add_argument("--titles", type=int, default=500)
+    args = ap.parse_args()
+
+    books_export._ensure_fonts()
+    c = canvas.Canvas(BytesIO())
+    text = make_book(args.words)
+    ok = True
+    print(f"{'font':16s} {'pt':>3s} {'righe':>7s} {'prima s':>8s} {'dopo s':>7s}  identiche")
+    for font, size, width in ((books_export._BODY_FONT, 11, 453.5),
+                              (books_export._BODY_FONT_BOLD, 16, 300.0),
+                              ("Helvetica", 11, 250.0)):
+        books_export._WIDTHS.clear()         # misura a freddo: nessuna larghezza già in cache
+        t0 = time.perf_counter()
+        before = old_wrap_text(text, c, width, font, size)
+        t_old = time.perf_counter() - t0
+        t0 = time.perf_counter()
+        after = books_export._wrap_text(text, c, width, font, size)
+        t_new = time.perf_counter() - t0
+        same = before == after
+        ok &= same
+        print(f"{font:16s} {size:3d} {len(after):7d} {t_old:8.2f} {t_new:7.3f}  {same}", flush=True)
+
+    draw = ImageDraw.Draw(Image.new("RGB", (10, 10)))
+    font = books_export._load_font(96, bold=True)
+    rnd = random.Random(2)
+    titles = [" ".join(rnd.choice(VOCAB) for _ in range(rnd.randint(1, 12))) for _ in range(args.titles)]
+    same = all(old_wrap_text_pil(draw, t, font, 1500) == books_export._wrap_text_pil(draw, t, font, 1500)
+               for t in titles)
+    ok &= same
+    print(f"copertine PIL: {len(titles)} titoli, identiche {same}")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,16 @@
+# apps/backend/tests/conftest.py
+import atexit
+import os
+import shutil
+import sys
+import tempfile
+from pathlib import Path
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+sys.path.insert(0, str(BACKEND_DIR))
+
+# storage.py legge STORAGE_ROOT all'import: i test non devono mai toccare i dati veri
+if "STORAGE_ROOT" not in os.environ:
+    os.environ["STORAGE_ROOT"] = tempfile.mkdtemp(prefix="eccomibook-tests-")
+    atexit.register(shutil.rmtree, os.environ["STORAGE_ROOT"], True)
+os.environ.setdefault("EXPORT_WORKERS", "0")
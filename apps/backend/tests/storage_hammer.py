@@ -0,0 +1,56 @@
+# apps/backend/tests/storage_hammer.py
+"""
+Processo "worker" per i test di concorrenza: N thread che fanno edit_book sugli
+stessi libri. Uso: python storage_hammer.py <threads> <edits> <book_id> [<book_id> ...]
+(STORAGE_ROOT / STORAGE_BACKEND dall'ambiente, come un worker uvicorn).
+Ogni modifica incrementa un contatore e aggiunge un capitolo: se una modifica
+si perde, i conti non tornano.
+"""
+import os
+import random
+import sys
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from app import storage  # noqa: E402
+
+
+def hammer(tag: str, edits: int, book_ids, seed: int) -> None:
+    rnd = random.Random(seed)
+    repo = storage.repository
+    for i in range(edits):
+        bid = rnd.choice(book_ids)
+        with storage.edit_book(bid) as b:
+            seen = b.get("counter", 0)
+            time.sleep(0)                # cede il GIL a metà del read-modify-write
+            b["counter"] = seen + 1
+            op = rnd.random()
+            if op < 0.15 and len(b["chapters"]) > 1:
+                # riordino: non cambia il numero di capitoli
+                repo().reorder_chapters(b, [c["id"] for c in reversed(b["chapters"])])
+            elif op < 0.3 and b["chapters"]:
+                b["chapters"][-1]["title"] = f"{tag} {i}"
+            repo().add_chapter(b, {"id": repo().next_chapter_id(b), "title": f"{tag}-{i}", "content": f"{tag} {i}"})
+        storage.find_book(bid)           # lettura senza lock, come le GET
+
+
+def main() -> None:
+    threads, edits = int(sys.argv[1]), int(sys.argv[2])
+    book_ids = sys.argv[3:]
+    storage.load_books()
+    ts = [
+        threading.Thread(target=hammer, args=(f"{os.getpid()}.{t}", edits, book_ids, os.getpid() * 100 + t))
+        for t in range(threads)
+    ]
+    for t in ts:
+        t.start()
+    for t in ts:
+        t.join()
+    storage.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,29 @@
+# apps/backend/tests/test_batch.py
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import storage
+from app.main import app
+
+
+@pytest.fixture()
+def book_id():
+    bid = f"batch-{uuid.uuid4().hex[:8]}"
+    storage.persist_book({"id": bid, "title": "t", "chapters": []})
+    return bid
+
+
+@pytest.mark.parametrize("route", ["book", "library"])
+def test_invalid_update_book_fields_are_422(book_id, route):
+    client = TestClient(app)
+    ops = [{"op": "create_chapter", "title": "x"}, {"op": "update_book", "fields": {"title": 123}}]
+    if route == "book":
+        r = client.post(f"/api/v1/books/{book_id}/batch", json={"ops": ops})
+    else:
+        r = client.post("/api/v1/books/batch", json={"ops": [{**op, "book_id": book_id} for op in ops]})
+    assert r.status_code == 422
+    assert r.json()["detail"].startswith("Operazione 1 (update_book): ")
+    assert "title" in r.json()["detail"]
+    assert storage.find_book(book_id)["chapters"] == []      # tutto o niente
@@ -0,0 +1,58 @@
+# apps/backend/tests/test_blobs.py
+import uuid
+
+from app import storage
+
+
+def _blobs():
+    return sorted(p.name for p in storage.BLOBS_DIR.rglob("*") if p.is_file() and not p.name.startswith("."))
+
+
+def _hash(book_id, i=0):
+    return storage.find_book(book_id)["chapters"][i]["content_hash"]
+
+
+def test_autosaves_leave_only_referenced_blobs():
+    bid = f"gc-{uuid.uuid4().hex[:8]}"
+    storage.persist_book({"id": bid, "title": "gc", "chapters": [
+        {"id": "ch_0001", "content": "condiviso " * 10},
+        {"id": "ch_0002", "content": "x"},
+    ]})
+    for i in range(50):
+        with storage.edit_book(bid) as b:
+            b["chapters"][1]["content"] = f"autosave {i} " + "testo " * 12000
+    storage.collect_blobs(grace_s=0)
+
+    live = {_hash(bid, 0), _hash(bid, 1)}
+    left = {name.split(".", 1)[0] for name in _blobs()}
+    assert live <= left
+    # altri test possono avere blob propri ancora referenziati, ma non quelli intermedi di questo libro
+    assert not {f"autosave {i} " for i in range(49)} & {storage.read_chapter_body(h)[:11] for h in left}
+    assert storage.chapter_body(storage.find_book(bid)["chapters"][1]).startswith("autosave 49 ")
+
+
+def test_grace_period_protects_fresh_blobs():
+    orphan = storage.put_chapter_body(f"appena scritto {uuid.uuid4()}")["content_hash"]
+    storage.collect_blobs()                       # grazia di default: il blob resta
+    assert storage.read_chapter_body(orphan).startswith("appena scritto")
+    storage.collect_blobs(grace_s=0)
+    assert not storage._blob_path(orphan).exists()
+
+
+def test_shared_blob_survives_deletion_of_one_book():
+    text = f"testo condiviso {uuid.uuid4()}"
+    a, b = f"gc-a-{uuid.uuid4().hex[:6]}", f"gc-b-{uuid.uuid4().hex[:6]}"
+    for bid in (a, b):
+        storage.persist_book({"id": bid, "title": bid, "chapters": [{"id": "ch_0001", "content": text}]})
+    h = _hash(a)
+    storage.delete_book(a)
+    storage.collect_blobs(grace_s=0)
+    assert storage.read_chapter_body(h) == text
+    storage.delete_book(b)
+    storage.collect_blobs(grace_s=0)
+    assert not storage._blob_path(h).exists()
+
+
+def test_missing_blob_is_reported(capsys):
+    assert storage.read_chapter_body("0" * 64) == ""
+    assert "0" * 64 in capsys.readouterr().out
@@ -0,0 +1,61 @@
+# apps/backend/tests/test_changes_feed.py
+# Long-poll e SSE del feed /books/changes non devono occupare thread del threadpool.
+import uuid
+
+import anyio
+import httpx
+import pytest
+
+from app import storage
+from app.main import app
+from app.routers import books as books_router
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"            # come uvicorn
+
+
+def _create(title="feed"):
+    bid = f"feed-{uuid.uuid4().hex[:8]}"
+    storage.persist_book({"id": bid, "title": title, "chapters": []})
+    return bid
+
+
+@pytest.mark.anyio
+async def test_long_polls_leave_threadpool_free():
+    anyio.to_thread.current_default_thread_limiter().total_tokens = 4
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+        rev = (await client.get("/api/v1/books/changes")).json()["revision"]
+        results = []
+
+        async def poll():
+            r = await client.get("/api/v1/books/changes", params={"since": rev, "wait": 10})
+            results.append(r.json())
+
+        async with anyio.create_task_group() as tg:
+            for _ in range(20):                     # più attese che thread disponibili
+                tg.start_soon(poll)
+            await anyio.sleep(0.3)
+            with anyio.fail_after(2):
+                assert (await client.get("/api/v1/health")).status_code == 200   # route sync: threadpool
+            assert not results
+            with anyio.fail_after(2):
+                bid = await anyio.to_thread.run_sync(_create)
+        assert len(results) == 20
+        assert all(r["revision"] > rev and bid in [b["id"] for b in r["books"]] for r in results)
+
+
+@pytest.mark.anyio
+async def test_sse_stream_pushes_changes():
+    rev = await anyio.to_thread.run_sync(storage.revision)
+    response = await books_router.books_changes(since=rev, wait=0, stream=True, view="summary")
+    events = response.body_iterator
+    assert await events.__anext__() == b":ok\n\n"
+    with anyio.fail_after(3):
+        async with anyio.create_task_group() as tg:
+            tg.start_soon(anyio.to_thread.run_sync, _create, "sse")
+            chunk = await events.__anext__()
+    assert chunk.startswith(b"event: changes\n") and b'"sse"' in chunk
+    await events.aclose()
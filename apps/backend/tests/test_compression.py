@@ -0,0 +1,47 @@
+# apps/backend/tests/test_compression.py
+import gzip
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app import compression, storage
+from app.main import app
+
+
+def _wait_for(path, timeout=5.0):
+    deadline = time.monotonic() + timeout
+    while not path.exists() and time.monotonic() < deadline:
+        time.sleep(0.02)
+    return path.exists()
+
+
+def test_blob_sidecars_are_created_lazily_on_first_compressed_get():
+    text = f"{uuid.uuid4()} " + "testo del capitolo " * 4000
+    h = storage.put_chapter_body(text)["content_hash"]
+    blob = storage._blob_path(h)
+    sidecar = blob.with_name(blob.name + ".gz")
+    assert not sidecar.exists()                    # nessuna compressione nel percorso di scrittura
+
+    client = TestClient(app)
+    url = f"/static/chapters/blobs/{h[:2]}/{h}.txt"
+    first = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert first.status_code == 200 and first.headers["content-encoding"] == "gzip"
+    assert first.text == text                      # compresso al volo dal middleware
+    assert _wait_for(sidecar)
+    assert gzip.decompress(sidecar.read_bytes()).decode("utf-8") == text
+
+    second = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert second.headers["content-encoding"] == "gzip" and second.text == text
+    assert client.get(url, headers={"Accept-Encoding": "identity"}).text == text
+
+
+def test_small_or_already_encoded_files_are_not_queued(monkeypatch):
+    queued = []
+    monkeypatch.setattr(compression, "precompress_later", queued.append)
+    h = storage.put_chapter_body(f"breve {uuid.uuid4()}")["content_hash"]
+    client = TestClient(app)
+    client.get(f"/static/chapters/blobs/{h[:2]}/{h}.txt", headers={"Accept-Encoding": "gzip"})
+    assert queued == []
+    assert not compression._precompressible("x.txt.gz", 10_000)
+    assert compression._precompressible("x.txt", 10_000)
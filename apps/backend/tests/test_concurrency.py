@@ -0,0 +1,100 @@
+# apps/backend/tests/test_concurrency.py
+# Nessuna modifica persa con più worker (processi) e più thread sugli stessi libri.
+import json
+import os
+import subprocess
+import sys
+import threading
+import uuid
+from pathlib import Path
+
+import pytest
+
+HAMMER = Path(__file__).with_name("storage_hammer.py")
+BOOKS = ["b1", "b2"]
+
+
+def _seed(root: Path, backend: str) -> None:
+    code = (
+        "from app import storage\n"
+        f"for bid in {BOOKS!r}:\n"
+        "    storage.persist_book({'id': bid, 'title': bid, 'counter': 0, 'chapters': []})\n"
+        "storage.close()\n"
+    )
+    subprocess.run([sys.executable, "-c", code], cwd=HAMMER.parents[1], env=_env(root, backend), check=True)
+
+
+def _env(root: Path, backend: str) -> dict:
+    return {**os.environ, "STORAGE_ROOT": str(root), "STORAGE_BACKEND": backend,
+            "STORAGE_WRITE_BEHIND_MS": "0", "STORAGE_BLOB_GC_S": "0"}
+
+
+def _check(root: Path, backend: str, expected: int) -> None:
+    code = (
+        "import json\n"
+        "from app import storage\n"
+        f"print(json.dumps([storage.find_book(bid) for bid in {BOOKS!r}]))\n"
+    )
+    out = subprocess.run([sys.executable, "-c", code], cwd=HAMMER.parents[1], env=_env(root, backend),
+                         check=True, capture_output=True, text=True).stdout
+    books = json.loads(out)
+    counter = sum(b["counter"] for b in books)
+    chapters = sum(len(b["chapters"]) for b in books)
+    assert counter == expected, f"{expected - counter} modifiche perse su {expected}"
+    assert chapters == expected
+    for b in books:
+        ids = [c["id"] for c in b["chapters"]]
+        assert len(ids) == len(set(ids)), "id di capitolo duplicati"
+
+
+@pytest.mark.parametrize("backend", ["shards", "sqlite"])
+def test_workers_hammering_same_books(tmp_path, backend):
+    procs, threads, edits = 4, 4, 40
+    _seed(tmp_path, backend)
+    ps = [
+        subprocess.Popen([sys.executable, str(HAMMER), str(threads), str(edits), *BOOKS], env=_env(tmp_path, backend))
+        for _ in range(procs)
+    ]
+    assert all(p.wait(timeout=300) == 0 for p in ps)
+    _check(tmp_path, backend, procs * threads * edits)
+
+
+def _totals(books):
+    return sum(b["counter"] for b in books), sum(len(b["chapters"]) for b in books)
+
+
+def test_threads_mixed_updates_no_lost_writes():
+    from app import storage
+    from storage_hammer import hammer
+
+    run = uuid.uuid4().hex[:6]
+    ids = [f"th-{run}-{i}" for i in range(6)]
+    for bid in ids:
+        storage.persist_book({"id": bid, "title": bid, "counter": 0, "chapters": []})
+    threads, edits = 16, 50
+    stop = threading.Event()
+
+    def churn():
+        # creazioni/eliminazioni concorrenti: il lock globale (manifest) si intreccia con quelli per libro
+        i = 0
+        while not stop.is_set():
+            tmp = f"th-{run}-tmp{i % 3}"
+            storage.persist_book({"id": tmp, "title": tmp, "chapters": []})
+            storage.delete_book(tmp)
+            i += 1
+
+    workers = [threading.Thread(target=hammer, args=(f"t{t}", edits, ids, t)) for t in range(threads)]
+    churner = threading.Thread(target=churn)
+    churner.start()
+    for t in workers:
+        t.start()
+    for t in workers:
+        t.join()
+    stop.set()
+    churner.join()
+
+    expected = threads * edits
+    assert _totals([storage.find_book(bid) for bid in ids]) == (expected, expected)
+    storage.load_books_from_disk()
+    assert _totals([storage.find_book(bid) for bid in ids]) == (expected, expected)
+    assert not [b for b in storage.load_books() if "-tmp" in str(b.get("id")) and run in str(b.get("id"))]
@@ -0,0 +1,122 @@
+# apps/backend/tests/test_export_cache.py
+import os
+import threading
+import time
+import uuid
+
+from fastapi.testclient import TestClient
+
+from app import export_cache, storage
+from app.main import app
+
+
+def test_concurrent_misses_render_once_and_leave_no_locks():
+    key = export_cache.make_key("test", uuid.uuid4().hex)
+    calls = []
+
+    def render(tmp):
+        calls.append(1)
+        time.sleep(0.05)
+        tmp.write_bytes(b"x" * 100)
+
+    results = []
+    threads = [threading.Thread(target=lambda: results.append(export_cache.get_or_render(key, "bin", render)))
+               for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert len(calls) == 1
+    assert sorted(hit for _, hit in results) == [False] + [True] * 7
+    assert key not in export_cache._KEY_LOCKS
+
+    # i soli hit non creano lock
+    for _ in range(3):
+        export_cache.get_or_render(export_cache.make_key("test", uuid.uuid4().hex), "bin", render)
+    assert not export_cache._KEY_LOCKS
+
+
+def test_cached_download_does_not_read_chapter_texts(monkeypatch):
+    bid = f"exp-{uuid.uuid4().hex[:8]}"
+    chapters = [{"id": f"ch_{i:04d}", "title": f"Capitolo {i}", "content": f"testo {i} " * 50} for i in range(1, 4)]
+    storage.persist_book({"id": bid, "title": "Export", "author": "Autore", "chapters": chapters})
+    client = TestClient(app)
+    url = f"/api/v1/export/books/{bid}/export/pdf"
+    first = client.get(url)
+    assert first.status_code == 200
+
+    reads = []
+    monkeypatch.setattr(storage, "read_chapter_body", lambda h: reads.append(h) or "")
+    again = client.get(url)
+    assert again.status_code == 200 and again.content == first.content
+    assert reads == []
+
+    # un capitolo modificato cambia la chiave (e il rendering rilegge i testi)
+    monkeypatch.undo()
+    with storage.edit_book(bid) as b:
+        b["chapters"][1]["content"] = "testo cambiato " * 50
+    storage.flush([bid])
+    before = export_cache.STATS["misses"]
+    assert client.get(url).status_code == 200
+    assert export_cache.STATS["misses"] == before + 1
+
+
+def _cached_file(age_s, size=1000):
+    """Artefatto come se l'avesse scritto (e usato age_s secondi fa) un qualsiasi worker."""
+    path = export_cache._path(export_cache.make_key("test", uuid.uuid4().hex), "bin")
+    path.parent.mkdir(parents=True, exist_ok=True)
+    path.write_bytes(b"x" * size)
+    t = time.time() - age_s
+    os.utime(path, (t, t))
+    return path
+
+
+def test_eviction_counts_every_worker_and_spares_recent_files(monkeypatch):
+    for f in export_cache.CACHE_DIR.glob("*/*"):
+        f.unlink()
+    monkeypatch.setattr(export_cache, "GRACE_S", 60)
+    monkeypatch.setattr(export_cache, "MAX_BYTES", 3500)
+    oldest, old = _cached_file(3600), _cached_file(1800)     # scritti da altri worker
+    served = _cached_file(5)                                 # appena restituito a una richiesta/job
+
+    key = export_cache.make_key("test", uuid.uuid4().hex)
+    path, hit = export_cache.get_or_render(key, "bin", lambda tmp: tmp.write_bytes(b"y" * 1000))
+    assert not hit
+    # 4000 byte su disco > 3500: si elimina solo il più vecchio fuori dalla finestra di grazia
+    assert not oldest.exists()
+    assert old.exists() and served.exists() and path.exists()
+    assert export_cache.stats()["bytes"] == 3000
+
+    monkeypatch.setattr(export_cache, "MAX_BYTES", 0)
+    export_cache._evict(path)
+    assert not old.exists()
+    assert served.exists() and path.exists()                # mai i file usati di recente
+
+
+def test_rerender_after_one_edit_rewraps_only_that_chapter_on_any_worker(monkeypatch):
+    from app.routers import books_export
+
+    texts = [f"capitolo {i} " + f"parola{i} " * 400 for i in range(6)]
+    wrapped = []
+    real_wrap = books_export._wrap_text
+
+    def counting_wrap(text, canv, max_w, font_name, font_size):
+        if font_size == 11:                      # corpo dei capitoli (i titoli sono a 16)
+            wrapped.append(text)
+        return real_wrap(text, canv, max_w, font_name, font_size)
+
+    monkeypatch.setattr(books_export, "_wrap_text", counting_wrap)
+
+    def render(items):
+        books_export._LAYOUTS.clear()            # come un altro worker del pool: memoria vuota
+        return books_export._render_pdf("Layout", "Autore", [(f"Cap {i}", t) for i, t in enumerate(items)])
+
+    render(texts)
+    assert sorted(wrapped) == sorted(texts)
+    wrapped.clear()
+    render(texts)
+    assert wrapped == []
+
+    texts[3] = "testo nuovo " * 300
+    render(texts)
+    assert wrapped == [texts[3]]
@@ -0,0 +1,92 @@
+# apps/backend/tests/test_export_jobs.py
+import fcntl
+import os
+import time
+import uuid
+
+import pytest
+from fastapi import HTTPException
+
+from app import export_jobs, render_pool
+
+
+def _spec():
+    return {"fn": None, "load_args": lambda: (), "kwargs": {}}
+
+
+def _job():
+    return {"id": uuid.uuid4().hex[:16]}
+
+
+def test_render_retries_only_while_saturated(monkeypatch, tmp_path):
+    calls = []
+
+    def run(*args, **kwargs):
+        calls.append(1)
+        if len(calls) < 3:
+            raise render_pool.Saturated()
+
+    monkeypatch.setattr(render_pool, "run", run)
+    monkeypatch.setattr(render_pool, "RETRY_AFTER_S", 0)
+    export_jobs._render(_job(), _spec(), tmp_path / "out")
+    assert len(calls) == 3
+
+
+def test_render_gives_up_after_max_retries(monkeypatch, tmp_path):
+    calls = []
+
+    def run(*args, **kwargs):
+        calls.append(1)
+        raise render_pool.Saturated()
+
+    monkeypatch.setattr(render_pool, "run", run)
+    monkeypatch.setattr(render_pool, "RETRY_AFTER_S", 0)
+    monkeypatch.setattr(export_jobs, "MAX_RETRIES", 4)
+    with pytest.raises(HTTPException):
+        export_jobs._render(_job(), _spec(), tmp_path / "out")
+    assert len(calls) == 5
+
+
+@pytest.mark.parametrize("error", [render_pool.Interrupted(), HTTPException(status_code=503, detail="altro")])
+def test_render_does_not_retry_other_errors(monkeypatch, tmp_path, error):
+    calls = []
+
+    def run(*args, **kwargs):
+        calls.append(1)
+        raise error
+
+    monkeypatch.setattr(render_pool, "run", run)
+    with pytest.raises(HTTPException):
+        export_jobs._render(_job(), _spec(), tmp_path / "out")
+    assert len(calls) == 1
+
+
+def _write_job(token, **extra):
+    job = {"id": uuid.uuid4().hex[:16], "status": "running", "token": token, "updated_at": time.time(), **extra}
+    export_jobs._write_json(export_jobs._job_path(job["id"]), job)
+    return job["id"]
+
+
+def test_recover_uses_owner_locks_not_pids():
+    export_jobs.JOBS_DIR.mkdir(parents=True, exist_ok=True)
+    export_jobs._claim_token()
+    export_jobs.OWNERS_DIR.mkdir(parents=True, exist_ok=True)
+
+    live, dead = uuid.uuid4().hex, uuid.uuid4().hex
+    fd = os.open(str(export_jobs._owner_path(live)), os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)                              # processo ancora in vita
+    export_jobs._owner_path(dead).touch()                      # processo terminato: lock libero
+    try:
+        jobs = {
+            "mine": _write_job(export_jobs.TOKEN),
+            "live": _write_job(live),
+            "dead": _write_job(dead),
+            "legacy": _write_job(None, pid=os.getpid()),        # PID vivo (riusato), ma senza token
+        }
+        export_jobs._recover()
+        status = {k: export_jobs.get(v)["status"] for k, v in jobs.items()}
+        assert status == {"mine": "running", "live": "running", "dead": "error", "legacy": "error"}
+        assert not export_jobs._owner_path(dead).exists()
+        assert export_jobs._owner_path(live).exists()
+    finally:
+        os.close(fd)
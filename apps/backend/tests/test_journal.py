@@ -0,0 +1,137 @@
+# apps/backend/tests/test_journal.py
+# Recupero dopo un crash: coda del journal troncata, CRC corrotto,
+# crash a metà compattazione (snapshot già sostituito, segmenti ancora lì).
+from pathlib import Path
+
+import pytest
+
+from app.journal import JournalStore, iter_records
+
+
+def _book(bid, title="t", chapters=("ch_0001", "ch_0002")):
+    return {"id": bid, "title": title, "chapters": [{"id": c} for c in chapters]}
+
+
+def _ids(books):
+    return [(b["id"], b["title"]) for b in books]
+
+
+def _reopen(root):
+    store = JournalStore(root)
+    books = store.load()
+    store.close()
+    return books
+
+
+@pytest.fixture()
+def store(tmp_path):
+    s = JournalStore(tmp_path, fsync_ms=5)
+    s.load()
+    yield s
+    s.close()
+
+
+def test_replay_snapshot_and_journal(store, tmp_path):
+    for i in range(6):
+        store.put_book(_book(f"b{i % 3}", f"v{i}"))
+    store.compact()
+    store.put_book(_book("b3", "nuovo"))
+    store.reorder("b1", ["ch_0002"])
+    store.delete_book("b0")
+    store.close()
+
+    books = _reopen(tmp_path)
+    assert _ids(books) == [("b1", "v4"), ("b2", "v5"), ("b3", "nuovo")]
+    assert [c["id"] for c in books[0]["chapters"]] == ["ch_0002", "ch_0001"]
+
+
+def test_torn_tail_is_dropped_and_truncated(store, tmp_path):
+    store.put_book(_book("b1", "uno"))
+    store.put_book(_book("b2", "due"))
+    store.put_book(_book("b3", "x" * 200))
+    store.close()
+
+    log = tmp_path / "journal.log"
+    data = log.read_bytes()
+    last = list(iter_records(log))[-2][1]          # fine del secondo record
+    log.write_bytes(data[:last + 37])              # l'ultimo record resta a metà
+
+    books = _reopen(tmp_path)
+    assert _ids(books) == [("b1", "uno"), ("b2", "due")]
+    assert log.stat().st_size == last              # coda rotta rimossa da load()
+
+    # le append dopo il recupero non si "incollano" ai byte troncati
+    s = JournalStore(tmp_path)
+    s.load()
+    s.put_book(_book("b4", "quattro"))
+    s.close()
+    assert _ids(_reopen(tmp_path)) == [("b1", "uno"), ("b2", "due"), ("b4", "quattro")]
+
+
+def test_torn_length_header(store, tmp_path):
+    store.put_book(_book("b1"))
+    store.close()
+    log = tmp_path / "journal.log"
+    with open(log, "ab") as fh:
+        fh.write(b"12")                            # crash durante la scrittura dell'intestazione
+    assert _ids(_reopen(tmp_path)) == [("b1", "t")]
+
+
+def test_corrupt_crc_stops_replay(store, tmp_path):
+    store.put_book(_book("b1", "uno"))
+    store.put_book(_book("b2", "due"))
+    store.put_book(_book("b3", "tre"))
+    store.close()
+
+    log = tmp_path / "journal.log"
+    data = bytearray(log.read_bytes())
+    first_end = next(iter_records(log))[1]
+    pos = data.index(b"due", first_end)
+    data[pos:pos + 3] = b"DUE"                     # stessa lunghezza, CRC non più valido
+    log.write_bytes(bytes(data))
+
+    books = _reopen(tmp_path)
+    # il record corrotto e tutti i successivi sono scartati: mai applicare mutazioni fuori ordine
+    assert _ids(books) == [("b1", "uno")]
+    assert log.stat().st_size == first_end
+
+
+class _Crash(BaseException):
+    pass
+
+
+def test_crash_between_snapshot_replace_and_segment_unlink(store, tmp_path, monkeypatch):
+    store.put_book(_book("b1", "uno"))
+    store.put_book(_book("b2", "due"))
+    store.compact()
+    store.put_book(_book("b1", "uno-bis"))
+    store.reorder("b2", ["ch_0002"])
+    store.delete_book("b1")
+    store.put_book(_book("b1", "uno-ter"))         # stesso id ricreato: l'ordine conta
+
+    real_unlink = Path.unlink
+
+    def crash_on_segment(self, *args, **kwargs):
+        if self.name.startswith("journal.") and self.name.endswith(".old"):
+            raise _Crash()
+        return real_unlink(self, *args, **kwargs)
+
+    monkeypatch.setattr(Path, "unlink", crash_on_segment)
+    with pytest.raises(_Crash):
+        store.compact()
+    monkeypatch.undo()
+    store.close()
+
+    # lo snapshot contiene già i segmenti, che però vengono riapplicati al riavvio
+    assert list(tmp_path.glob("journal.*.old"))
+    books = _reopen(tmp_path)
+    assert _ids(books) == [("b2", "due"), ("b1", "uno-ter")]
+    assert [c["id"] for c in books[0]["chapters"]] == ["ch_0002", "ch_0001"]
+
+    # la compattazione successiva conclude il lavoro senza cambiare lo stato
+    s = JournalStore(tmp_path)
+    s.load()
+    s.compact()
+    s.close()
+    assert not list(tmp_path.glob("journal.*.old"))
+    assert _reopen(tmp_path) == books
@@ -0,0 +1,126 @@
+# apps/backend/tests/test_preview.py
+# Anteprime live dei capitoli: unificazione delle richieste identiche e
+# richieste superate (409) solo per lo stesso utente e lo stesso capitolo.
+import threading
+import time
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import render_pool, users
+from app.main import app
+from app.routers import books_export
+
+URL = "/api/v1/export/preview/chapter/pdf"
+
+
+@pytest.fixture()
+def rendered(monkeypatch):
+    """Render finta: registra i testi e blocca quelli in `hold` finché non vengono rilasciati."""
+    state = {"texts": [], "hold": {}, "started": threading.Event()}
+
+    def fake_run(fn, book_title, author, items, **kwargs):
+        text = items[0][1]
+        state["texts"].append(text)
+        gate = state["hold"].get(text)
+        if gate is not None:
+            state["started"].set()
+            assert gate.wait(10)
+        return b"%PDF-" + text.encode("utf-8")
+
+    monkeypatch.setattr(render_pool, "run", fake_run)
+    return state
+
+
+@pytest.fixture(scope="module")
+def keys():
+    a, b = f"ka-{uuid.uuid4().hex}", f"kb-{uuid.uuid4().hex}"
+    users.update_users(lambda u: u.update({
+        "prev_a": {"id": "prev_a", "name": "A", "role": "USER", "plan": "START", "status": "ACTIVE", "api_key": a},
+        "prev_b": {"id": "prev_b", "name": "B", "role": "USER", "plan": "START", "status": "ACTIVE", "api_key": b},
+    }))
+    return a, b
+
+
+def _post(results, name, key, text, **ids):
+    body = {"chapter_title": "Capitolo 1", "text": text, **ids}
+    r = TestClient(app).post(URL, json=body, headers={"X-API-Key": key})
+    results[name] = (r.status_code, r.content, r.headers.get("x-cache"))
+
+
+def _start(results, *args, **ids):
+    t = threading.Thread(target=_post, args=(results, *args), kwargs=ids)
+    t.start()
+    return t
+
+
+def _until(cond):
+    deadline = time.monotonic() + 10
+    while not cond():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_identical_requests_share_one_render(rendered, keys):
+    text = f"uguale {uuid.uuid4().hex}"
+    gate = rendered["hold"][text] = threading.Event()
+    results = {}
+    first = _start(results, "a", keys[0], text)
+    assert rendered["started"].wait(10)
+    second = _start(results, "b", keys[1], text)
+    _until(lambda: second.is_alive())
+    time.sleep(0.1)
+    gate.set()
+    first.join(), second.join()
+    assert rendered["texts"] == [text]
+    assert sorted(r[2] for r in results.values()) == ["MISS", "SHARED"]
+
+
+def test_previews_without_ids_never_supersede_each_other(rendered, keys):
+    slow, fast = f"lento {uuid.uuid4().hex}", f"veloce {uuid.uuid4().hex}"
+    gate = rendered["hold"][slow] = threading.Event()
+    results = {}
+    a = _start(results, "a", keys[0], slow)                     # stesso titolo "Capitolo 1", nessun id
+    assert rendered["started"].wait(10)
+    _post(results, "b", keys[1], fast)                          # non attende né scarta la prima
+    assert results["b"][:2] == (200, b"%PDF-" + fast.encode())
+    _post(results, "c", keys[0], fast + " bis")                 # nemmeno dallo stesso utente
+    assert results["c"][0] == 200
+    gate.set()
+    a.join()
+    assert results["a"][:2] == (200, b"%PDF-" + slow.encode())
+
+
+def test_newer_preview_of_the_same_chapter_supersedes_the_waiting_one(rendered, keys):
+    ka, kb = keys
+    ids = {"book_id": "libro-1", "chapter_id": f"ch-{uuid.uuid4().hex[:6]}"}
+    v1, v2, v3 = (f"versione {n} {uuid.uuid4().hex}" for n in (1, 2, 3))
+    gate = rendered["hold"][v1] = threading.Event()
+    slot = ("prev_a", ids["book_id"], ids["chapter_id"])
+    results = {}
+
+    t1 = _start(results, "v1", ka, v1, **ids)
+    assert rendered["started"].wait(10)
+    t2 = _start(results, "v2", ka, v2, **ids)                    # in attesa dietro v1
+    _until(lambda: books_export._PREVIEW_SLOTS.get(slot, {}).get("latest") == 2)
+    # stesso testo di v2 ma da un altro utente senza id: condivide la render di v2
+    t2b = _start(results, "v2-altro-utente", kb, v2)
+    time.sleep(0.1)
+    # stesso capitolo, ma di un altro utente: nessun effetto sullo slot di A
+    tb = _start(results, "b-stesso-capitolo", kb, f"altro {uuid.uuid4().hex}", **ids)
+    tb.join()
+    assert results["b-stesso-capitolo"][0] == 200
+
+    t3 = _start(results, "v3", ka, v3, **ids)                    # supera v2, che non renderizza
+    t2.join()
+    assert results["v2"][0] == 409
+    t2b.join()
+    assert results["v2-altro-utente"][:2] == (200, b"%PDF-" + v2.encode())
+
+    gate.set()
+    t1.join(), t3.join()
+    assert results["v1"][0] == 200
+    assert results["v3"][:2] == (200, b"%PDF-" + v3.encode())
+    assert rendered["texts"].count(v2) == 1                     # solo per l'altro utente
+    assert slot not in books_export._PREVIEW_SLOTS
@@ -0,0 +1,155 @@
+# apps/backend/tests/test_search.py
+import pickle
+import threading
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import search, storage
+from app.main import app
+
+
+@pytest.mark.parametrize("word", ["più", "piu", "PIÙ", "perché", "perche", "è", "E", "Dell"])
+def test_accented_and_folded_stop_words_are_dropped(word):
+    assert search.normalize(word) is None
+
+
+def test_tokenize_folds_before_stop_words():
+    assert search.tokenize("Il libro è più bello, perché dell'anima") == ["libr", "bell", "anim"]
+    assert search.tokenize("città Città citta") == ["citt"] * 3
+
+
+# ---------- indice sulla libreria ----------
+def _word() -> str:
+    """Parola inventata, presente solo nei libri del test (la libreria è condivisa tra i test)."""
+    return "zq" + "".join(chr(ord("a") + int(c, 16) % 26) for c in uuid.uuid4().hex[:10])
+
+
+def _book(chapters, **meta):
+    bid = f"s-{uuid.uuid4().hex[:8]}"
+    storage.persist_book({
+        "id": bid, "title": meta.pop("title", "Libro"), **meta,
+        "chapters": [{"id": f"ch_{i:04d}", "title": t, "content": c} for i, (t, c) in enumerate(chapters, 1)],
+    })
+    return bid
+
+
+def _query(client, q, **params):
+    r = client.get("/api/v1/search", params={"q": q, **params})
+    assert r.status_code == 200
+    return r.json()
+
+
+@pytest.fixture()
+def client():
+    return TestClient(app)
+
+
+def test_edit_and_delete_update_the_index(client):
+    w1, w2 = _word(), _word()
+    bid = _book([("Uno", f"testo con {w1} dentro"), ("Due", "altro testo")])
+    hits = _query(client, w1)["items"]
+    assert [(h["book_id"], h["chapter_id"]) for h in hits] == [(bid, "ch_0001")]
+
+    with storage.edit_book(bid) as b:
+        b["chapters"][0]["content"] = f"ora c'è {w2}"
+    storage.flush([bid])
+    assert _query(client, w1)["items"] == []
+    assert [h["chapter_id"] for h in _query(client, w2)["items"]] == ["ch_0001"]
+
+    storage.delete_book(bid)
+    assert _query(client, w2)["items"] == []
+
+
+def test_title_weighs_more_than_body(client):
+    w = _word()
+    bid = _book([
+        ("Capitolo lungo", f"{w} compare una volta nel testo, " + "parola " * 30),
+        (f"Il {w}", "un testo qualsiasi " * 10),
+    ])
+    hits = _query(client, w, book_id=bid)["items"]
+    assert [h["chapter_id"] for h in hits] == ["ch_0002", "ch_0001"]
+    assert hits[0]["score"] > hits[1]["score"] > 0
+
+
+def test_snippet_highlights_point_at_the_matched_words(client):
+    w = _word()
+    text = "inizio " * 60 + f"qui {w.upper()} e poi {w}, fine " + "coda " * 60
+    bid = _book([("Capitolo", text)])
+    (hit,) = _query(client, w, book_id=bid)["items"]
+    snippet = hit["snippet"]
+    assert snippet.startswith("…") and snippet.endswith("…")
+    assert [snippet[s:e] for s, e in hit["highlights"]] == [w.upper(), w]
+
+
+def _restart_index():
+    """Come un nuovo processo: indice vuoto, ricaricato da disco al primo uso."""
+    with search._LOCK:
+        search._POSTINGS, search._DOCS, search._NORM, search._BOOK_DOCS = {}, {}, {}, {}
+        search._TOTAL_LEN, search._NORM_AVG, search._READY = 0, 0.0, False
+        with search._PENDING_LOCK:
+            search._PENDING.clear()
+
+
+def test_save_reload_and_reconcile(client, monkeypatch):
+    w1, w2, w3 = _word(), _word(), _word()
+    bid = _book([("Uno", f"{w1}"), ("Due", f"{w2}")])
+    _query(client, w1)
+    search.save()
+    saved = pickle.loads(search.INDEX_PATH.read_bytes())
+    assert search._doc_id(bid, "ch_0001") in saved["docs"]
+
+    # modifiche fatte mentre l'indice "non c'era" (nessuna notifica): firme diverse al riavvio
+    monkeypatch.setattr(search, "_on_change", lambda *a: None)
+    with storage.edit_book(bid) as b:
+        b["chapters"][1]["content"] = w3
+    storage.flush([bid])
+    _restart_index()
+    built = []
+    real_add = search._add_doc
+    monkeypatch.setattr(search, "_add_doc", lambda doc, *a: built.append(doc) or real_add(doc, *a))
+
+    assert [h["chapter_id"] for h in _query(client, w1)["items"]] == ["ch_0001"]
+    assert _query(client, w2)["items"] == []
+    assert [h["chapter_id"] for h in _query(client, w3)["items"]] == ["ch_0002"]
+    assert built == [search._doc_id(bid, "ch_0002")]        # solo il capitolo cambiato
+
+
+def test_save_pickles_outside_the_lock(client, monkeypatch):
+    w1, w2 = _word(), _word()
+    bid = _book([("Uno", w1)])
+    _query(client, w1)
+    search._DIRTY = True
+    started, release = threading.Event(), threading.Event()
+    real_dump = pickle.dump
+
+    def slow_dump(*args, **kwargs):
+        started.set()
+        assert release.wait(10)
+        real_dump(*args, **kwargs)
+
+    monkeypatch.setattr(search.pickle, "dump", slow_dump)
+    saver = threading.Thread(target=search.save)
+    saver.start()
+    try:
+        assert started.wait(10)
+        # durante il pickle le ricerche e gli aggiornamenti non attendono
+        with storage.edit_book(bid) as b:
+            b["chapters"][0]["content"] = w2
+        storage.flush([bid])
+        result = []
+        query = threading.Thread(target=lambda: result.append(_query(client, w2)["items"]))
+        query.start()
+        query.join(5)
+        assert not query.is_alive(), "la ricerca attende il salvataggio"
+        assert [h["chapter_id"] for h in result[0]] == ["ch_0001"]
+    finally:
+        release.set()
+        saver.join()
+    # su disco la fotografia presa all'inizio, coerente (copy-on-write delle postings)
+    saved = pickle.loads(search.INDEX_PATH.read_bytes())
+    doc = search._doc_id(bid, "ch_0001")
+    assert doc in saved["postings"][search.normalize(w1)]
+    assert search.normalize(w2) not in saved["postings"]
+    assert search._DIRTY
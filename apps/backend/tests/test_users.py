@@ -0,0 +1,58 @@
+# apps/backend/tests/test_users.py
+# users.json con più worker: ogni modifica rilegge il file sotto lock, nessun utente perso.
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+from fastapi import HTTPException
+
+from app import users
+
+from conftest import BACKEND_DIR
+
+
+def _write_file(data):
+    users._USERS_PATH.parent.mkdir(parents=True, exist_ok=True)
+    users._USERS_PATH.write_text(json.dumps(data), encoding="utf-8")
+
+
+def test_update_rereads_changes_of_other_workers():
+    _write_file({"a": {"id": "a", "api_key": "ka"}})
+    users.load_users()
+    _write_file({"a": {"id": "a", "api_key": "ka"}, "b": {"id": "b", "api_key": "kb"}})   # altro worker
+
+    users.update_users(lambda u: u.__setitem__("c", {"id": "c", "api_key": "kc"}))
+    on_disk = json.loads(users._USERS_PATH.read_text(encoding="utf-8"))
+    assert sorted(on_disk) == ["a", "b", "c"]
+    assert users.get_user_by_api_key("kb")["id"] == "b"
+
+
+def test_failed_mutation_writes_nothing():
+    _write_file({"a": {"id": "a", "api_key": "ka"}})
+    before = users._USERS_PATH.read_bytes()
+
+    def boom(u):
+        u["x"] = {"id": "x"}
+        raise HTTPException(status_code=409, detail="no")
+
+    with pytest.raises(HTTPException):
+        users.update_users(boom)
+    assert users._USERS_PATH.read_bytes() == before
+
+
+def test_no_lost_users_across_processes(tmp_path):
+    code = (
+        "import sys\n"
+        "from app import users\n"
+        "tag = sys.argv[1]\n"
+        "users.load_users()\n"
+        "for i in range(25):\n"
+        "    users.update_users(lambda u, i=i: u.__setitem__(f'{tag}-{i}', {'id': f'{tag}-{i}'}))\n"
+    )
+    env = {**os.environ, "STORAGE_ROOT": str(tmp_path)}
+    procs = [subprocess.Popen([sys.executable, "-c", code, f"w{n}"], cwd=BACKEND_DIR, env=env) for n in range(4)]
+    assert all(p.wait(timeout=120) == 0 for p in procs)
+    data = json.loads((tmp_path / "admin" / "users.json").read_text(encoding="utf-8"))
+    assert len(data) == 100
@@ -0,0 +1,100 @@
+# apps/backend/tests/test_wrap.py
+# Il motore di wrapping lineare deve produrre esattamente le righe dell'implementazione
+# quadratica precedente (riportata qui come riferimento), spazi e tab ai bordi compresi.
+import random
+from io import BytesIO
+
+import pytest
+from PIL import Image, ImageDraw
+from reportlab.pdfgen import canvas
+
+from app.routers import books_export
+
+VOCAB = (
+    "l'amore è più forte della morte, disse lei; poi tacque. Nel mezzo del cammin di nostra vita "
+    "mi ritrovai per una selva oscura — WAVE VAT «citazione» 12.345,67€ supercalifragilistichespiralidoso "
+    + "x" * 90
+).split(" ")
+ODD = ["", "\tTab", "fine\t", " ", " nbsp", "\t"]
+
+
+def _reference_wrap(text, canv, max_w, font_name, font_size):
+    out = []
+    for raw_line in (text or "").splitlines():
+        line = ""
+        for w in raw_line.split(" "):
+            trial = (line + " " + w).strip()
+            if canv.stringWidth(trial, font_name, font_size) <= max_w:
+                line = trial
+            else:
+                if line:
+                    out.append(line)
+                line = w
+        out.append(line)
+    return out
+
+
+def _reference_wrap_pil(draw, text, font, max_w):
+    lines, cur = [], ""
+    for word in (text or "").split():
+        trial = (cur + " " + word).strip()
+        if draw.textlength(trial, font=font) <= max_w:
+            cur = trial
+        else:
+            if cur:
+                lines.append(cur)
+            cur = word
+    if cur:
+        lines.append(cur)
+    return "\n".join(lines).splitlines()
+
+
+def _text(seed, words=6000, odd=0.2):
+    rnd = random.Random(seed)
+    paras, n = [], 0
+    while n < words:
+        k = rnd.randint(1, 300)
+        n += k
+        ws = [rnd.choice(VOCAB) for _ in range(k)]
+        if rnd.random() < odd:
+            ws.insert(rnd.randint(0, k), rnd.choice(ODD))
+        paras.append(" ".join(ws))
+    return "\n".join(paras)
+
+
+@pytest.fixture(scope="module")
+def canv():
+    books_export._ensure_fonts()
+    return canvas.Canvas(BytesIO())
+
+
+@pytest.mark.parametrize("seed", [1, 2, 3])
+@pytest.mark.parametrize("font_attr,size,max_w", [
+    ("_BODY_FONT", 11, 453.5),
+    ("_BODY_FONT_BOLD", 16, 300.0),
+    ("Helvetica", 11, 120.0),
+])
+def test_wrap_text_matches_reference(canv, seed, font_attr, size, max_w):
+    font = getattr(books_export, font_attr, font_attr)
+    text = _text(seed)
+    books_export._WIDTHS.clear()
+    assert books_export._wrap_text(text, canv, max_w, font, size) == _reference_wrap(text, canv, max_w, font, size)
+    # seconda passata con le larghezze già in cache
+    assert books_export._wrap_text(text, canv, max_w, font, size) == _reference_wrap(text, canv, max_w, font, size)
+
+
+@pytest.mark.parametrize("text", ["", " ", "\t", "parola", "  due  spazi  ", "\tinizio", "fine\t", "x" * 300,
+                                  "a\n\nb", "\n"])
+def test_wrap_edge_cases(canv, text):
+    font = books_export._BODY_FONT
+    assert books_export._wrap_text(text, canv, 100.0, font, 11) == _reference_wrap(text, canv, 100.0, font, 11)
+    assert books_export._wrap_title(text, canv, 100.0, font, 28) == _reference_wrap(text, canv, 100.0, font, 28)
+
+
+def test_wrap_text_pil_matches_reference():
+    draw = ImageDraw.Draw(Image.new("RGB", (10, 10)))
+    font = books_export._load_font(96, bold=True)
+    rnd = random.Random(7)
+    for _ in range(200):
+        title = " ".join(rnd.choice(VOCAB + ODD) for _ in range(rnd.randint(0, 12)))
+        assert books_export._wrap_text_pil(draw, title, font, 1500) == _reference_wrap_pil(draw, title, font, 1500)
@@ -0,0 +1,62 @@
+# apps/backend/tests/test_write_behind.py
+import fcntl
+import os
+import subprocess
+import sys
+import uuid
+
+import pytest
+from fastapi.testclient import TestClient
+
+from app import storage
+from app.main import app
+
+from conftest import BACKEND_DIR
+
+
+def test_flush_invalidates_etag_and_cached_response(monkeypatch):
+    bid = f"wb-{uuid.uuid4().hex[:8]}"
+    storage.persist_book({"id": bid, "title": "wb", "chapters": [{"id": "ch_0001", "content": "prima"}]})
+    monkeypatch.setattr(storage, "WRITE_BEHIND_MS", 60_000)     # il flush lo fa il test
+    try:
+        with storage.edit_book(bid) as b:
+            b["chapters"][0]["content"] = "dopo"
+        client = TestClient(app)
+        r1 = client.get(f"/api/v1/books/{bid}")
+        assert r1.json()["chapters"][0]["content"] == "dopo"   # ancora inline, non salvato
+
+        storage.flush([bid])
+        r2 = client.get(f"/api/v1/books/{bid}")
+        assert r2.headers["etag"] != r1.headers["etag"]
+        ch = r2.json()["chapters"][0]
+        assert "content" not in ch
+        assert storage.read_chapter_body(ch["content_hash"]) == "dopo"
+        assert client.get(f"/api/v1/books/{bid}", headers={"If-None-Match": r1.headers["etag"]}).status_code == 200
+    finally:
+        storage.close()
+
+
+def _load_in_subprocess(root, **env):
+    code = "from app import storage; storage.load_books(); print('avviato')"
+    return subprocess.run(
+        [sys.executable, "-c", code], cwd=BACKEND_DIR, capture_output=True, text=True, timeout=60,
+        env={**os.environ, "STORAGE_ROOT": str(root), **env},
+    )
+
+
+@pytest.mark.parametrize("mode", [{"STORAGE_BACKEND": "journal"}, {"STORAGE_WRITE_BEHIND_MS": "200"}])
+def test_single_worker_modes_refuse_web_concurrency(tmp_path, mode):
+    r = _load_in_subprocess(tmp_path, WEB_CONCURRENCY="2", **mode)
+    assert r.returncode != 0 and "WEB_CONCURRENCY=2" in r.stderr
+    assert _load_in_subprocess(tmp_path, WEB_CONCURRENCY="1", **mode).stdout.strip() == "avviato"
+
+
+def test_single_worker_modes_refuse_a_second_process(tmp_path):
+    fd = os.open(str(tmp_path / ".single-worker.lock"), os.O_RDWR | os.O_CREAT, 0o644)
+    fcntl.flock(fd, fcntl.LOCK_EX)          # come se un altro worker fosse già avviato
+    try:
+        r = _load_in_subprocess(tmp_path, STORAGE_BACKEND="journal")
+        assert r.returncode != 0 and "un altro processo" in r.stderr
+        assert _load_in_subprocess(tmp_path).stdout.strip() == "avviato"     # shards: multi-worker ok
+    finally:
+        os.close(fd)
@@ -224,10 +224,12 @@ const uiState = {
   currentBookTitle: "",
   currentLanguage: "it",
   books: [],
+  booksRevision: null,   // revisione della libreria già sincronizzata (GET /books/changes)
   chapters: [],
   currentChapterId: "",
   autosaveTimer: null,
   lastSavedSnapshot: "",
+  chapterBase: null,   // { bookId, chapterId, text, hash } ultimo testo salvato (per PATCH delta)
   saveSoon: null,
   openMenuEl: null,
 };
@@ -371,19 +373,54 @@ function showMenuForButton(btn, items, onPick){
 }
 
 /* ===== Libreria ===== */
-async function fetchBooks(){
-  const box=$("#library-list"); if(box) box.innerHTML='<div class="muted">Carico libreria…</div>';
-  try{
-    const res=await fetch(`${API_BASE_URL}/books?ts=${Date.now()}`,{cache:"no-store",headers:{Accept:"application/json"}});
+// GET /books è paginato (vista "summary"): seguo next_cursor fino alla fine
+async function fetchAllBooksPaged(){
+  const items=[];
+  let cursor=null;
+  do{
+    const qs=`limit=500`+(cursor?`&cursor=${encodeURIComponent(cursor)}`:"");
+    const res=await fetch(`${API_BASE_URL}/books?${qs}`,{cache:"no-cache",headers:{Accept:"application/json"}});
     if(!res.ok){const t=await res.text().catch(()=> ""); throw new Error(`HTTP ${res.status}${t?`: ${t}`:""}`);}
     const data=await res.json();
-    const items = Array.isArray(data)?data:(data?.items||[]);
+    items.push(...(Array.isArray(data)?data:(data?.items||[])));
+    cursor=Array.isArray(data)?null:(data?.next_cursor||null);
+  }while(cursor);
+  return items;
+}
+
+// Sync incrementale: GET /books/changes?since=<rev> restituisce solo i libri toccati
+// (o uno snapshot completo se la revisione è troppo vecchia)
+async function fetchBooks(){
+  const box=$("#library-list");
+  if(box && !uiState.books.length) box.innerHTML='<div class="muted">Carico libreria…</div>';
+  try{
+    let items;
+    const since = uiState.booksRevision;
+    const res=await fetch(`${API_BASE_URL}/books/changes`+(since!=null?`?since=${since}`:""),{cache:"no-store",headers:{Accept:"application/json"}});
+    if(res.ok){
+      const data=await res.json();
+      if(data.full){
+        items=data.books||[];
+      }else{
+        const deleted=new Set(data.deleted||[]);
+        const changed=new Map((data.books||[]).map(b=>[b.id,b]));
+        items=uiState.books.filter(b=>!deleted.has(b.id)).map(b=>{
+          const nb=changed.get(b.id); changed.delete(b.id); return nb||b;
+        });
+        items.push(...changed.values());   // libri nuovi: in coda, come sul server
+      }
+      uiState.booksRevision=data.revision;
+    }else{
+      items=await fetchAllBooksPaged();
+      uiState.booksRevision=null;
+    }
     uiState.books = items;
     renderLibrary(items);
     return items;
   }catch(e){
     if(box) box.innerHTML=`<div class="error">Errore: ${e.message||e}`;
     uiState.books=[];
+    uiState.booksRevision=null;
     return [];
   }
 }
@@ -617,11 +654,9 @@ function syncEditorButtonState(){
 /* Metadati libro corrente */
 async function loadBookMeta(bookId){
   try{
-    const r=await fetch(`${API_BASE_URL}/books?ts=${Date.now()}`,{cache:"no-store"});
+    const r=await fetch(`${API_BASE_URL}/books/${encodeURIComponent(bookId)}`,{cache:"no-cache"});
     if(!r.ok) return;
-    const arr=(await r.json());
-    const items=Array.isArray(arr)?arr:(arr?.items||[]);
-    const bk=items.find(b=>(b?.id||b?.book_id)===bookId);
+    const bk=await r.json();
     uiState.currentLanguage = String(bk?.language || loadLastLang() || "it").toLowerCase();
     uiState.currentBookTitle = String(bk?.title || "");
   }catch{
@@ -637,11 +672,9 @@ async function refreshChaptersList(bookId){
   const list=$("#chapters-list");
   if(list) list.innerHTML='<div class="muted">Carico capitoli…</div>';
   try{
-    const r=await fetch(`${API_BASE_URL}/books?ts=${Date.now()}`,{cache:"no-store"});
+    const r=await fetch(`${API_BASE_URL}/books/${encodeURIComponent(bookId)}`,{cache:"no-cache"});
     if(!r.ok) throw new Error(`HTTP ${r.status}`);
-    const all=await r.json();
-    const arr=Array.isArray(all)?all:(all?.items||[]);
-    const found=arr.find(x=>(x?.id||x?.book_id)===bookId);
+    const found=await r.json();
     uiState.currentBookTitle = String(found?.title || uiState.currentBookTitle || "");
     const chapters=found?.chapters||[];
     uiState.chapters=chapters.map(c=>({
@@ -967,8 +1000,8 @@ function stepChapter(delta){
 async function openChapter(bookId, chapterId){
   try{
     const r = await fetch(
-      `${API_BASE_URL}/books/${encodeURIComponent(bookId)}/chapters/${encodeURIComponent(chapterId)}?ts=${Date.now()}`,
-      { cache: "no-store" }
+      `${API_BASE_URL}/books/${encodeURIComponent(bookId)}/chapters/${encodeURIComponent(chapterId)}`,
+      { cache: "no-cache" }
     );
     if (!r.ok) throw new Error(`HTTP ${r.status}`);
     const data = await r.json();
@@ -985,6 +1018,9 @@ async function openChapter(bookId, chapterId){
     uiState.currentBookId     = bookId;
     uiState.currentChapterId  = chapterId;
     uiState.lastSavedSnapshot = getEditorSnapshot();
+    uiState.chapterBase = data?.content_hash
+      ? { bookId, chapterId, text: data?.content || "", hash: data.content_hash }
+      : null;
 
     // 🔄 reset debounce autosave (evita autosave fantasma subito dopo l’apertura)
     if (uiState.saveSoon) {
@@ -1024,6 +1060,36 @@ function editChapter(cid){
 }
 
 /* ===== Save capitolo ===== */
+// Singolo splice (prefisso/suffisso comuni), offset in code point come lato server
+function computeTextSplice(oldText, newText){
+  const a = Array.from(oldText), b = Array.from(newText);
+  const n = Math.min(a.length, b.length);
+  let p = 0;
+  while (p < n && a[p] === b[p]) p++;
+  let s = 0;
+  while (s < n - p && a[a.length - 1 - s] === b[b.length - 1 - s]) s++;
+  return { pos: p, delete: a.length - p - s, insert: b.slice(p, b.length - s).join("") };
+}
+
+// PATCH delta sul testo salvato; false se serve il PUT completo (base assente o non aggiornata)
+async function patchChapter(bookId, chapterId, content, title){
+  const base = uiState.chapterBase;
+  if (!base || base.bookId !== bookId || base.chapterId !== chapterId) return false;
+  const edits = content === base.text ? [] : [computeTextSplice(base.text, content)];
+  const r = await fetch(`${API_BASE_URL}/books/${encodeURIComponent(bookId)}/chapters/${encodeURIComponent(chapterId)}`,{
+    method:"PATCH",
+    headers:{ "Content-Type":"application/json" },
+    body: JSON.stringify({ base: base.hash, edits, title })
+  });
+  if (!r.ok) {
+    console.warn("PATCH capitolo non applicato, uso PUT:", r.status);
+    return false;
+  }
+  const res = await r.json().catch(()=> ({}));
+  uiState.chapterBase = res?.content_hash ? { bookId, chapterId, text: content, hash: res.content_hash } : null;
+  return true;
+}
+
 // Snapshot editor = content + title (stringa serializzata)
 function getEditorSnapshot(){
   const content = $("#chapterText")?.value ?? "";
@@ -1054,22 +1120,28 @@ async function saveCurrentChapter(showToast=true){
       uiState.currentChapterId   = ch.id;
 
       uiState.lastSavedSnapshot  = getEditorSnapshot();
+      uiState.chapterBase = ch.content_hash ? { bookId, chapterId: ch.id, text: content, hash: ch.content_hash } : null;
       if (showToast) toast("✅ Capitolo creato.");
       await refreshChaptersList(bookId);
       await fetchBooks();
       return; // niente PUT: abbiamo già salvato contenuto+titolo via POST
     }
 
-    // 👇 Se esiste già, aggiorno (PUT)
-    const payload = { content, title };
-    const r = await fetch(`${API_BASE_URL}/books/${encodeURIComponent(bookId)}/chapters/${encodeURIComponent(chapterId)}`,{
-      method:"PUT",
-      headers:{ "Content-Type":"application/json" },
-      body: JSON.stringify(payload)
-    });
-    if(!r.ok){
-      const t=await r.text().catch(()=> "");
-      throw new Error(`HTTP ${r.status}${t?`: ${t}`:""}`);
+    // 👇 Se esiste già: prima il delta (PATCH), altrimenti testo completo (PUT)
+    if (!(await patchChapter(bookId, chapterId, content, title))) {
+      const payload = { content, title };
+      const r = await fetch(`${API_BASE_URL}/books/${encodeURIComponent(bookId)}/chapters/${encodeURIComponent(chapterId)}`,{
+        method:"PUT",
+        headers:{ "Content-Type":"application/json" },
+        body: JSON.stringify(payload)
+      });
+      if(!r.ok){
+        const t=await r.text().catch(()=> "");
+        throw new Error(`HTTP ${r.status}${t?`: ${t}`:""}`);
+      }
+      const res = await r.json().catch(()=> ({}));
+      const hash = res?.chapter?.content_hash;
+      uiState.chapterBase = hash ? { bookId, chapterId, text: content, hash } : null;
     }
 
     uiState.lastSavedSnapshot = getEditorSnapshot();
@@ -1141,8 +1213,8 @@ async function downloadChapter(bookId, chapterId, anchorBtn, {debug=false} = {})
   // 1️⃣ Verifica che il capitolo esista davvero sul backend
   try {
     const chk = await fetch(
-      `${API_BASE_URL}/books/${encodeURIComponent(bid)}/chapters/${encodeURIComponent(cid)}?ts=${Date.now()}`,
-      { cache: "no-store" }
+      `${API_BASE_URL}/books/${encodeURIComponent(bid)}/chapters/${encodeURIComponent(cid)}`,
+      { cache: "no-cache" }
     );
     if (!chk.ok) {
       const t = await chk.text().catch(() => "");
@@ -1177,13 +1249,15 @@ function exportBook(bookId, anchorBtn){
         const backText   = localStorage.getItem("book_backcover_text") || "";
         const aiFlag     = (localStorage.getItem("ai_cover") === "0") ? "0" : "1"; // default ON
 
-        const url = `${base}/kdp`
-          + `?size=${encodeURIComponent(trimSize)}`
-          + `&cover_mode=${encodeURIComponent(coverMode)}`
-          + (backText ? `&backcover_text=${encodeURIComponent(backText)}` : "")
-          + `&ai_cover=${aiFlag}`;
-
-        await fetchAndDownload(url, `book_${bookId}_kdp.zip`);
+        // export in coda: niente richiesta lunga che scade sul proxy
+        await runExportJob({
+          book_id: bookId,
+          kind: "kdp",
+          size: trimSize,
+          cover_mode: coverMode,
+          backcover_text: backText || null,
+          ai_cover: aiFlag === "1",
+        }, `book_${bookId}_kdp.zip`);
         return;
       }
 
@@ -1205,6 +1279,30 @@ function exportBook(bookId, anchorBtn){
   });
 }
 
+// Export asincrono: POST /export/jobs, polling dello stato, poi download
+async function runExportJob(payload, filename){
+  const res = await fetch(`${API_BASE_URL}/export/jobs`, {
+    method: "POST",
+    headers: { "Content-Type": "application/json" },
+    body: JSON.stringify(payload),
+  });
+  if (!res.ok) throw new Error(`HTTP ${res.status}`);
+  let job = await res.json();
+  let lastShown = -1;
+  while (job.status === "queued" || job.status === "running") {
+    if (job.status === "running" && job.total && job.done !== lastShown) {
+      lastShown = job.done;
+      toast(`Export in corso: ${job.done}/${job.total} capitoli`);
+    }
+    await new Promise((r) => setTimeout(r, 1000));
+    const st = await fetch(`${API_BASE_URL}/export/jobs/${encodeURIComponent(job.id)}`, { cache: "no-cache" });
+    if (!st.ok) throw new Error(`HTTP ${st.status}`);
+    job = await st.json();
+  }
+  if (job.status !== "done") throw new Error(job.error || "export non riuscito");
+  await fetchAndDownload(new URL(job.download_url, API_BASE_URL).href, filename);
+}
+
 // Helpers per download
 function triggerDownload(blob, filename) {
   const url = URL.createObjectURL(blob);
@@ -1225,7 +1323,7 @@ function _looksBinary(ct=""){
 
 async function fetchAndInspect(url, fallbackName="download.bin"){
   const t0 = performance.now();
-  const res = await fetch(url, { cache: "no-store" });
+  const res = await fetch(url, { cache: "no-cache" });
   const ct  = res.headers.get("content-type") || "";
   const cd  = res.headers.get("content-disposition") || "";
   const ok  = res.ok;
@@ -1261,7 +1359,7 @@ async function fetchAndInspect(url, fallbackName="download.bin"){
 
 // === Helper download universale ===
 async function fetchAndDownload(url, fallbackName = "download.bin"){
-  const res = await fetch(url, { cache: "no-store" });
+  const res = await fetch(url, { cache: "no-cache" });
   if (!res.ok) throw new Error(`HTTP ${res.status}`);
   let name = fallbackName;
   const cd = res.headers.get("content-disposition") || "";
@@ -2015,7 +2113,7 @@ if (UX2_ENABLED) {
   btn.addEventListener("click", async function(){
     try{
       // 1) Carico i libri
-      var res = await fetch(API + "/books?ts=" + Date.now(), { cache:"no-store" });
+      var res = await fetch(API + "/books?limit=500", { cache:"no-cache" });
       if (!res.ok) throw new Error("HTTP " + res.status);
       var data = await res.json();
       var books = Array.isArray(data) ? data : (data.items || data.books || []);
@@ -2095,7 +2193,7 @@ if (UX2_ENABLED) {
 
     try {
       const res = await fetch(`${API}/books/${encodeURIComponent(bookId)}`, {
-        cache: "no-store",
+        cache: "no-cache",
       });
       if (!res.ok) throw new Error(`HTTP ${res.status}`);
       const bk = await res.json();
@@ -2125,7 +2223,7 @@ if (UX2_ENABLED) {
       // Fetch contenuto capitolo
       const r = await fetch(
         `${API}/books/${encodeURIComponent(bookId)}/chapters/${encodeURIComponent(ch.id)}`,
-        { cache: "no-store" }
+        { cache: "no-cache" }
       );
       if (!r.ok) throw new Error(`HTTP ${r.status}`);
       const data = await r.json();
@@ -2392,14 +2490,36 @@ if (UX2_ENABLED) {
 
     ux2.state.composing = true; ux2.state.paused = false; ux2.state.bookPct = 0;
 
-    (function loop(i){
+    // crea tutti i capitoli mancanti con un solo batch (un round-trip, un salvataggio)
+    function precreateChapters(){
+      var existing = (window.uiState && Array.isArray(window.uiState.chapters)) ? window.uiState.chapters : [];
+      var missing = todo.filter(function(n){
+        return !existing.some(function(c){ return String(c.title||"").trim()===n.title; });
+      });
+      if (!missing.length) return Promise.resolve();
+      var lang = (window.uiState&&window.uiState.currentLanguage)||"it";
+      var ops = missing.map(function(n){ return { op:"create_chapter", title:n.title, content:"", language:lang }; });
+      return fetch(API_BASE_URL + "/books/" + encodeURIComponent(bookId) + "/batch", {
+        method: "POST",
+        headers: { "Content-Type": "application/json" },
+        body: JSON.stringify({ ops: ops })
+      }).then(function(r){
+        if (!r.ok) throw new Error("HTTP " + r.status);
+        return r.json();
+      }).then(function(res){
+        (res.results || []).forEach(function(x, k){ if (x.chapter) missing[k].chId = x.chapter.id; });
+        if (window.refreshChaptersList) return window.refreshChaptersList(bookId);
+      }).catch(function(e){ console.warn("batch createChapter fail, fallback per capitolo", e); });
+    }
+
+    function loop(i){
       if (i >= todo.length) { ux2.state.composing = false; return; }
       if (ux2.state.paused) { ux2.state.composing = false; return; }
 
       var n = todo[i];
       // trova/crea capitolo
-      var chId = null;
-      if (window.uiState && Array.isArray(window.uiState.chapters)) {
+      var chId = n.chId || null;
+      if (!chId && window.uiState && Array.isArray(window.uiState.chapters)) {
         var found = window.uiState.chapters.find(function(c){ return String(c.title||"").trim()===n.title; });
         chId = found ? found.id : null;
       }
@@ -2436,7 +2556,8 @@ if (UX2_ENABLED) {
       } else {
         afterChapterIdReady();
       }
-    })(0);
+    }
+    precreateChapters().then(function(){ loop(0); });
   });
   ux2.q("#ux2Pause").addEventListener("click", function(){ ux2.state.paused = true; });
   ux2.q("#ux2Resume").addEventListener("click", function(){ ux2.state.paused = false; });